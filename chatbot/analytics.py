@@ -0,0 +1,229 @@
+import os
+import re
+from typing import Dict, List, Optional, Any, Tuple
+import numpy as np
+from decoder import read_time_range
+from logcache import log_cache
+from summary import _seconds, _round, _text
+
+TIME_FIELDS = ("TimeUS", "TimeMS", "timestamp")
+COMPARISONS = {">": np.greater, ">=": np.greater_equal, "<": np.less, "<=": np.less_equal,
+               "==": np.equal, "!=": np.not_equal}
+REDUCERS = {"min": np.min, "max": np.max, "mean": np.mean, "median": np.median, "std": np.std, "sum": np.sum}
+PERCENTILE = re.compile(r"p(\d{1,2}(?:\.\d+)?)$")
+# reduceat-based reducers for window buckets
+WINDOW_REDUCERS = {"min": np.minimum, "max": np.maximum, "sum": np.add}
+OPERATIONS = ("describe", "rows", "aggregate", "window", "crossings")
+MAX_LIMIT = 1000
+
+
+class QueryError(ValueError):
+    """A query that cannot run on this log (unknown message, field or operation)"""
+
+
+def _is_numeric(values: np.ndarray) -> bool:
+    return values.dtype.kind in "iufb"
+
+
+def _value(value) -> Any:
+    if isinstance(value, (bytes, np.bytes_)):
+        return _text(value)
+    if isinstance(value, (np.floating, float)):
+        return _round(value) if np.isfinite(value) else None
+    if isinstance(value, np.generic):
+        return value.item()
+    return value
+
+
+def _ends(fields: Dict[str, np.ndarray]) -> Optional[np.ndarray]:
+    """[first, last] time of a message type in seconds, without converting the whole column"""
+    return _seconds({name: values[[0, -1]] for name, values in fields.items() if name in TIME_FIELDS and len(values)})
+
+
+def _log_start(columns) -> float:
+    starts = [ends[0] for ends in (_ends(fields) for fields in columns.values()) if ends is not None]
+    return float(min(starts)) if starts else 0.0
+
+
+def _describe(columns, t0: float) -> Dict[str, Any]:
+    messages = {}
+    for name, fields in columns.items():
+        ends = _ends(fields)
+        messages[name] = {"count": len(next(iter(fields.values()))) if fields else 0,
+                          "fields": [field for field in fields if field not in TIME_FIELDS],
+                          "start": _round(ends[0] - t0) if ends is not None else None,
+                          "end": _round(ends[1] - t0) if ends is not None else None}
+    return {"messages": messages}
+
+
+def _column(fields: Dict[str, np.ndarray], name: str, message: str) -> np.ndarray:
+    if name not in fields:
+        raise QueryError(f"{message} has no field {name}; fields are {', '.join(fields)}")
+    return np.asarray(fields[name])
+
+
+def _condition(fields, spec: Dict[str, Any], message: str, rows: np.ndarray) -> np.ndarray:
+    compare = COMPARISONS.get(spec.get("op"))
+    if compare is None:
+        raise QueryError(f"Unknown comparison {spec.get('op')}; use one of {', '.join(COMPARISONS)}")
+    values = _column(fields, spec["field"], message)[rows]
+    if not _is_numeric(values):
+        raise QueryError(f"{message}.{spec['field']} is not numeric")
+    return compare(values, spec["value"])
+
+
+def _aggregate(values: np.ndarray, times: Optional[np.ndarray], aggregation: str) -> Any:
+    if aggregation == "count":
+        return int(len(values))
+    if len(values) == 0:
+        return None
+    if aggregation == "first":
+        return _value(values[0])
+    if aggregation == "last":
+        return _value(values[-1])
+    if not _is_numeric(values):
+        raise QueryError(f"{aggregation} needs a numeric field")
+    values = values.astype(np.float64)
+    if aggregation in ("min", "max"):
+        i = int(np.argmin(values) if aggregation == "min" else np.argmax(values))
+        result = {"value": _value(values[i])}
+        if times is not None:
+            result["t"] = _round(times[i])
+        return result
+    if aggregation in REDUCERS:
+        return _value(REDUCERS[aggregation](values))
+    percentile = PERCENTILE.match(aggregation)
+    if percentile:
+        return _value(np.percentile(values, float(percentile.group(1))))
+    raise QueryError(f"Unknown aggregation {aggregation}")
+
+
+def _window(values: np.ndarray, starts: np.ndarray, aggregation: str) -> List[Any]:
+    values = values.astype(np.float64)
+    counts = np.diff(np.r_[starts, len(values)])
+    if aggregation == "count":
+        return counts.tolist()
+    if aggregation == "mean":
+        reduced = np.add.reduceat(values, starts) / counts
+    elif aggregation in WINDOW_REDUCERS:
+        reduced = WINDOW_REDUCERS[aggregation].reduceat(values, starts)
+    else:
+        raise QueryError(f"Windows support count, mean, {', '.join(WINDOW_REDUCERS)}")
+    return [_value(v) for v in reduced]
+
+
+def _crossings(condition: np.ndarray, times: np.ndarray, values: np.ndarray, limit: int) -> Dict[str, Any]:
+    changes = np.flatnonzero(condition[1:] != condition[:-1]) + 1
+    events = [{"t": _round(times[i]), "event": "enter" if condition[i] else "exit", "value": _value(values[i])}
+              for i in changes[:limit].tolist()]
+    # Time spent with the condition true, each sample holding until the next one
+    durations = np.diff(times)
+    return {"initially": bool(condition[0]) if len(condition) else None,
+            "crossings": int(len(changes)),
+            "events": events,
+            "truncated": len(changes) > limit,
+            "time_true_s": _round(durations[condition[:-1]].sum()) if len(condition) > 1 else 0.0}
+
+
+def run_query(columns: Dict[str, Dict[str, np.ndarray]], query: Dict[str, Any], t0: Optional[float] = None) -> Dict[str, Any]:
+    """Filter, aggregate, window or search threshold crossings in one message type.
+
+    Times in queries and results are seconds from the start of the log. Rows
+    are first restricted to [start, end] (the columns are time-ordered, so
+    this is a binary search) and to those matching every filter; the
+    operation then runs on what is left. t0 is the start of the log when
+    columns hold only a window of it."""
+    operation = query.get("operation") or "aggregate"
+    if operation not in OPERATIONS:
+        raise QueryError(f"Unknown operation {operation}; use one of {', '.join(OPERATIONS)}")
+    t0 = _log_start(columns) if t0 is None else t0
+    if operation == "describe":
+        return _describe(columns, t0)
+
+    message = query.get("message")
+    if message not in columns:
+        raise QueryError(f"No {message} messages in this log; available: {', '.join(sorted(columns))}")
+    fields = columns[message]
+    times = _seconds(fields)
+    times = times - t0 if times is not None else None
+    count = len(next(iter(fields.values()))) if fields else 0
+    limit = min(int(query.get("limit") or 100), MAX_LIMIT)
+
+    lo, hi = 0, count
+    if times is not None:
+        if query.get("start") is not None:
+            lo = int(np.searchsorted(times, query["start"], side="left"))
+        if query.get("end") is not None:
+            hi = int(np.searchsorted(times, query["end"], side="right"))
+    rows = np.arange(lo, max(lo, hi))
+    for spec in query.get("filters") or []:
+        rows = rows[_condition(fields, spec, message, rows)]
+    selected_times = times[rows] if times is not None else None
+
+    names = query.get("fields") or [name for name, values in fields.items()
+                                    if name not in TIME_FIELDS and _is_numeric(np.asarray(values))]
+    selected = {name: _column(fields, name, message)[rows] for name in names}
+    result = {"message": message, "matched": int(len(rows))}
+
+    if operation == "rows":
+        pick = np.arange(len(rows))
+        if len(rows) > limit:
+            # Evenly spaced sample across the matching rows
+            pick = np.unique(np.linspace(0, len(rows) - 1, limit).astype(np.int64))
+        result["columns"] = (["t"] if selected_times is not None else []) + names
+        result["rows"] = [([_round(selected_times[i])] if selected_times is not None else []) +
+                          [_value(selected[name][i]) for name in names] for i in pick.tolist()]
+        result["sampled"] = len(rows) > limit
+
+    elif operation == "aggregate":
+        aggregations = query.get("aggregations") or ["min", "max", "mean"]
+        result["fields"] = {name: {aggregation: _aggregate(values, selected_times, aggregation) for aggregation in aggregations}
+                            for name, values in selected.items()}
+
+    elif operation == "window":
+        window_s = query.get("window_s")
+        if not window_s or window_s <= 0 or selected_times is None:
+            raise QueryError("window needs window_s > 0 and a message with timestamps")
+        aggregation = (query.get("aggregations") or ["mean"])[0]
+        if len(rows) == 0:
+            result.update({"columns": ["t"] + names, "rows": [], "truncated": False})
+            return result
+        buckets = np.floor((selected_times - selected_times[0]) / window_s).astype(np.int64)
+        starts = np.flatnonzero(np.r_[True, buckets[1:] != buckets[:-1]])
+        columns_out = {name: _window(values, starts, aggregation) for name, values in selected.items()
+                       if _is_numeric(values)}
+        window_starts = selected_times[0] + buckets[starts] * window_s
+        result["aggregation"] = aggregation
+        result["columns"] = ["t"] + list(columns_out)
+        result["rows"] = [[_round(t)] + [columns_out[name][i] for name in columns_out]
+                          for i, t in enumerate(window_starts[:limit].tolist())]
+        result["truncated"] = len(starts) > limit
+
+    elif operation == "crossings":
+        threshold = query.get("threshold")
+        if not threshold or selected_times is None:
+            raise QueryError("crossings needs a threshold {field, op, value} and a message with timestamps")
+        condition = _condition(fields, threshold, message, rows)
+        result.update(_crossings(condition, selected_times, _column(fields, threshold["field"], message)[rows], limit))
+
+    return result
+
+
+def window_columns(file_path, messages: Optional[List[str]], start: Optional[float],
+                   end: Optional[float]) -> Tuple[Dict[str, Dict[str, np.ndarray]], float]:
+    """(columns, log start) of a time-bounded request on a log whose columns were evicted
+    from the log cache, decoding only the window through the seek index written at ingest"""
+    if (start is None and end is None) or not file_path or not os.path.exists(file_path):
+        raise QueryError("Decoded data for this log is not available")
+    columns, stats = read_time_range(file_path, messages, start, end)
+    return columns, stats["log_start"]
+
+
+def query_flight(digest: str, query: Dict[str, Any], file_path=None) -> Dict[str, Any]:
+    """run_query on the cached columns of a log, or on the queried window of file_path"""
+    cached = log_cache.load(digest)
+    if cached is None:
+        message = query.get("message")
+        columns, t0 = window_columns(file_path, [message] if message else None, query.get("start"), query.get("end"))
+        return run_query(columns, query, t0)
+    return run_query(cached[0], query)
@@ -1,6 +1,9 @@
 from openai import AsyncOpenAI
 import chainlit as cl
-import requests
+import asyncio
+import json
+import time
+import httpx
 from process import *
 from langchain.prompts import ChatPromptTemplate
 from langchain.prompts.chat import MessagesPlaceholder
@@ -11,15 +14,60 @@ from dotenv import load_dotenv
 from langchain.docstore.document import Document
 import os 
 from chainlit.types import ThreadDict
+from chathistory import ChatHistory
+from metrics import registry, Spans, start_metrics_server
 
 load_dotenv()
 client = AsyncOpenAI()
 cl.instrument_openai()
 
 settings = {"model": "gpt-4o-mini", "temperature": 0.7, "max_tokens": 2000}
+flight_context_tokens = int(os.getenv("FLIGHT_CONTEXT_TOKENS", "1500"))
+# Recent turns are compacted into a summary above this many tokens
+history_tokens = int(os.getenv("HISTORY_TOKENS", "3000"))
+history_keep_turns = int(os.getenv("HISTORY_KEEP_TURNS", "2"))
+history_summary_tokens = 400
+# How long a question waits for the first partial summary of a log that is still decoding
+flight_wait_seconds = float(os.getenv("FLIGHT_WAIT_SECONDS", "20"))
+summary_prompt = ("Condense this conversation about drone flight logs for later turns. Keep file names, numbers "
+                  "with their units and times, conclusions and open questions; drop pleasantries. "
+                  f"Answer in at most {history_summary_tokens} tokens.")
 base_url = os.getenv("API_BASE_URL")
 index_path = "faiss_index"
+# One keep-alive connection pool to the API for all chat sessions of this process
+api_client = httpx.AsyncClient(timeout = httpx.Timeout(60.0, connect = 5.0),
+                               limits = httpx.Limits(max_connections = 50, max_keepalive_connections = 20))
 embedding_model = OpenAIEmbeddings()
+max_tool_rounds = 4
+chat_stage_seconds = registry.histogram("chat_stage_seconds", "Time spent in each stage of answering a chat message", ("stage",))
+# The chat process has no API of its own, so its metrics get a port of their own
+if os.getenv("CHAT_METRICS_PORT"):
+    start_metrics_server(int(os.getenv("CHAT_METRICS_PORT")))
+condition_schema = {"type": "object",
+                    "properties": {"field": {"type": "string"},
+                                   "op": {"type": "string", "enum": [">", ">=", "<", "<=", "==", "!="]},
+                                   "value": {"type": "number"}},
+                    "required": ["field", "op", "value"]}
+flight_tools = [{"type": "function",
+                 "function": {"name": "query_flight_data",
+                              "description": "Compute exact answers from the decoded columns of the loaded flight log. "
+                                             "Times are seconds from the start of the log. Use operation 'describe' to list "
+                                             "message types and fields; 'aggregate' for min/max (with the time they occur), "
+                                             "mean, median, std, sum, count, first, last or percentiles like p95; 'window' for "
+                                             "one aggregation per window_s seconds; 'crossings' for when a threshold condition "
+                                             "starts and stops holding; 'rows' for a sample of matching rows.",
+                              "parameters": {"type": "object",
+                                             "properties": {"operation": {"type": "string", "enum": ["describe", "rows", "aggregate", "window", "crossings"]},
+                                                            "message": {"type": "string", "description": "Message type, e.g. GPS, ATT, BARO"},
+                                                            "fields": {"type": "array", "items": {"type": "string"}},
+                                                            "start": {"type": "number"},
+                                                            "end": {"type": "number"},
+                                                            "filters": {"type": "array", "items": condition_schema},
+                                                            "aggregations": {"type": "array", "items": {"type": "string"}},
+                                                            "window_s": {"type": "number"},
+                                                            "threshold": condition_schema,
+                                                            "limit": {"type": "integer"}},
+                                             "required": ["operation"]}}}]
 
 @cl.password_auth_callback
 def auth_callback(username: str, password: str):
@@ -31,57 +79,175 @@ def auth_callback(username: str, password: str):
 @cl.on_chat_start
 async def start_chat():
     system_msg = "You are a drone flight data analyst. Answer questions accordingly."
-    cl.user_session.set("chat_history", [{"role": "system", "content": system_msg}])
+    cl.user_session.set("chat_history", ChatHistory(system_msg, history_tokens, history_keep_turns))
 
-@cl.on_message
-async def main(message: cl.Message):
-    chat_history = cl.user_session.get("chat_history")
+async def wait_for_summary(file_id: str, user_id: str):
+    """Follow the file's event stream until a (partial) summary arrives or decoding ends"""
+    async with api_client.stream("GET", f"{base_url}/api/files/{file_id}/events", headers = {"user-id": user_id}) as response:
+        event = None
+        async for line in response.aiter_lines():
+            if line.startswith("event: "):
+                event = line[len("event: "):]
+            elif line.startswith("data: ") and event in ("summary", "ready", "failed"):
+                return
+
+async def fetch_flight_context():
+    """Prompt text describing the loaded flight and the flight ({"file_id", "user_id"}), or (None, None)"""
     # Get the right file for the current user. What if another user submits another file later? Will it be used for this user?
-    response = requests.get(url = f"{base_url}/api/files/")
+    response = await api_client.get(f"{base_url}/api/files/")
     files = response.json()
 
-    if files != []: 
-        file_id = files[0]["file_id"]
-        user_id = "fozyurt"
-        response = requests.get(url = f"{base_url}/api/files/{file_id}/status", headers = {"user-id": user_id})
-        flight_status = response.json()             
-        
-        input = f"""
-                 Flight data is loaded:
-                 File: {flight_status.get('filename')}
-                 Content: {flight_status.get('content')}
-                 User's query: {message.content}
-                 """
-        # Put this to API
-        requests.delete(url = f"{base_url}/api/files/{file_id}", headers = {"user-id": user_id}) 
-    else:
-        input = message.content
-        
+    if files == []: 
+        return None, None
+
+    # The newest upload; files left behind by sessions that ended without cleanup are older
+    file_id = max(files, key = lambda file_data: file_data.get("created_at") or 0)["file_id"]
+    user_id = "fozyurt"
+    response = await api_client.get(f"{base_url}/api/files/{file_id}/status", headers = {"user-id": user_id})
+    flight_status = response.json()             
+    if flight_status.get("status") == "processing" and not flight_status.get("summary"):
+        try:
+            await asyncio.wait_for(wait_for_summary(file_id, user_id), flight_wait_seconds)
+        except (asyncio.TimeoutError, httpx.HTTPError):
+            pass
+        response = await api_client.get(f"{base_url}/api/files/{file_id}/status", headers = {"user-id": user_id})
+        flight_status = response.json()
+
+    decoding = ""
+    if flight_status.get("status") == "processing":
+        fraction = (flight_status.get("progress") or {}).get("fraction", 0.0)
+        decoding = f"Decoding in progress ({fraction:.0%} of the log so far); the summary covers only that part.\n"
+    context = f"""
+             Flight data is loaded:
+             File: {flight_status.get('filename')}
+             {decoding}Summary: {build_flight_context(flight_status.get('summary'), flight_context_tokens)}
+             Use the query_flight_data tool for exact values rather than estimating them from the summary.
+             """
+    return context, {"file_id": file_id, "user_id": user_id}
+
+async def call_flight_tool(flight, tool_call) -> str:
+    """Run a query_flight_data call against the API and return its JSON result (or error) as text"""
+    try:
+        arguments = json.loads(tool_call["arguments"] or "{}")
+    except json.JSONDecodeError as e:
+        return json.dumps({"detail": f"Invalid arguments: {str(e)}"})
+    response = await api_client.post(f"{base_url}/api/files/{flight['file_id']}/query",
+                                     json = arguments, headers = {"user-id": flight["user_id"]})
+    return response.text
+
+async def summarize_turns(summary: str, turns) -> str:
+    """New running summary of the conversation from the old one and the turns being compacted"""
+    transcript = "\n".join(f"{turn['role']}: {turn['content']}" for turn in turns)
+    response = await client.chat.completions.create(model = settings["model"],
+                                                    temperature = 0,
+                                                    max_tokens = history_summary_tokens,
+                                                    messages = [{"role": "system", "content": summary_prompt},
+                                                                {"role": "user", "content": f"Summary so far:\n{summary}\n\nNew turns:\n{transcript}"}])
+    return response.choices[0].message.content.strip()
+
+async def in_span(spans: Spans, name: str, awaitable):
+    with spans.span(name):
+        return await awaitable
+
+async def stream_completion(openai_messages, msg: cl.Message, tools = None, spans: Spans = None):
+    """Stream the reply into msg; return the tool calls the model made instead, if any, and the token usage"""
+    started = time.perf_counter()
+    first_token = True
+    stream = await client.chat.completions.create(messages = openai_messages,
+                                                  stream = True,
+                                                  stream_options = {"include_usage": True},
+                                                  # user = 'fozyurt',
+                                                  **({"tools": tools} if tools else {}),
+                                                  **settings)
+    tool_calls = {}
+    usage = None
+    async for part in stream:
+        # The usage arrives in a last chunk without choices
+        usage = part.usage or usage
+        if not part.choices:
+            continue
+        if first_token and spans is not None:
+            first_token = False
+            spans.record("llm_first_token", time.perf_counter() - started)
+        delta = part.choices[0].delta
+        if token := delta.content or "":
+            await msg.stream_token(token)
+        for call in delta.tool_calls or []:
+            entry = tool_calls.setdefault(call.index, {"id": "", "name": "", "arguments": ""})
+            entry["id"] = call.id or entry["id"]
+            if call.function:
+                entry["name"] += call.function.name or ""
+                entry["arguments"] += call.function.arguments or ""
+    return [tool_calls[i] for i in sorted(tool_calls)], usage
+
+@cl.on_message
+async def main(message: cl.Message):
+    chat_history = cl.user_session.get("chat_history")
+    spans = Spans(chat_stage_seconds)
+    started = time.perf_counter()
     vectorstore_body = {"content": message.content, "index_path": index_path}     
-    status = requests.post(f"{base_url}/api/vectorstore/update", json = vectorstore_body).json().get("status", "")
-    retrieved_context = requests.post(f"{base_url}/api/vectorstore/query", json = vectorstore_body).json().get("context", "")
+    # The flight lookup, vectorstore update and query are independent, so the
+    # wait is the slowest of them rather than their sum
+    (flight_context, flight), update_response, query_response = await asyncio.gather(
+        in_span(spans, "flight_context", fetch_flight_context()),
+        in_span(spans, "vectorstore_update", api_client.post(f"{base_url}/api/vectorstore/update", json = vectorstore_body)),
+        in_span(spans, "vectorstore_query", api_client.post(f"{base_url}/api/vectorstore/query", json = vectorstore_body)))
+    status = update_response.json().get("status", "")
+    retrieved_context = query_response.json().get("context", "")
     
+    if flight:
+        # Sent once per file as part of the stable prefix, not with every question
+        chat_history.pin(flight["file_id"], flight_context)
+    input = message.content
     if retrieved_context:
         input += f"\nRetrieved context: {retrieved_context}"
         
     prompt_template = ChatPromptTemplate.from_messages([MessagesPlaceholder(variable_name="chat_history"), ("user", "{input}")])  
-    prompts = prompt_template.format_messages(chat_history = chat_history, input = input)
-    chat_history.append({"role": "user", "content": input})
+    prompts = prompt_template.format_messages(chat_history = chat_history.messages(), input = input)
     
     openai_messages = [{"role": convert_role(prompt.type), "content": prompt.content} for prompt in prompts]    
-    stream = await client.chat.completions.create(messages = openai_messages,
-                                                  stream = True,
-                                                  # user = 'fozyurt',
-                                                  **settings)
     msg = cl.Message(content = "")
-    async for part in stream:
-        if token := part.choices[0].delta.content or "":
-            await msg.stream_token(token)
+    for tool_round in range(max_tool_rounds + 1):
+        # The last round gets no tools, so the model has to answer
+        tools = flight_tools if flight and tool_round < max_tool_rounds else None
+        with spans.span("llm"):
+            tool_calls, usage = await stream_completion(openai_messages, msg, tools, spans)
+        if usage:
+            details = getattr(usage, "prompt_tokens_details", None)
+            chat_history.record_usage(usage.prompt_tokens, getattr(details, "cached_tokens", 0) or 0)
+        if not tool_calls:
+            break
+        openai_messages.append({"role": "assistant",
+                                "content": None,
+                                "tool_calls": [{"id": call["id"], "type": "function",
+                                                "function": {"name": call["name"], "arguments": call["arguments"]}}
+                                               for call in tool_calls]})
+        with spans.span("flight_tools"):
+            results = await asyncio.gather(*(call_flight_tool(flight, call) for call in tool_calls))
+        for call, result in zip(tool_calls, results):
+            openai_messages.append({"role": "tool", "tool_call_id": call["id"], "content": result})
     
-    chat_history.append({"role": "assistant", "content": msg.content})
+    # Retrieved context is fetched again for every question, so the stored turn only notes it
+    chat_history.add_turn(message.content, msg.content, "retrieved context omitted" if retrieved_context else "")
+    await msg.update()
+    spans.record("reply", time.perf_counter() - started)
 
+    # After the reply is shown, so summarizing old turns adds no latency
+    with spans.span("compact"):
+        compacted = await chat_history.compact(summarize_turns)
+    if compacted:
+        print(f"Compacted chat history to {chat_history.tokens()} tokens")
+    print(f"Timings: {spans}")
+    stats = chat_history.stats
+    print(f"Prompt tokens {stats['prompt_tokens']} ({stats['cached_tokens']} cached) over {stats['turns']} turns")
     cl.user_session.set("chat_history", chat_history)
-    await msg.update()
+
+    if flight:
+        # Deleted when the session ends, not after the answer: deleting cancels a decode
+        # still in progress, and later questions would lose the file
+        flights = cl.user_session.get("flights") or {}
+        flights[flight["file_id"]] = flight
+        cl.user_session.set("flights", flights)
     
 @cl.on_stop
 def on_stop():
@@ -92,5 +258,10 @@ async def on_chat_resume(thread: ThreadDict):
     print("The user resumed a previous chat session!")
     
 @cl.on_chat_end
-def on_chat_end():
-    print("The user disconnected!")
\ No newline at end of file
+async def on_chat_end():
+    print("The user disconnected!")
+    for flight in (cl.user_session.get("flights") or {}).values():
+        try:
+            await api_client.delete(f"{base_url}/api/files/{flight['file_id']}", headers = {"user-id": flight["user_id"]})
+        except httpx.HTTPError as e:
+            print(f"Error deleting file {flight['file_id']}: {str(e)}")
\ No newline at end of file
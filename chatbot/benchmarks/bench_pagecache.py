@@ -0,0 +1,59 @@
+"""Cold fetch vs. conditional revalidation of the log-message page through PageCache.
+
+    python benchmarks/bench_pagecache.py
+
+Serves the rebuilt page from a local HTTP server that honours ETag and
+If-Modified-Since, then checks that a revalidation is answered with 304 and
+reuses the parsed tables, and that a changed page is downloaded and parsed again.
+"""
+import argparse
+import sys
+import tempfile
+import time
+from pathlib import Path
+
+sys.path.insert(0, str(Path(__file__).resolve().parent.parent))
+
+import process
+from pagecache import PageCache
+from fixtures import logmessages_html, serve_pages
+
+
+def extract(url: str):
+    started = time.perf_counter()
+    parser = process.DynamicTableParser(url)
+    data = parser.extract_all_data()
+    return data, parser.page, time.perf_counter() - started
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--repeat", type=int, default=3)
+    args = parser.parse_args()
+
+    content = logmessages_html().encode("utf-8")
+    with tempfile.TemporaryDirectory() as cache_dir, serve_pages({"/LogMessages.html": content}) as server:
+        process.page_cache = PageCache(cache_dir)
+        url = server.url + "/LogMessages.html"
+
+        cold, page, cold_s = extract(url)
+        assert not page["not_modified"]
+        print(f"cold fetch + extract   {cold_s:.3f} s  tables {len(cold)}")
+
+        best = float("inf")
+        for _ in range(args.repeat):
+            warm, page, warm_s = extract(url)
+            assert page["not_modified"] and warm == cold, "revalidation did not reuse the cached page"
+            best = min(best, warm_s)
+        print(f"304 revalidate + reuse {best:.3f} s  ({server.not_modified} not-modified responses)")
+
+        server.pages["/LogMessages.html"] = content.replace(b"</body>", b"<p>changed</p></body>")
+        server.modified += 1
+        changed, page, changed_s = extract(url)
+        assert not page["not_modified"] and len(changed) == len(cold)
+        print(f"changed page refetch   {changed_s:.3f} s")
+        print(process.page_cache.stats())
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,64 @@
+"""Time DynamicTableParser.extract_all_data with the lxml and html.parser engines.
+
+    python benchmarks/bench_tables.py                       # rebuilt log-message page
+    python benchmarks/bench_tables.py --html LogMessages.html
+
+Both engines must produce the same output on well-formed pages like this one (they can differ
+on malformed markup, see LxmlDocument); the script exits non-zero if they differ.
+"""
+import argparse
+import json
+import sys
+import time
+from pathlib import Path
+
+sys.path.insert(0, str(Path(__file__).resolve().parent.parent))
+
+import process
+from fixtures import logmessages_html
+
+
+def run(content: bytes, use_lxml: bool, repeat: int):
+    saved = process.lxml
+    if not use_lxml:
+        process.lxml = None
+    try:
+        best_parse, best_extract = float("inf"), float("inf")
+        for _ in range(repeat):
+            parser = process.DynamicTableParser("benchmark")
+            started = time.perf_counter()
+            parser.load_html(content)
+            parsed = time.perf_counter()
+            data = parser.extract_all_data()
+            best_parse = min(best_parse, parsed - started)
+            best_extract = min(best_extract, time.perf_counter() - parsed)
+        return data, best_parse, best_extract
+    finally:
+        process.lxml = saved
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--html", help="saved copy of the page (default: rebuild it from output/extracted_data.json)")
+    parser.add_argument("--repeat", type=int, default=3)
+    args = parser.parse_args()
+
+    content = Path(args.html).read_bytes() if args.html else logmessages_html().encode("utf-8")
+    print(f"page: {len(content) / 1024:.0f} KiB")
+
+    results = {}
+    for engine, use_lxml in (("html.parser", False), ("lxml", True)):
+        if use_lxml and process.lxml is None:
+            print("lxml is not installed, skipping")
+            continue
+        data, parse_s, extract_s = run(content, use_lxml, args.repeat)
+        results[engine] = json.dumps(data, default=str, sort_keys=True)
+        print(f"{engine:12s} parse {parse_s:.3f} s  extract {extract_s:.3f} s  total {parse_s + extract_s:.3f} s  tables {len(data)}")
+
+    if len(set(results.values())) > 1:
+        print("engines produced different output")
+        sys.exit(1)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,219 @@
+import hashlib
+import html
+import json
+import math
+import random
+import struct
+import tempfile
+import threading
+import time
+from contextlib import contextmanager
+from email.utils import formatdate
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from pathlib import Path
+from pymavlink.DFReader import FORMAT_TO_STRUCT
+
+OUTPUT_DIR = Path(__file__).resolve().parent.parent / "output"
+LOG_DIR = Path(tempfile.gettempdir()) / "log-talk-bench"
+# Bump when synthetic_dataflash changes, so cached logs are regenerated
+SYNTHETIC_VERSION = 1
+# 400 Hz main loop; each message is written every `every` ticks
+TICK_US = 2500
+FMT_TYPE = 128
+SYNTHETIC_MESSAGES = (
+    # name, type, format, columns, every
+    ("IMU", 129, "QBffffffIIfBBHH", "TimeUS,I,GyrX,GyrY,GyrZ,AccX,AccY,AccZ,EG,EA,T,GH,AH,GHz,AHz", 1),
+    ("ATT", 130, "QccccCCCC", "TimeUS,DesRoll,Roll,DesPitch,Pitch,DesYaw,Yaw,ErrRP,ErrYaw", 4),
+    ("VIBE", 131, "QBfffI", "TimeUS,IMU,VibeX,VibeY,VibeZ,Clip", 40),
+    ("BARO", 132, "QBffcfIffB", "TimeUS,I,Alt,Press,Temp,CRt,SMS,Offset,GndTemp,Health", 40),
+    ("GPS", 133, "QBIHBcLLeffffB", "TimeUS,Status,GMS,GWk,NSats,HDop,Lat,Lng,Alt,Spd,GCrs,VZ,Yaw,U", 80),
+    ("MODE", 134, "QMBB", "TimeUS,Mode,ModeNum,Rsn", 40000),
+    ("MSG", 135, "QZ", "TimeUS,Message", 20000),
+)
+
+
+def _row(cells, row_class: str) -> str:
+    tds = "\n".join(f"<td><p>{cell}</p></td>" if not cell.startswith("<table") else f"<td>{cell}</td>" for cell in cells)
+    return f'<tr class="{row_class}">{tds}\n</tr>'
+
+
+def _table(rows) -> str:
+    width = max(len(row) for row in rows)
+    cols = "\n".join(f'<col style="width: {100 // width}%" />' for _ in range(width))
+    body = "\n".join(_row(row, "row-odd" if i % 2 == 0 else "row-even") for i, row in enumerate(rows))
+    return f'<table class="docutils align-default">\n<colgroup>\n{cols}\n</colgroup>\n<tbody>\n{body}\n</tbody>\n</table>'
+
+
+def logmessages_html(extracted_path=OUTPUT_DIR / "extracted_data.json") -> str:
+    """Rebuild a Sphinx page shaped like the ArduPilot log-message reference.
+
+    Uses the tables previously scraped into output/extracted_data.json: one
+    section per message (h2, description paragraph, field table), with the
+    enum tables that had no heading nested inside the preceding field table,
+    as they are on the real page."""
+    with open(extracted_path, encoding="utf-8") as f:
+        extracted = json.load(f)
+
+    sections = []
+    for name, table in extracted.items():
+        metadata = table["metadata"]
+        context = metadata["full_context"]
+        columns = metadata["columns"]
+        rows = [columns] + [[html.escape(str(row.get(column) if row.get(column) is not None else "")) for column in columns]
+                            for row in table["data"]]
+        rows[0] = [html.escape(column) for column in columns]
+        if not context["preceding_headers"] and sections:
+            # Enum table: nest it in the last cell of the previous field table
+            title, description, outer_rows = sections[-1]
+            outer_rows[-1] = outer_rows[-1][:-1] + [_table(rows)]
+            continue
+        header = context["preceding_headers"][0]["text"].rstrip("¶") if context["preceding_headers"] else name
+        description = (context["nearby_text"] or [context["table_description"] or ""])[0]
+        sections.append((header, description, rows))
+
+    body = []
+    for title, description, rows in sections:
+        anchor = title.lower()
+        body.append(f'<div class="section" id="{anchor}">\n'
+                    f'<h2>{html.escape(title)}<a class="headerlink" href="#{anchor}" title="Permalink to this headline">¶</a></h2>\n'
+                    f'<p>{html.escape(description)}</p>\n'
+                    f'{_table(rows)}\n'
+                    f'</div>')
+    return ('<!DOCTYPE html>\n<html>\n<head>\n<meta charset="utf-8" />\n<title>Onboard Message Log Messages</title>\n</head>\n'
+            '<body>\n<div class="document">\n<div class="section" id="onboard-message-log-messages">\n'
+            '<h1>Onboard Message Log Messages<a class="headerlink" href="#onboard-message-log-messages">¶</a></h1>\n'
+            + "\n".join(body) +
+            '\n</div>\n</div>\n</body>\n</html>\n')
+
+
+def _record(msg_type: int, fmt: str, values) -> bytes:
+    """One DataFlash record, with values in display units scaled the way pymavlink unscales them"""
+    packed = []
+    for c, value in zip(fmt, values):
+        code, scale, kind = FORMAT_TO_STRUCT[c]
+        if kind is str:
+            packed.append(value.encode("ascii"))
+        elif scale:
+            packed.append(int(round(value / scale)))
+        else:
+            packed.append(value)
+    return bytes([0xA3, 0x95, msg_type]) + struct.pack("<" + "".join(FORMAT_TO_STRUCT[c][0] for c in fmt), *packed)
+
+
+def _fmt_record(name: str, msg_type: int, fmt: str, columns: str) -> bytes:
+    length = 3 + struct.calcsize("<" + "".join(FORMAT_TO_STRUCT[c][0] for c in fmt))
+    return _record(FMT_TYPE, "BBnNZ", (msg_type, length, name, fmt, columns))
+
+
+def _values(name: str, tick: int, t: int, r: random.Random):
+    """Plausible readings of a copter circling at 30 m"""
+    s = tick * TICK_US / 1e6
+    if name == "IMU":
+        return (t, 0, r.gauss(0, 0.02), r.gauss(0, 0.02), r.gauss(0, 0.02),
+                r.gauss(0, 0.3), r.gauss(0, 0.3), r.gauss(-9.8, 0.3), 0, 0, 40.0, 1, 1, 400, 400)
+    if name == "ATT":
+        roll, pitch = 5 * math.sin(s / 7), 3 * math.cos(s / 5)
+        return (t, roll, roll + r.gauss(0, 0.2), pitch, pitch + r.gauss(0, 0.2),
+                (s * 6) % 360, (s * 6 + r.gauss(0, 1)) % 360, 0.01, 0.02)
+    if name == "VIBE":
+        return (t, 0, abs(r.gauss(8, 2)), abs(r.gauss(8, 2)), abs(r.gauss(12, 3)), tick // 100000)
+    altitude = 30 * min(1.0, s / 60)
+    if name == "BARO":
+        return (t, 0, altitude + r.gauss(0, 0.1), 101325.0 - 12 * altitude, 25.0, 0.0, t // 1000, 0.0, 25.0, 1)
+    if name == "GPS":
+        return (t, 3, (t // 1000) % 604800000, 2300, 14, 0.7, 47.3977 + 0.0003 * math.sin(s / 30),
+                8.5456 + 0.0004 * math.cos(s / 30), 488.0 + altitude, 4.0 + r.gauss(0, 0.2), (s * 6) % 360, 0.0, 0.0, 1)
+    if name == "MODE":
+        mode = (tick // 40000) % 6
+        return (t, mode, mode, 1)
+    return (t, f"Synthetic event at tick {tick}")
+
+
+def synthetic_dataflash(path, size_bytes: int, seed: int = 0) -> Path:
+    """Write a DataFlash log of about size_bytes with FMT records and IMU, ATT, VIBE,
+    BARO, GPS, MODE and MSG at realistic relative rates; the same seed gives the same bytes"""
+    r = random.Random(seed)
+    path = Path(path)
+    with open(path, "wb") as f:
+        written = 0
+        for name, msg_type, fmt, columns, _ in SYNTHETIC_MESSAGES:
+            written += f.write(_fmt_record(name, msg_type, fmt, columns))
+        tick = 0
+        while written < size_bytes:
+            t = 1_000_000 + tick * TICK_US
+            for name, msg_type, fmt, _, every in SYNTHETIC_MESSAGES:
+                if tick % every == 0:
+                    written += f.write(_record(msg_type, fmt, _values(name, tick, t, r)))
+            tick += 1
+    return path
+
+
+def cached_dataflash(size_mb: float, seed: int = 0) -> Path:
+    """synthetic_dataflash of size_mb MiB, generated once into LOG_DIR"""
+    path = LOG_DIR / f"synthetic-v{SYNTHETIC_VERSION}-{size_mb:g}mb-{seed}.bin"
+    if not path.exists():
+        LOG_DIR.mkdir(parents=True, exist_ok=True)
+        tmp = path.with_suffix(".tmp")
+        synthetic_dataflash(tmp, int(size_mb * 1024 * 1024), seed)
+        tmp.replace(path)
+    return path
+
+
+class _PageHandler(BaseHTTPRequestHandler):
+    """Serves server.pages with ETag/Last-Modified and answers conditional requests with 304"""
+
+    def do_GET(self):
+        content = self.server.pages.get(self.path)
+        if content is None:
+            self.send_error(404)
+            return
+        self.server.requests.append(self.path)
+        if self.server.error:
+            self.send_error(self.server.error)
+            return
+        etag = '"%s"' % hashlib.sha1(content).hexdigest() if self.server.etags else None
+        last_modified = formatdate(self.server.modified, usegmt=True)
+        if (etag and self.headers.get("If-None-Match") == etag) or (
+                self.headers.get("If-None-Match") is None and self.headers.get("If-Modified-Since") == last_modified):
+            self.server.not_modified += 1
+            self.send_response(304)
+            if etag:
+                self.send_header("ETag", etag)
+            self.end_headers()
+            return
+        self.send_response(200)
+        self.send_header("Content-Type", "text/html; charset=utf-8")
+        self.send_header("Content-Length", str(len(content)))
+        if etag:
+            self.send_header("ETag", etag)
+        self.send_header("Last-Modified", last_modified)
+        self.end_headers()
+        self.wfile.write(content)
+
+    def log_message(self, format, *args):
+        pass
+
+
+@contextmanager
+def serve_pages(pages):
+    """Local HTTP server for {path: bytes}; yields the server, whose url is server.url.
+
+    Set server.pages[path] to change a page, server.etags = False to send
+    only Last-Modified, and server.error to a status code to fail every
+    request; server.requests and server.not_modified count what the client
+    asked for."""
+    server = ThreadingHTTPServer(("127.0.0.1", 0), _PageHandler)
+    server.pages = dict(pages)
+    server.requests = []
+    server.not_modified = 0
+    server.etags = True
+    server.error = None
+    server.modified = time.time()
+    server.url = f"http://127.0.0.1:{server.server_address[1]}"
+    thread = threading.Thread(target=server.serve_forever, daemon=True)
+    thread.start()
+    try:
+        yield server
+    finally:
+        server.shutdown()
+        server.server_close()
@@ -0,0 +1,256 @@
+"""Benchmark suite for the ingest, scrape and retrieval hot paths, with baselines.
+
+    python benchmarks/run.py                          # run everything, print throughput
+    python benchmarks/run.py --save                   # ... and record it as the baseline
+    python benchmarks/run.py --check --threshold 0.2  # fail if any metric is >20% below the baseline
+    python benchmarks/run.py --only decode --sizes 1 10
+
+Cases:
+  decode  read_columns, read_data and read_window on synthetic DataFlash logs (1, 10 and 100 MiB,
+          generated once into the temp directory), plus time-window reads via the seek index
+  tables  DynamicTableParser.extract_all_data on the rebuilt log-message page (or --html)
+  faiss   FAISS load_local and similarity_search over the schema documents, with the
+          hashing embeddings so no model or network is needed
+  api     upload, status, flight query, flight data and vectorstore query through FastAPI's TestClient
+
+Every metric is a throughput (higher is better). Baselines are machine specific,
+so record one on the machine that runs the check.
+"""
+import argparse
+import contextlib
+import io
+import json
+import os
+import platform
+import sys
+import tempfile
+import time
+from pathlib import Path
+
+sys.path.insert(0, str(Path(__file__).resolve().parent.parent))
+
+# Keep caches, uploads and indexes out of the working tree; set before the app modules read them
+WORK_DIR = Path(tempfile.mkdtemp(prefix="log-talk-bench-"))
+os.environ.setdefault("LOG_CACHE_DIR", str(WORK_DIR / "cache"))
+os.environ.setdefault("FLIGHT_STORE", "memory")
+os.environ.setdefault("EMBEDDING_CACHE_PATH", str(WORK_DIR / "embedding_cache.db"))
+os.environ.setdefault("SCHEMA_INDEX_PATH", str(WORK_DIR / "schema_index"))
+
+import process
+from decoder import read_columns
+from fixtures import OUTPUT_DIR, cached_dataflash, logmessages_html
+
+BASELINE_PATH = Path(__file__).resolve().parent / "baseline.json"
+CASES = ("decode", "tables", "faiss", "api")
+QUESTIONS = ("What does GPS HDop mean?", "Which message logs vibration levels?",
+             "How is barometric altitude recorded?", "What are the attitude fields?",
+             "Where are the IMU accelerometer readings?", "What does the Clip count in VIBE mean?")
+
+
+def best(fn, repeat: int):
+    """(fastest wall time in seconds, last result) over repeat runs, with the app's prints silenced"""
+    fastest, result = float("inf"), None
+    for _ in range(repeat):
+        with contextlib.redirect_stdout(io.StringIO()):
+            started = time.perf_counter()
+            result = fn()
+            fastest = min(fastest, time.perf_counter() - started)
+    return fastest, result
+
+
+def bench_decode(args):
+    metrics = {}
+    for size in args.sizes:
+        path = cached_dataflash(size)
+        megabytes = path.stat().st_size / 1024 ** 2
+        seconds, (columns, stats) = best(lambda: read_columns(str(path)), args.repeat)
+        metrics[f"decode.read_columns.{size:g}mb.mb_per_s"] = megabytes / seconds
+        metrics[f"decode.read_columns.{size:g}mb.msgs_per_s"] = stats["messages"] / seconds
+
+        seconds, content = best(lambda: process.read_data(str(path), ["GPS"]), args.repeat)
+        if not content:
+            raise RuntimeError(f"read_data failed on {path}")
+        metrics[f"decode.read_data_gps.{size:g}mb.mb_per_s"] = megabytes / seconds
+
+        # The first window read writes the seek index; the timed ones use it
+        times = columns["ATT"]["TimeUS"]
+        start = (times[-1] - times[0]) / 1e6 * 0.4
+        with contextlib.redirect_stdout(io.StringIO()):
+            process.read_window(str(path), ["ATT"], start, start + 10)
+        seconds, _ = best(lambda: process.read_window(str(path), ["ATT"], start, start + 10), args.repeat)
+        metrics[f"decode.read_window.{size:g}mb.reads_per_s"] = 1 / seconds
+    return metrics
+
+
+def bench_tables(args):
+    content = Path(args.html).read_bytes() if args.html else logmessages_html().encode("utf-8")
+
+    def extract():
+        parser = process.DynamicTableParser("benchmark")
+        parser.load_html(content)
+        return parser.extract_all_data()
+
+    seconds, data = best(extract, args.repeat)
+    if not data:
+        raise RuntimeError("extract_all_data found no tables")
+    return {"tables.extract_all_data.pages_per_s": 1 / seconds,
+            "tables.extract_all_data.kib_per_s": len(content) / 1024 / seconds}
+
+
+def schema_docs():
+    from schema import schema_from_tables, schema_documents
+    with open(OUTPUT_DIR / "extracted_data.json", encoding="utf-8") as f:
+        messages, other_tables = schema_from_tables(json.load(f))
+    return schema_documents(messages, other_tables)
+
+
+def bench_faiss(args):
+    from langchain.vectorstores import FAISS
+    from schemaindex import HashingEmbeddings
+
+    embeddings = HashingEmbeddings()
+    docs = schema_docs()
+    index_path = str(WORK_DIR / "faiss_index")
+    FAISS.from_documents(docs, embeddings).save_local(index_path)
+
+    seconds, vectorstore = best(lambda: FAISS.load_local(index_path, embeddings, allow_dangerous_deserialization=True),
+                                args.repeat)
+    metrics = {"faiss.load_local.loads_per_s": 1 / seconds}
+    queries = [f"{QUESTIONS[i % len(QUESTIONS)]} ({i})" for i in range(args.queries)]
+    seconds, _ = best(lambda: [vectorstore.similarity_search(query, k=5) for query in queries], args.repeat)
+    metrics["faiss.similarity_search.queries_per_s"] = len(queries) / seconds
+    return metrics
+
+
+def bench_api(args):
+    # main reads its relative paths (files/, the default FAISS index) from the working directory
+    os.environ.setdefault("OPENAI_API_KEY", "benchmark")
+    os.chdir(WORK_DIR)
+    from fastapi.testclient import TestClient
+    from langchain.vectorstores import FAISS
+    from schemaindex import HashingEmbeddings
+    from vectorcache import VectorstoreCache
+    with contextlib.redirect_stdout(io.StringIO()):
+        import main
+
+    # Queries are embedded locally instead of by the OpenAI model
+    main.vectorstore_cache = VectorstoreCache(HashingEmbeddings())
+    index_path = str(WORK_DIR / "api_faiss_index")
+    FAISS.from_documents(schema_docs(), HashingEmbeddings()).save_local(index_path)
+    log = cached_dataflash(min(args.sizes))
+    headers = {"user-id": "benchmark"}
+    metrics = {}
+
+    with TestClient(main.app) as client:
+        def upload(file_id):
+            with open(log, "rb") as f:
+                response = client.post(f"/api/files/{file_id}", headers=headers,
+                                       files={"file": (log.name, f, "application/octet-stream")})
+            response.raise_for_status()
+            while client.get(f"/api/files/{file_id}/status", headers=headers).json()["status"] == "processing":
+                time.sleep(0.01)
+
+        file_id = "bench-0"
+        upload(file_id)
+        # Each upload gets its own file id; the decoded columns now come from the log cache
+        uploads = iter(range(1, 1_000_000))
+        seconds, _ = best(lambda: upload(f"bench-{next(uploads)}"), args.repeat)
+        metrics["api.upload_cached.uploads_per_s"] = 1 / seconds
+
+        def send(method, path, bodies, **kwargs):
+            for body in bodies:
+                response = client.request(method, path, json=body, **kwargs)
+                response.raise_for_status()
+
+        seconds, _ = best(lambda: send("GET", "/health", [None] * args.queries), args.repeat)
+        metrics["api.health.requests_per_s"] = args.queries / seconds
+        seconds, _ = best(lambda: send("GET", f"/api/files/{file_id}/status", [None] * args.queries, headers=headers),
+                          args.repeat)
+        metrics["api.status.requests_per_s"] = args.queries / seconds
+        flight_queries = [{"operation": "aggregate", "message": "GPS", "fields": ["Alt", "Spd"]},
+                          {"operation": "window", "message": "ATT", "fields": ["Roll"], "window_s": 5},
+                          {"operation": "crossings", "message": "BARO", "threshold": {"field": "Alt", "op": ">", "value": 10}}]
+        bodies = [flight_queries[i % len(flight_queries)] for i in range(args.queries)]
+        seconds, _ = best(lambda: send("POST", f"/api/files/{file_id}/query", bodies, headers=headers), args.repeat)
+        metrics["api.flight_query.requests_per_s"] = args.queries / seconds
+        # Distinct windows, so the encoded pages are not served from the payload cache
+        pages = iter(range(1_000_000))
+        seconds, _ = best(lambda: [send("GET", f"/api/files/{file_id}/data?messages=GPS,ATT&start={next(pages) % 30}", [None],
+                                        headers={**headers, "Accept": "application/msgpack", "Accept-Encoding": "zstd, gzip"})
+                                   for _ in range(args.queries)], args.repeat)
+        metrics["api.flight_data.requests_per_s"] = args.queries / seconds
+
+        # Distinct questions, so every request misses the query cache and searches the indexes
+        rounds = iter(range(1_000_000))
+
+        def vectorstore_queries():
+            r = next(rounds)
+            send("POST", "/api/vectorstore/query",
+                 [{"content": f"{QUESTIONS[i % len(QUESTIONS)]} (round {r}, {i})", "index_path": index_path}
+                  for i in range(args.queries)])
+        seconds, _ = best(vectorstore_queries, args.repeat)
+        metrics["api.vectorstore_query.requests_per_s"] = args.queries / seconds
+    return metrics
+
+
+def compare(metrics, baseline, threshold: float):
+    """Names of the metrics more than threshold below their baseline"""
+    regressions = []
+    for name, value in sorted(metrics.items()):
+        base = baseline.get(name)
+        if base is None or not base:
+            print(f"{name:55s} {value:12.1f}")
+            continue
+        ratio = value / base
+        flag = ""
+        if ratio < 1 - threshold:
+            regressions.append(name)
+            flag = "  REGRESSION"
+        print(f"{name:55s} {value:12.1f}  baseline {base:12.1f}  {ratio:6.1%}{flag}")
+    return regressions
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--only", nargs="+", choices=CASES, default=list(CASES))
+    parser.add_argument("--sizes", nargs="+", type=float, default=[1, 10, 100], help="synthetic log sizes in MiB")
+    parser.add_argument("--html", help="saved copy of the log-message page (default: rebuild it from output/extracted_data.json)")
+    parser.add_argument("--repeat", type=int, default=3)
+    parser.add_argument("--queries", type=int, default=50, help="requests or searches per timed batch")
+    parser.add_argument("--baseline", default=str(BASELINE_PATH))
+    parser.add_argument("--save", action="store_true", help="write the results as the new baseline")
+    parser.add_argument("--check", action="store_true", help="exit non-zero on a regression against the baseline")
+    parser.add_argument("--threshold", type=float, default=0.2, help="allowed drop in throughput (0.2 = 20%%)")
+    args = parser.parse_args()
+
+    metrics = {}
+    for case in args.only:
+        started = time.perf_counter()
+        metrics.update(globals()[f"bench_{case}"](args))
+        print(f"{case} done in {time.perf_counter() - started:.1f} s", file=sys.stderr)
+
+    baseline_path = Path(args.baseline)
+    baseline = {}
+    if baseline_path.exists():
+        with open(baseline_path, encoding="utf-8") as f:
+            baseline = json.load(f)["metrics"]
+    regressions = compare(metrics, baseline, args.threshold)
+
+    if args.save:
+        meta = {"python": platform.python_version(), "platform": platform.platform(), "cpus": os.cpu_count(),
+                "created": time.strftime("%Y-%m-%dT%H:%M:%S"), "repeat": args.repeat, "queries": args.queries}
+        with open(baseline_path, "w", encoding="utf-8") as f:
+            json.dump({"meta": meta, "metrics": {**baseline, **metrics}}, f, indent=2, sort_keys=True)
+        print(f"Saved baseline to {baseline_path}")
+
+    if args.check:
+        if not baseline:
+            print(f"No baseline at {baseline_path}; run with --save first")
+            sys.exit(2)
+        if regressions:
+            print(f"{len(regressions)} metric(s) more than {args.threshold:.0%} below the baseline")
+            sys.exit(1)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,95 @@
+from typing import Awaitable, Callable, Dict, List, Optional, Any, Tuple
+from summary import estimate_tokens
+
+# Tokens a chat message costs beyond its content (role and separators)
+MESSAGE_OVERHEAD = 4
+
+
+def message_tokens(messages: List[Dict[str, Any]]) -> int:
+    return sum(estimate_tokens(message.get("content") or "") + MESSAGE_OVERHEAD for message in messages)
+
+
+class ChatHistory:
+    """Conversation sent with every turn, kept under a token budget.
+
+    Messages are laid out as the system prompt, the pinned attachment (the
+    loaded flight's summary, sent once per file), a summary of compacted
+    turns and then the recent turns verbatim. Only the tail changes from
+    turn to turn, so providers that cache prompt prefixes can reuse the rest.
+    Per-turn attachments such as retrieved context go with the current
+    question only and are stored as a short reference. When the recent turns
+    exceed max_tokens the oldest are folded into the summary until the rest
+    fits in half the budget, so the summary changes once per batch of turns."""
+
+    def __init__(self, system: str, max_tokens: int = 3000, keep_turns: int = 2):
+        self.system = system
+        self.max_tokens = max_tokens
+        self.keep_turns = keep_turns
+        self.pinned: Optional[Tuple[str, str]] = None
+        self.summary = ""
+        self.turns: List[Dict[str, str]] = []
+        self.stats = {"turns": 0, "compactions": 0, "compacted_turns": 0, "prompt_tokens": 0, "cached_tokens": 0}
+
+    def pin(self, key: str, text: str) -> bool:
+        """Attach text (e.g. a flight summary under its file id) to every following turn.
+
+        A new key or text replaces the previous attachment; returns True if it changed."""
+        if self.pinned == (key, text):
+            return False
+        self.pinned = (key, text)
+        return True
+
+    def messages(self) -> List[Dict[str, str]]:
+        """Stable prefix plus recent turns, to be followed by the current question"""
+        messages = [{"role": "system", "content": self.system}]
+        if self.pinned is not None:
+            messages.append({"role": "system", "content": self.pinned[1]})
+        if self.summary:
+            messages.append({"role": "system", "content": f"Summary of the earlier conversation:\n{self.summary}"})
+        return messages + self.turns
+
+    def add_turn(self, question: str, reply: str, reference: str = ""):
+        """Store a finished turn; reference stands in for attachments sent with the question"""
+        self.turns.append({"role": "user", "content": f"{question}\n[{reference}]" if reference else question})
+        self.turns.append({"role": "assistant", "content": reply})
+        self.stats["turns"] += 1
+
+    def record_usage(self, prompt_tokens: int, cached_tokens: int = 0):
+        self.stats["prompt_tokens"] += prompt_tokens
+        self.stats["cached_tokens"] += cached_tokens
+
+    def tokens(self) -> int:
+        return message_tokens(self.messages())
+
+    def _fallback_summary(self, turns: List[Dict[str, str]]) -> str:
+        # Without a summarizer keep the questions, newest last, within a quarter of the budget
+        lines = (self.summary.splitlines() if self.summary else []) + \
+                [f"User asked: {turn['content'].splitlines()[0]}" for turn in turns if turn["role"] == "user"]
+        while len(lines) > 1 and estimate_tokens("\n".join(lines)) > self.max_tokens // 4:
+            lines.pop(0)
+        return "\n".join(lines)
+
+    async def compact(self, summarize: Optional[Callable[[str, List[Dict[str, str]]], Awaitable[str]]] = None) -> bool:
+        """Fold the oldest turns into the summary if the recent turns are over budget.
+
+        summarize(summary, turns) returns the new summary; if it is missing or
+        fails, the summary keeps the questions of the folded turns."""
+        if message_tokens(self.turns) <= self.max_tokens:
+            return False
+        keep = 2 * self.keep_turns
+        cut = 0
+        while cut < len(self.turns) - keep and message_tokens(self.turns[cut:]) > self.max_tokens // 2:
+            cut += 2
+        if cut == 0:
+            return False
+
+        folded = self.turns[:cut]
+        try:
+            self.summary = await summarize(self.summary, folded) if summarize else self._fallback_summary(folded)
+        except Exception as e:
+            print(f"Error summarizing chat history: {str(e)}")
+            self.summary = self._fallback_summary(folded)
+        self.turns = self.turns[cut:]
+        self.stats["compactions"] += 1
+        self.stats["compacted_turns"] += cut // 2
+        return True
@@ -0,0 +1,784 @@
+import gzip
+import importlib
+import lzma
+import mmap
+import json
+import multiprocessing
+import os
+import struct
+import time
+from array import array
+from collections import defaultdict
+from concurrent.futures import ProcessPoolExecutor
+from typing import Dict, List, Optional, Any, Tuple
+import numpy as np
+from pymavlink import mavutil
+from pymavlink.DFReader import FORMAT_TO_STRUCT
+try:
+    import zstandard
+except ImportError:
+    zstandard = None
+
+HEAD1 = 0xA3
+HEAD2 = 0x95
+SYNC = bytes([HEAD1, HEAD2])
+FMT_TYPE = 0x80
+FMT_LENGTH = 89
+
+# DataFlash format characters mapped onto little-endian numpy types.
+# Scale factors come from pymavlink so values match DFMessage.to_dict().
+DTYPES = {"a": ("<i2", (32,)),
+          "b": "i1",
+          "B": "u1",
+          "g": "<f2",
+          "h": "<i2",
+          "H": "<u2",
+          "i": "<i4",
+          "I": "<u4",
+          "f": "<f4",
+          "n": "S4",
+          "N": "S16",
+          "Z": "S64",
+          "c": "<i2",
+          "C": "<u2",
+          "e": "<i4",
+          "E": "<u4",
+          "L": "<i4",
+          "d": "<f8",
+          "M": "u1",
+          "q": "<i8",
+          "Q": "<u8"}
+
+# Upper bound on the temporary index matrix used while gathering records.
+GATHER_BYTES = 1 << 22
+
+MAVLINK_V1 = 0xFE
+MAVLINK_V2 = 0xFD
+# Plausible tlog timestamps (2000-01-01 .. 2100-01-01, microseconds)
+TLOG_MIN_USEC = 946684800 * 10 ** 6
+TLOG_MAX_USEC = 4102444800 * 10 ** 6
+# Consecutive well-formed records required before trusting a shard boundary
+SYNC_CHAIN = 8
+PARALLEL_MIN_BYTES = 16 * 1024 * 1024
+# Width of the time buckets in a seek index
+SEEK_BUCKET_SECONDS = float(os.getenv("SEEK_BUCKET_SECONDS", "1.0"))
+SEEK_INDEX_VERSION = 1
+# Size of the ranges an ingest with progress reporting is decoded in
+INGEST_CHUNK_BYTES = int(os.getenv("INGEST_CHUNK_BYTES", str(8 * 1024 * 1024)))
+COMPRESSED_SUFFIXES = (".gz", ".xz", ".zst")
+# Decompressed bytes decoded per step of a compressed log
+STREAM_CHUNK_BYTES = 4 * 1024 * 1024
+# Refuse archives that expand beyond this (a compressed upload is limited by its own size only)
+MAX_DECOMPRESSED_BYTES = int(os.getenv("MAX_DECOMPRESSED_BYTES", str(2 * 1024 ** 3)))
+# The record length is one byte, so an unfinished record is shorter than this
+MAX_RECORD_LENGTH = 256
+decode_workers = int(os.getenv("DECODE_WORKERS", str(min(8, os.cpu_count() or 1))))
+_process_pool = None
+_process_pool_size = 0
+
+
+def _null_term(raw: bytes) -> str:
+    return raw.split(b"\0", 1)[0].decode("ascii", errors="ignore")
+
+
+def _decode_text(raw: bytes) -> str:
+    try:
+        return raw.decode("utf-8")
+    except UnicodeDecodeError:
+        return raw.decode("ISO-8859-1")
+
+
+def _parse_fmt(buf, ofs: int) -> Optional[Dict[str, Any]]:
+    """Parse a FMT record starting at ofs (header included)"""
+    body = bytes(buf[ofs + 3:ofs + FMT_LENGTH])
+    if len(body) < FMT_LENGTH - 3:
+        return None
+    fmt = {"type": body[0],
+           "length": body[1],
+           "name": _null_term(body[2:6]),
+           "format": _null_term(body[6:22]),
+           "columns": [c for c in _null_term(body[22:86]).split(",") if c]}
+    if fmt["length"] < 3 or any(c not in DTYPES for c in fmt["format"]):
+        return None
+    return fmt
+
+
+def _record_dtype(fmt: Dict[str, Any]) -> np.dtype:
+    """Build a structured dtype describing the body of one record"""
+    names, formats, offsets = [], [], []
+    offset = 0
+    for column, char in zip(fmt["columns"], fmt["format"]):
+        dtype = np.dtype(DTYPES[char])
+        names.append(column)
+        formats.append(dtype)
+        offsets.append(offset)
+        offset += dtype.itemsize
+    return np.dtype({"names": names, "formats": formats, "offsets": offsets,
+                     "itemsize": max(offset, fmt["length"] - 3)})
+
+
+def is_dataflash(file_path) -> bool:
+    with open(file_path, "rb") as f:
+        return f.read(3) == SYNC + bytes([FMT_TYPE])
+
+
+def scan_dataflash(buf, start: int = 0, end: Optional[int] = None,
+                   formats: Optional[Dict[int, Dict[str, Any]]] = None) -> Tuple[Dict[int, Dict[str, Any]], Dict[int, array]]:
+    """Walk record headers between start and end and collect per-type offsets"""
+    data_len = len(buf)
+    end = data_len if end is None else min(end, data_len)
+    formats = dict(formats or {})
+    formats.setdefault(FMT_TYPE, {"type": FMT_TYPE, "length": FMT_LENGTH, "name": "FMT",
+                                  "format": "BBnNZ", "columns": ["Type", "Length", "Name", "Format", "Columns"]})
+    lengths = [0] * 256
+    for mtype, fmt in formats.items():
+        lengths[mtype] = fmt["length"]
+    offsets = defaultdict(lambda: array("q"))
+
+    ofs = start
+    while ofs + 3 <= end:
+        if buf[ofs] != HEAD1 or buf[ofs + 1] != HEAD2:
+            ofs = buf.find(SYNC, ofs + 1, end)
+            if ofs == -1:
+                break
+            continue
+        mtype = buf[ofs + 2]
+        mlen = lengths[mtype]
+        if mlen == 0:
+            ofs += 1
+            continue
+        if ofs + mlen > data_len:
+            break
+        if mtype == FMT_TYPE:
+            fmt = _parse_fmt(buf, ofs)
+            if fmt is None:
+                ofs += 1
+                continue
+            formats[fmt["type"]] = fmt
+            lengths[fmt["type"]] = fmt["length"]
+        offsets[mtype].append(ofs)
+        ofs += mlen
+
+    return formats, dict(offsets)
+
+
+def gather_records(buf, fmt: Dict[str, Any], offsets) -> np.ndarray:
+    """Copy the bodies of the records at offsets into one structured array"""
+    dtype = _record_dtype(fmt)
+    offsets = np.frombuffer(offsets, dtype=np.int64) if isinstance(offsets, array) else np.asarray(offsets, dtype=np.int64)
+    records = np.empty(len(offsets), dtype=dtype)
+    raw = records.view(np.uint8).reshape(len(offsets), dtype.itemsize)
+    data = np.frombuffer(buf, dtype=np.uint8)
+    body = np.arange(3, 3 + dtype.itemsize, dtype=np.int64)
+    step = max(1, GATHER_BYTES // (8 * dtype.itemsize))
+    for i in range(0, len(offsets), step):
+        raw[i:i + step] = data[offsets[i:i + step, None] + body]
+    return records
+
+
+def records_to_columns(fmt: Dict[str, Any], records: np.ndarray) -> Dict[str, np.ndarray]:
+    """Split a structured array into typed, scaled columns"""
+    columns = {}
+    for column, char in zip(fmt["columns"], fmt["format"]):
+        scale = FORMAT_TO_STRUCT[char][1]
+        values = records[column]
+        if scale is not None:
+            # Dividing by 1e2/1e7 is more accurate than multiplying by 1e-2/1e-7
+            values = values / (1 / scale) if 0.0 < scale < 1.0 else values * scale
+        columns[column] = values
+    return columns
+
+
+def _record_seconds(fmt: Dict[str, Any], records: np.ndarray) -> Optional[np.ndarray]:
+    """Timestamps of raw records in seconds, or None for untimed message types"""
+    if "TimeUS" in fmt["columns"]:
+        return records["TimeUS"].astype(np.float64) * 1e-6
+    if "TimeMS" in fmt["columns"]:
+        return records["TimeMS"].astype(np.float64) * 1e-3
+    return None
+
+
+def _seek_entries(fmt: Dict[str, Any], records: np.ndarray, offsets) -> Optional[Tuple[float, Tuple[np.ndarray, np.ndarray, np.ndarray]]]:
+    """(earliest time, (time buckets, first record offset, end of last record)) for one message type"""
+    times = _record_seconds(fmt, records)
+    if times is None or len(times) == 0:
+        return None
+    offsets = np.frombuffer(offsets, dtype=np.int64) if isinstance(offsets, array) else np.asarray(offsets, dtype=np.int64)
+    buckets, inverse = np.unique(np.floor(times / SEEK_BUCKET_SECONDS).astype(np.int64), return_inverse=True)
+    # Min/max rather than first/last: timestamps are not strictly ordered in the file
+    first = np.full(len(buckets), np.iinfo(np.int64).max, dtype=np.int64)
+    last = np.zeros(len(buckets), dtype=np.int64)
+    np.minimum.at(first, inverse, offsets)
+    np.maximum.at(last, inverse, offsets)
+    return float(times.min()), (buckets, first, last + fmt["length"])
+
+
+def _merge_seek_entries(pieces: List[Tuple[np.ndarray, np.ndarray, np.ndarray]]) -> Tuple[np.ndarray, np.ndarray, np.ndarray]:
+    if len(pieces) == 1:
+        return pieces[0]
+    buckets, inverse = np.unique(np.concatenate([p[0] for p in pieces]), return_inverse=True)
+    first = np.full(len(buckets), np.iinfo(np.int64).max, dtype=np.int64)
+    last = np.zeros(len(buckets), dtype=np.int64)
+    np.minimum.at(first, inverse, np.concatenate([p[1] for p in pieces]))
+    np.maximum.at(last, inverse, np.concatenate([p[2] for p in pieces]))
+    return buckets, first, last
+
+
+def _decode_dataflash_range(file_path, start: int, end: Optional[int], formats, msg_types,
+                            seek: bool = False) -> Tuple[Dict[str, Tuple[Dict[str, Any], np.ndarray]], int, Optional[Dict[str, Any]]]:
+    """Scan and gather the records that start inside [start, end).
+
+    With seek, also returns the FMT record offsets and the seek entries of
+    every timed message type in the range (see write_seek_index)."""
+    with open(file_path, "rb") as f:
+        buf = mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ)
+    try:
+        formats, offsets = scan_dataflash(buf, start, end, formats)
+        records = {}
+        index = {"fmt_offsets": np.frombuffer(offsets.get(FMT_TYPE, array("q")), dtype=np.int64).copy(),
+                 "starts": {}, "types": {}} if seek else None
+        for mtype, type_offsets in offsets.items():
+            fmt = formats[mtype]
+            if mtype == FMT_TYPE or (msg_types and fmt["name"] not in msg_types):
+                continue
+            records[fmt["name"]] = (fmt, gather_records(buf, fmt, type_offsets))
+            if seek:
+                entries = _seek_entries(fmt, records[fmt["name"]][1], type_offsets)
+                if entries is not None:
+                    index["starts"][fmt["name"]], index["types"][fmt["name"]] = entries
+        count = sum(len(o) for o in offsets.values())
+        return records, count, index
+    finally:
+        buf.close()
+
+
+def _decode_mavlink_range(file_path, msg_types, start: int = 0, end: Optional[int] = None) -> Tuple[Dict[str, Dict[str, np.ndarray]], int]:
+    """Collect pymavlink messages column-wise, optionally only those starting inside [start, end)"""
+    mlog = mavutil.mavlink_connection(str(file_path))
+    collectors = defaultdict(lambda: defaultdict(list))
+    count = 0
+    ranged = end is not None
+    if ranged:
+        # Shard boundaries are record-aligned, so after each message the
+        # file position is the start of the next record.
+        mlog.f.seek(start)
+    while True:
+        if ranged and mlog.f.tell() >= end:
+            break
+        msg = mlog.recv_match() if ranged else mlog.recv_match(type = msg_types)
+        if msg is None:
+            break
+        msg_type = msg.get_type()
+        if msg_type == "BAD_DATA" or (ranged and msg_types and msg_type not in msg_types):
+            continue
+        count += 1
+        fields = collectors[msg_type]
+        fields["timestamp"].append(getattr(msg, "_timestamp", 0.0))
+        for name in msg.get_fieldnames():
+            fields[name].append(getattr(msg, name))
+
+    return _collected_columns(collectors), count
+
+
+def _collected_columns(collectors) -> Dict[str, Dict[str, np.ndarray]]:
+    columns = {}
+    for msg_type, fields in collectors.items():
+        columns[msg_type] = {}
+        for name, values in fields.items():
+            try:
+                columns[msg_type][name] = np.asarray(values)
+            except ValueError:
+                columns[msg_type][name] = np.asarray(values, dtype=object)
+    return columns
+
+
+def is_compressed(file_path) -> bool:
+    return str(file_path).endswith(COMPRESSED_SUFFIXES)
+
+
+def open_decompressed(raw, file_path):
+    """Stream decompressing the open file raw, by the suffix of file_path"""
+    suffix = os.path.splitext(str(file_path))[1]
+    if suffix == ".gz":
+        return gzip.GzipFile(fileobj=raw)
+    if suffix == ".xz":
+        return lzma.LZMAFile(raw)
+    if suffix == ".zst":
+        if zstandard is None:
+            raise ValueError("zstandard is not installed")
+        return zstandard.ZstdDecompressor().stream_reader(raw)
+    raise ValueError(f"Unknown compression: {suffix}")
+
+
+def _decompressed_chunks(file_path):
+    """(chunk, compressed bytes read, compressed size) over the decompressed content"""
+    total = os.path.getsize(file_path)
+    decompressed = 0
+    with open(file_path, "rb") as raw, open_decompressed(raw, file_path) as stream:
+        while chunk := stream.read(STREAM_CHUNK_BYTES):
+            decompressed += len(chunk)
+            if decompressed > MAX_DECOMPRESSED_BYTES:
+                raise ValueError(f"Log expands beyond {MAX_DECOMPRESSED_BYTES} bytes")
+            yield chunk, min(raw.tell(), total), total
+
+
+def _decode_dataflash_stream(file_path, msg_types, progress=None) -> Tuple[Dict[str, Dict[str, np.ndarray]], int]:
+    """Decode a compressed DataFlash log chunk by chunk, without writing it out"""
+    formats = None
+    parts = defaultdict(list)
+    count = 0
+
+    def columns():
+        return {name: _time_order(records_to_columns(pieces[-1][0], np.concatenate([r for _, r in pieces])))
+                for name, pieces in parts.items()}
+
+    leftover = b""
+    for chunk, done, total in _decompressed_chunks(file_path):
+        buf = leftover + chunk
+        formats, offsets = scan_dataflash(buf, 0, None, formats)
+        scanned = 0
+        for mtype, type_offsets in offsets.items():
+            fmt = formats[mtype]
+            scanned = max(scanned, type_offsets[-1] + fmt["length"])
+            count += len(type_offsets)
+            if mtype != FMT_TYPE and not (msg_types and fmt["name"] not in msg_types):
+                parts[fmt["name"]].append((fmt, gather_records(buf, fmt, type_offsets)))
+        # Every complete record was scanned; what follows is at most one cut-off record
+        leftover = buf[max(scanned, len(buf) - MAX_RECORD_LENGTH):]
+        if progress is not None:
+            progress(done, total, count, columns)
+    return columns(), count
+
+
+def _decode_tlog_stream(file_path, msg_types, progress=None) -> Tuple[Dict[str, Dict[str, np.ndarray]], int]:
+    """Decode a compressed tlog chunk by chunk with a MAVLink 2 parser (which also reads MAVLink 1)"""
+    mav = importlib.import_module(f"pymavlink.dialects.v20.{mavutil.current_dialect}").MAVLink(None)
+    collectors = defaultdict(lambda: defaultdict(list))
+    count = 0
+
+    leftover = b""
+    for chunk, done, total in _decompressed_chunks(file_path):
+        buf = leftover + chunk
+        ofs = 0
+        while ofs + 11 <= len(buf):
+            length = _tlog_record_length(buf, ofs)
+            if length == 0:
+                ofs += 1
+                continue
+            if ofs + length > len(buf):
+                break
+            try:
+                msg = mav.decode(bytearray(buf[ofs + 8:ofs + length]))
+            except Exception:
+                # Corrupt packet: resync from the next byte
+                ofs += 1
+                continue
+            (timestamp,) = struct.unpack(">Q", buf[ofs:ofs + 8])
+            ofs += length
+            msg_type = msg.get_type()
+            if msg_type == "BAD_DATA" or (msg_types and msg_type not in msg_types):
+                continue
+            count += 1
+            fields = collectors[msg_type]
+            fields["timestamp"].append(timestamp * 1e-6)
+            for name in msg.get_fieldnames():
+                fields[name].append(getattr(msg, name))
+        leftover = buf[ofs:]
+        if progress is not None:
+            progress(done, total, count, lambda: _collected_columns(collectors))
+    return _collected_columns(collectors), count
+
+
+def _read_columns_stream(file_path, msg_types, progress=None) -> Tuple[Dict[str, Dict[str, np.ndarray]], int]:
+    inner = os.path.splitext(str(file_path))[0]
+    with open(file_path, "rb") as raw, open_decompressed(raw, file_path) as stream:
+        head = stream.read(3)
+    if head == SYNC + bytes([FMT_TYPE]):
+        return _decode_dataflash_stream(file_path, msg_types, progress)
+    if inner.endswith(".tlog"):
+        return _decode_tlog_stream(file_path, msg_types, progress)
+    raise ValueError("Only binary DataFlash logs and tlogs can be read compressed")
+
+
+def find_formats(buf) -> Dict[int, Dict[str, Any]]:
+    """Collect every FMT definition in a DataFlash log without walking the records"""
+    formats = {}
+    pattern = SYNC + bytes([FMT_TYPE])
+    ofs = buf.find(pattern)
+    while ofs != -1:
+        fmt = _parse_fmt(buf, ofs)
+        follows = bytes(buf[ofs + FMT_LENGTH:ofs + FMT_LENGTH + 2])
+        if fmt is not None and len(fmt["format"]) == len(fmt["columns"]) and follows in (SYNC, b""):
+            formats[fmt["type"]] = fmt
+        ofs = buf.find(pattern, ofs + 1)
+    return formats
+
+
+def _dataflash_record_length(formats):
+    lengths = [0] * 256
+    lengths[FMT_TYPE] = FMT_LENGTH
+    for mtype, fmt in formats.items():
+        lengths[mtype] = fmt["length"]
+
+    def record_length(buf, ofs):
+        if buf[ofs:ofs + 2] != SYNC:
+            return 0
+        return lengths[buf[ofs + 2]]
+    return record_length
+
+
+def _tlog_record_length(buf, ofs):
+    """Length of a timestamp-prefixed MAVLink record at ofs, or 0 if there is none"""
+    header = buf[ofs:ofs + 11]
+    if len(header) < 11:
+        return 0
+    (timestamp,) = struct.unpack(">Q", header[:8])
+    if not TLOG_MIN_USEC <= timestamp <= TLOG_MAX_USEC:
+        return 0
+    if header[8] == MAVLINK_V1:
+        return 8 + 8 + header[9]
+    if header[8] == MAVLINK_V2:
+        return 8 + 12 + header[9] + (13 if header[10] & 0x01 else 0)
+    return 0
+
+
+def find_sync(buf, pos: int, record_length) -> int:
+    """First offset at or after pos where SYNC_CHAIN records line up back to back"""
+    data_len = len(buf)
+    for candidate in range(pos, data_len):
+        ofs = candidate
+        for _ in range(SYNC_CHAIN):
+            length = record_length(buf, ofs)
+            if length == 0:
+                break
+            ofs += length
+            if ofs >= data_len:
+                return candidate
+        else:
+            return candidate
+    return data_len
+
+
+def shard_ranges(buf, shards: int, record_length) -> List[Tuple[int, int]]:
+    """Split a log into roughly equal byte ranges that start on record boundaries"""
+    data_len = len(buf)
+    bounds = [0]
+    for i in range(1, shards):
+        bound = find_sync(buf, max(bounds[-1], data_len * i // shards), record_length)
+        if bound >= data_len:
+            break
+        if bound > bounds[-1]:
+            bounds.append(bound)
+    bounds.append(data_len)
+    return list(zip(bounds[:-1], bounds[1:]))
+
+
+def _time_order(fields: Dict[str, np.ndarray]) -> Dict[str, np.ndarray]:
+    for key in ("TimeUS", "TimeMS", "timestamp"):
+        if key in fields:
+            time_col = fields[key]
+            if len(time_col) > 1 and np.any(time_col[1:] < time_col[:-1]):
+                order = np.argsort(time_col, kind="stable")
+                return {name: col[order] for name, col in fields.items()}
+            break
+    return fields
+
+
+def _get_process_pool(workers: int) -> ProcessPoolExecutor:
+    global _process_pool, _process_pool_size
+    if _process_pool is None or _process_pool_size != workers:
+        if _process_pool is not None:
+            _process_pool.shutdown(wait=False)
+        # spawn: the API process also runs threads, which do not mix with fork
+        _process_pool = ProcessPoolExecutor(max_workers=workers, mp_context=multiprocessing.get_context("spawn"))
+        _process_pool_size = workers
+    return _process_pool
+
+
+def _merge_seek_index(parts: List[Dict[str, Any]]) -> Dict[str, Any]:
+    """Combine the seek indexes of shards given in file order"""
+    pieces = defaultdict(list)
+    starts = {}
+    for part in parts:
+        for name, entries in part["types"].items():
+            pieces[name].append(entries)
+            starts[name] = min(starts.get(name, np.inf), part["starts"][name])
+    return {"fmt_offsets": np.concatenate([part["fmt_offsets"] for part in parts]),
+            "starts": starts,
+            "types": {name: _merge_seek_entries(entries) for name, entries in pieces.items()}}
+
+
+def _merge_shards(results, dataflash: bool) -> Dict[str, Dict[str, np.ndarray]]:
+    """Columns from shard results given in file order, which is time order within each shard"""
+    columns = {}
+    if dataflash:
+        parts = defaultdict(list)
+        for records, _, _ in results:
+            for name, (fmt, type_records) in records.items():
+                parts[name].append((fmt, type_records))
+        for name, pieces in parts.items():
+            fmt = pieces[-1][0]
+            columns[name] = _time_order(records_to_columns(fmt, np.concatenate([r for _, r in pieces])))
+    else:
+        parts = defaultdict(lambda: defaultdict(list))
+        for shard_columns, _ in results:
+            for name, fields in shard_columns.items():
+                for field, values in fields.items():
+                    parts[name][field].append(values)
+        for name, fields in parts.items():
+            columns[name] = _time_order({field: np.concatenate(values) for field, values in fields.items()})
+    return columns
+
+
+def _read_columns_parallel(file_path, msg_types, workers: int, dataflash: bool, seek: bool = False,
+                           shards: Optional[int] = None, progress=None) -> Tuple[Dict[str, Dict[str, np.ndarray]], int, Optional[Dict[str, Any]]]:
+    """Decode `shards` record-aligned ranges (one per worker by default) on `workers` processes.
+
+    With one worker the ranges are decoded in this process. progress, if
+    given, is called after each range in file order (see read_columns)."""
+    with open(file_path, "rb") as f:
+        buf = mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ)
+    try:
+        total = len(buf)
+        if dataflash:
+            formats = find_formats(buf)
+            ranges = shard_ranges(buf, shards or workers, _dataflash_record_length(formats))
+        else:
+            ranges = shard_ranges(buf, shards or workers, _tlog_record_length)
+    finally:
+        buf.close()
+
+    if dataflash:
+        calls = [(_decode_dataflash_range, str(file_path), start, end, formats, msg_types, seek) for start, end in ranges]
+    else:
+        calls = [(_decode_mavlink_range, str(file_path), msg_types, start, end) for start, end in ranges]
+    if workers > 1:
+        pool = _get_process_pool(workers)
+        futures = [pool.submit(*call) for call in calls]
+        shard_results = (future.result() for future in futures)
+    else:
+        shard_results = (call[0](*call[1:]) for call in calls)
+
+    results = []
+    count = 0
+    try:
+        for (_, end), result in zip(ranges, shard_results):
+            results.append(result)
+            count += result[1]
+            if progress is not None:
+                done = list(results)
+                progress(end, total, count, lambda: _merge_shards(done, dataflash))
+    except BaseException:
+        # progress may abort the decode (a cancelled ingest); drop the ranges not started yet
+        if workers > 1:
+            for future in futures:
+                future.cancel()
+        raise
+
+    index = _merge_seek_index([result[2] for result in results]) if dataflash and seek else None
+    return _merge_shards(results, dataflash), count, index
+
+
+def read_columns(file_path, msg_types: Optional[List[str]] = None, workers: Optional[int] = None,
+                 seek_index=None, progress=None) -> Tuple[Dict[str, Dict[str, np.ndarray]], Dict[str, Any]]:
+    """Decode a log in one pass into {msg_type: {field: ndarray}}.
+
+    Binary DataFlash logs are decoded straight from a memory map; tlogs and
+    text logs go through pymavlink but are still collected column-wise.
+    Compressed logs (.gz, .xz, .zst) are decompressed as a stream and
+    decoded chunk by chunk in this process, with no seek index.
+    Binary logs of at least PARALLEL_MIN_BYTES are split into record-aligned
+    shards and decoded on a process pool of `workers` (DECODE_WORKERS).
+    When seek_index is a path and the log is DataFlash, the same pass
+    writes a seek index there for read_time_range().
+
+    progress(bytes_done, bytes_total, messages, partial) is called as the
+    decode advances; binary logs and tlogs are then decoded in ranges of
+    INGEST_CHUNK_BYTES so it is called at least once per range. partial()
+    returns the columns decoded so far (it merges them, so call it sparingly).
+    Returns the columns and ingest statistics (messages per second)."""
+    started = time.perf_counter()
+    if is_compressed(file_path):
+        columns, count = _read_columns_stream(file_path, msg_types, progress)
+        elapsed = time.perf_counter() - started
+        return columns, {"messages": count,
+                         "seconds": elapsed,
+                         "msgs_per_sec": count / elapsed if elapsed > 0 else 0.0,
+                         "workers": 1,
+                         "compressed": True,
+                         "column_bytes": sum(col.nbytes for fields in columns.values() for col in fields.values())}
+
+    workers = decode_workers if workers is None else workers
+    dataflash = is_dataflash(file_path)
+    tlog = str(file_path).endswith(".tlog")
+    size = os.path.getsize(file_path)
+    shards = workers if workers > 1 and (dataflash or tlog) and size >= PARALLEL_MIN_BYTES else 1
+    ranges = shards
+    if progress is not None and (dataflash or tlog):
+        ranges = max(shards, -(-size // INGEST_CHUNK_BYTES))
+
+    seek = seek_index is not None and dataflash
+    index = None
+    if ranges > 1:
+        columns, count, index = _read_columns_parallel(file_path, msg_types, shards, dataflash, seek, ranges, progress)
+    elif dataflash:
+        records, count, index = _decode_dataflash_range(file_path, 0, None, None, msg_types, seek)
+        columns = {name: _time_order(records_to_columns(fmt, type_records)) for name, (fmt, type_records) in records.items()}
+    else:
+        columns, count = _decode_mavlink_range(file_path, msg_types)
+        columns = {name: _time_order(fields) for name, fields in columns.items()}
+    if progress is not None and ranges == 1:
+        progress(size, size, count, lambda: columns)
+    if index is not None:
+        write_seek_index(seek_index, file_path, index)
+    elapsed = time.perf_counter() - started
+
+    stats = {"messages": count,
+             "seconds": elapsed,
+             "msgs_per_sec": count / elapsed if elapsed > 0 else 0.0,
+             "workers": shards,
+             "column_bytes": sum(col.nbytes for fields in columns.values() for col in fields.values())}
+    return columns, stats
+
+
+def seek_index_path(file_path) -> str:
+    """Where the seek index of a log is kept: a sidecar file next to it"""
+    return f"{file_path}.seek.npz"
+
+
+def write_seek_index(path, file_path, index: Dict[str, Any]):
+    """Store a seek index (written to a temporary file and renamed into place).
+
+    For every timed message type it holds, per SEEK_BUCKET_SECONDS of log
+    time, the offset of the first record in the bucket and the end of the
+    last one, plus the FMT record offsets so formats load without a scan."""
+    arrays = {"fmt_offsets": index["fmt_offsets"]}
+    for name, (buckets, first, end) in index["types"].items():
+        arrays[f"{name}.buckets"], arrays[f"{name}.first"], arrays[f"{name}.end"] = buckets, first, end
+    meta = {"version": SEEK_INDEX_VERSION,
+            "size": os.path.getsize(file_path),
+            "bucket_seconds": SEEK_BUCKET_SECONDS,
+            "starts": index["starts"]}
+    arrays["meta"] = np.array(json.dumps(meta))
+    tmp = f"{path}.{os.getpid()}.tmp"
+    try:
+        with open(tmp, "wb") as f:
+            np.savez(f, **arrays)
+        os.replace(tmp, path)
+    except OSError as e:
+        print(f"Error writing seek index {path}: {str(e)}")
+
+
+def load_seek_index(path, file_path) -> Optional[Dict[str, Any]]:
+    """The seek index at path, or None if it is missing or was built for another file"""
+    try:
+        with np.load(path) as data:
+            meta = json.loads(str(data["meta"]))
+            if meta["version"] != SEEK_INDEX_VERSION or meta["size"] != os.path.getsize(file_path):
+                return None
+            types = {name: (data[f"{name}.buckets"], data[f"{name}.first"], data[f"{name}.end"]) for name in meta["starts"]}
+            return {**meta, "fmt_offsets": data["fmt_offsets"], "types": types}
+    except (OSError, KeyError, ValueError):
+        return None
+
+
+def _column_seconds(fields: Dict[str, np.ndarray]) -> Optional[np.ndarray]:
+    for key, scale in (("TimeUS", 1e-6), ("TimeMS", 1e-3), ("timestamp", 1.0)):
+        if key in fields:
+            return np.asarray(fields[key], dtype=np.float64) * scale
+    return None
+
+
+def _seek_range(index: Dict[str, Any], msg_types, t0: float, start: Optional[float], end: Optional[float]) -> Tuple[int, int]:
+    """Byte range holding every record of msg_types between start and end"""
+    width = index["bucket_seconds"]
+    lo, hi = None, None
+    for name, (buckets, first, last) in index["types"].items():
+        if msg_types and name not in msg_types:
+            continue
+        # The tolerance keeps a record exactly on a bucket edge despite rounding in t0 + start
+        i = int(np.searchsorted(buckets, np.floor((t0 + start) / width - 1e-6))) if start is not None else 0
+        j = int(np.searchsorted(buckets, np.floor((t0 + end) / width + 1e-6), side="right")) if end is not None else len(buckets)
+        if i < j:
+            lo = min(lo, int(first[i:j].min())) if lo is not None else int(first[i:j].min())
+            hi = max(hi, int(last[i:j].max())) if hi is not None else int(last[i:j].max())
+    return (lo, hi) if lo is not None else (0, 0)
+
+
+def _time_window(fields: Dict[str, np.ndarray], t0: float, start: Optional[float], end: Optional[float]) -> Optional[Dict[str, np.ndarray]]:
+    times = _column_seconds(fields)
+    if times is None:
+        return None
+    keep = np.ones(len(times), dtype=bool)
+    if start is not None:
+        keep &= times - t0 >= start
+    if end is not None:
+        keep &= times - t0 <= end
+    return {name: values[keep] for name, values in fields.items()}
+
+
+def read_time_range(file_path, msg_types: Optional[List[str]] = None, start: Optional[float] = None,
+                    end: Optional[float] = None, seek_index=None) -> Tuple[Dict[str, Dict[str, np.ndarray]], Dict[str, Any]]:
+    """Columns of the records of msg_types between start and end, in seconds from the start of the log.
+
+    A DataFlash log with a seek index (seek_index, by default the sidecar
+    from seek_index_path()) is only decoded over the byte range that holds
+    those records. Without one the whole log is decoded, writing the index
+    for the next read; tlogs and text logs are always decoded in full.
+    Message types without timestamps are left out. The stats include
+    "log_start", the time in seconds that start and end are relative to."""
+    started = time.perf_counter()
+    seek_index = seek_index_path(file_path) if seek_index is None else seek_index
+    dataflash = is_dataflash(file_path)
+    index = load_seek_index(seek_index, file_path) if dataflash else None
+
+    if index is None:
+        columns, stats = read_columns(file_path, None if dataflash else msg_types, seek_index=seek_index if dataflash else None)
+        starts = [times.min() for times in map(_column_seconds, columns.values()) if times is not None and len(times)]
+        t0 = float(min(starts)) if starts else 0.0
+        columns = {name: fields for name, fields in columns.items() if not msg_types or name in msg_types}
+        stats = {"messages": stats["messages"], "bytes_scanned": os.path.getsize(file_path), "seek": False}
+    else:
+        t0 = min(index["starts"].values(), default=0.0)
+        lo, hi = _seek_range(index, msg_types, t0, start, end)
+        columns, count = {}, 0
+        if lo < hi:
+            with open(file_path, "rb") as f:
+                buf = mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ)
+            try:
+                formats = {fmt["type"]: fmt for fmt in (_parse_fmt(buf, ofs) for ofs in index["fmt_offsets"].tolist()) if fmt is not None}
+            finally:
+                buf.close()
+            records, count, _ = _decode_dataflash_range(file_path, lo, hi, formats, msg_types)
+            columns = {name: _time_order(records_to_columns(fmt, type_records))
+                       for name, (fmt, type_records) in records.items() if name in index["types"]}
+        stats = {"messages": count, "bytes_scanned": hi - lo, "seek": True}
+
+    windowed = {}
+    for name, fields in columns.items():
+        fields = _time_window(fields, t0, start, end)
+        if fields is not None:
+            windowed[name] = fields
+    elapsed = time.perf_counter() - started
+    return windowed, {**stats,
+                      "log_start": t0,
+                      "seconds": elapsed,
+                      "msgs_per_sec": stats["messages"] / elapsed if elapsed > 0 else 0.0,
+                      "records": sum(len(next(iter(fields.values()), ())) for fields in windowed.values())}
+
+
+def columns_to_records(fields: Dict[str, np.ndarray], msg_type: str) -> List[Dict[str, Any]]:
+    """Rebuild to_dict()-style records for one message type"""
+    names = list(fields.keys())
+    values = []
+    for name in names:
+        col = fields[name]
+        if col.dtype.kind == "S":
+            values.append([_decode_text(v) for v in col.tolist()])
+        else:
+            values.append(col.tolist())
+    return [{"mavpackettype": msg_type, **dict(zip(names, row))} for row in zip(*values)]
+
+
+def columns_to_json(columns: Dict[str, Dict[str, np.ndarray]], msg_type: str) -> str:
+    return json.dumps(columns_to_records(columns.get(msg_type, {}), msg_type))
@@ -0,0 +1,221 @@
+import threading
+import time
+from collections import deque
+from concurrent.futures import ThreadPoolExecutor
+from typing import Callable, Dict, Hashable, Optional, Any
+from uuid import uuid4
+import numpy as np
+
+# Recent wait and run times kept for the scheduler's percentiles
+TIMING_WINDOW = 256
+
+
+class CountingExecutor(ThreadPoolExecutor):
+    """ThreadPoolExecutor that counts the calls submitted but not yet started"""
+
+    def __init__(self, max_workers: Optional[int] = None):
+        super().__init__(max_workers=max_workers)
+        self.lock = threading.Lock()
+        self.waiting = 0
+
+    def submit(self, fn: Callable, *args, **kwargs):
+        with self.lock:
+            self.waiting += 1
+
+        def started():
+            with self.lock:
+                self.waiting -= 1
+            return fn(*args, **kwargs)
+
+        future = super().submit(started)
+        # A call cancelled before it started never runs started()
+        future.add_done_callback(lambda f: f.cancelled() and self._cancelled())
+        return future
+
+    def _cancelled(self):
+        with self.lock:
+            self.waiting -= 1
+
+
+class JobQueue:
+    """Runs jobs on its own executor and records their state in the flight store.
+
+    Job state lives in the shared store, so a status request answered by any
+    API worker sees the progress of a job running in another one. A job
+    function receives a `progress(fraction, message)` callback as its last
+    keyword argument and returns a JSON-serialisable result."""
+
+    def __init__(self, store, max_workers: int = 1):
+        self.store = store
+        self.executor = ThreadPoolExecutor(max_workers=max_workers)
+        self.lock = threading.Lock()
+        self.queued = 0
+        self.running = 0
+
+    def submit(self, kind: str, fn: Callable, *args) -> str:
+        job_id = uuid4().hex
+        self.store.add_job({"job_id": job_id,
+                            "kind": kind,
+                            "status": "queued",
+                            "progress": 0.0,
+                            "message": "",
+                            "created_at": time.time()})
+        with self.lock:
+            self.queued += 1
+        self.executor.submit(self._run, job_id, fn, args)
+        return job_id
+
+    def _run(self, job_id: str, fn: Callable, args):
+        with self.lock:
+            self.queued -= 1
+            self.running += 1
+        self.store.update_job(job_id, status = "running", started_at = time.time())
+
+        def progress(fraction: float, message: str = ""):
+            self.store.update_job(job_id, progress = fraction, message = message)
+
+        try:
+            result = fn(*args, progress=progress)
+            self.store.update_job(job_id, status = "done", progress = 1.0, result = result, finished_at = time.time())
+        except Exception as e:
+            print(f"Job {job_id} failed: {str(e)}")
+            self.store.update_job(job_id, status = "failed", message = str(e), finished_at = time.time())
+        finally:
+            with self.lock:
+                self.running -= 1
+
+    def get(self, job_id: str) -> Optional[Dict[str, Any]]:
+        return self.store.get_job(job_id)
+
+    def shutdown(self):
+        self.executor.shutdown(wait=False, cancel_futures=True)
+
+
+class QueueFull(Exception):
+    """The ingest queue has no free slot"""
+
+
+class Cancelled(Exception):
+    """Raised inside a job once cancel() was called for it"""
+
+
+class IngestScheduler:
+    """Bounded, prioritised queue of ingest jobs run on a fixed set of threads.
+
+    At most max_queued jobs wait; submit() raises QueueFull beyond that, so
+    a burst of uploads is refused instead of piling up behind the API. A free
+    worker takes the waiting job with the lowest size / (1 + wait / aging_seconds)
+    among users running fewer than max_per_user jobs: small files go first,
+    and a large file gains priority while it waits, so it is not starved.
+    cancel() drops a waiting job or sets the `cancelled` event passed to a
+    running one, which stops at its next progress check."""
+
+    def __init__(self, workers: int = 2, max_queued: int = 64, max_per_user: int = 1, aging_seconds: float = 30.0):
+        self.max_queued = max_queued
+        self.max_per_user = max_per_user
+        self.aging_seconds = aging_seconds
+        self.condition = threading.Condition()
+        self.pending = []
+        self.running: Dict[Hashable, Dict[str, Any]] = {}
+        self.user_running: Dict[str, int] = {}
+        self.counts = {"submitted": 0, "completed": 0, "failed": 0, "cancelled": 0, "rejected": 0}
+        self.waits = deque(maxlen=TIMING_WINDOW)
+        self.runs = deque(maxlen=TIMING_WINDOW)
+        self.stopped = False
+        self.threads = [threading.Thread(target=self._work, name=f"ingest-{i}", daemon=True) for i in range(workers)]
+        for thread in self.threads:
+            thread.start()
+
+    def submit(self, key: Hashable, user_id: str, size: int, fn: Callable, *args):
+        """Queue fn(*args, cancelled=threading.Event()); a job already queued or running under key is cancelled"""
+        job = {"key": key, "user_id": user_id, "size": size, "fn": fn, "args": args,
+               "cancelled": threading.Event(), "submitted": time.monotonic()}
+        with self.condition:
+            self._cancel(key)
+            if len(self.pending) >= self.max_queued:
+                self.counts["rejected"] += 1
+                raise QueueFull(f"{len(self.pending)} ingest jobs are already waiting")
+            self.pending.append(job)
+            self.counts["submitted"] += 1
+            self.condition.notify()
+
+    def _cancel(self, key: Hashable) -> bool:
+        for job in self.pending:
+            if job["key"] == key:
+                self.pending.remove(job)
+                self.counts["cancelled"] += 1
+                return True
+        if key in self.running:
+            self.running[key]["cancelled"].set()
+            return True
+        return False
+
+    def cancel(self, key: Hashable) -> bool:
+        """Cancel the job queued or running under key; False if there is none"""
+        with self.condition:
+            return self._cancel(key)
+
+    def _next(self) -> Optional[Dict[str, Any]]:
+        now = time.monotonic()
+        eligible = [job for job in self.pending if self.user_running.get(job["user_id"], 0) < self.max_per_user]
+        if not eligible:
+            return None
+        return min(eligible, key=lambda job: job["size"] / (1 + (now - job["submitted"]) / self.aging_seconds))
+
+    def _work(self):
+        while True:
+            with self.condition:
+                job = self._next()
+                while job is None and not self.stopped:
+                    self.condition.wait()
+                    job = self._next()
+                if self.stopped:
+                    return
+                self.pending.remove(job)
+                self.running[job["key"]] = job
+                self.user_running[job["user_id"]] = self.user_running.get(job["user_id"], 0) + 1
+                started = time.monotonic()
+                self.waits.append(started - job["submitted"])
+
+            try:
+                job["fn"](*job["args"], cancelled=job["cancelled"])
+                outcome = "cancelled" if job["cancelled"].is_set() else "completed"
+            except Cancelled:
+                outcome = "cancelled"
+            except Exception as e:
+                print(f"Error in ingest job {job['key']}: {str(e)}")
+                outcome = "failed"
+
+            with self.condition:
+                if self.running.get(job["key"]) is job:
+                    del self.running[job["key"]]
+                self.user_running[job["user_id"]] -= 1
+                if not self.user_running[job["user_id"]]:
+                    del self.user_running[job["user_id"]]
+                self.counts[outcome] += 1
+                self.runs.append(time.monotonic() - started)
+                # A finished job may unblock a user that was at its limit
+                self.condition.notify_all()
+
+    def stats(self) -> Dict[str, Any]:
+        """Queue depth, running jobs and recent wait and run times in seconds"""
+        with self.condition:
+            waits, runs = np.asarray(self.waits), np.asarray(self.runs)
+            oldest = min((job["submitted"] for job in self.pending), default=None)
+            return {**self.counts,
+                    "queued": len(self.pending),
+                    "running": len(self.running),
+                    "max_queued": self.max_queued,
+                    "oldest_wait_s": round(time.monotonic() - oldest, 3) if oldest is not None else 0.0,
+                    "wait_s": {"mean": round(float(waits.mean()), 3) if len(waits) else 0.0,
+                               "p95": round(float(np.percentile(waits, 95)), 3) if len(waits) else 0.0},
+                    "run_s": {"mean": round(float(runs.mean()), 3) if len(runs) else 0.0,
+                              "p95": round(float(np.percentile(runs, 95)), 3) if len(runs) else 0.0}}
+
+    def shutdown(self):
+        with self.condition:
+            self.stopped = True
+            for job in self.running.values():
+                job["cancelled"].set()
+            self.pending.clear()
+            self.condition.notify_all()
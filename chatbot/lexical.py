@@ -0,0 +1,127 @@
+import math
+import re
+from collections import defaultdict
+from typing import Dict, List, Sequence, Tuple
+import numpy as np
+from langchain.docstore.document import Document
+from schemaindex import WORD, WORD_PART, STOPWORDS
+
+# BM25 parameters (the usual defaults)
+K1 = 1.2
+B = 0.75
+# Reciprocal rank fusion constant
+RRF_K = 60
+# "VIBE.Clip0", "GPS.HDop"; bare names like "HDop" or "NSats"
+QUALIFIED_NAME = re.compile(r"\b([A-Za-z][A-Za-z0-9_]*)\.([A-Za-z][A-Za-z0-9_]*)\b")
+NAME = re.compile(r"\b[A-Za-z][A-Za-z0-9_]*\b")
+
+
+def tokenize(text: str) -> List[str]:
+    """Lowercased words plus their camelCase parts, without question words"""
+    tokens = []
+    for word in WORD.findall(text):
+        lower = word.lower()
+        if lower in STOPWORDS:
+            continue
+        tokens.append(lower)
+        parts = WORD_PART.findall(word)
+        if len(parts) > 1:
+            tokens.extend(part.lower() for part in parts)
+    return tokens
+
+
+def _looks_like_name(word: str) -> bool:
+    """A message or field name rather than an English word: all caps, mixed case or with digits"""
+    return len(word) > 1 and (word.isupper() or any(c.isdigit() for c in word) or any(c.isupper() for c in word[1:]))
+
+
+class LexicalIndex:
+    """In-memory inverted index over documents, with BM25 ranking and exact
+    lookup of messages and fields by the "message"/"field" metadata"""
+
+    def __init__(self, documents: Sequence[Document]):
+        self.documents = list(documents)
+        self.fields: Dict[str, List[int]] = defaultdict(list)
+        self.field_names: Dict[str, List[int]] = defaultdict(list)
+        self.messages: Dict[str, List[int]] = defaultdict(list)
+        postings: Dict[str, Dict[int, int]] = defaultdict(dict)
+        lengths = []
+        for i, doc in enumerate(self.documents):
+            metadata = doc.metadata or {}
+            message, field = metadata.get("message"), metadata.get("field")
+            if message and field:
+                self.fields[f"{message}.{field}".lower()].append(i)
+                self.field_names[field.lower()].append(i)
+            elif message and metadata.get("kind") == "message":
+                self.messages[message.lower()].append(i)
+            tokens = tokenize(doc.page_content)
+            lengths.append(len(tokens))
+            for token in tokens:
+                postings[token][i] = postings[token].get(i, 0) + 1
+
+        self.lengths = np.asarray(lengths, dtype=np.float32)
+        self.avg_length = float(self.lengths.mean()) if lengths else 0.0
+        count = len(self.documents)
+        self.postings: Dict[str, Tuple[np.ndarray, np.ndarray, float]] = {}
+        for token, docs in postings.items():
+            idf = math.log(1 + (count - len(docs) + 0.5) / (len(docs) + 0.5))
+            self.postings[token] = (np.fromiter(docs.keys(), dtype=np.int64, count=len(docs)),
+                                    np.fromiter(docs.values(), dtype=np.float32, count=len(docs)),
+                                    idf)
+
+    def exact(self, query: str) -> Tuple[List[int], List[int]]:
+        """(field documents, message documents) for the names written in the query"""
+        fields, messages = [], []
+        qualified = QUALIFIED_NAME.findall(query)
+        for message, field in qualified:
+            fields += self.fields.get(f"{message}.{field}".lower(), [])
+        for word in NAME.findall(query):
+            if not _looks_like_name(word):
+                continue
+            if word.lower() in self.messages:
+                messages += self.messages[word.lower()]
+            elif not qualified:
+                fields += self.field_names.get(word.lower(), [])
+        return fields, messages
+
+    def bm25(self, query: str, k: int) -> List[Document]:
+        if not self.documents:
+            return []
+        scores = np.zeros(len(self.documents), dtype=np.float32)
+        for token in set(tokenize(query)):
+            posting = self.postings.get(token)
+            if posting is None:
+                continue
+            docs, tf, idf = posting
+            norm = K1 * (1 - B + B * self.lengths[docs] / self.avg_length)
+            scores[docs] += idf * tf * (K1 + 1) / (tf + norm)
+        matched = np.flatnonzero(scores)
+        top = matched[np.argsort(-scores[matched], kind="stable")][:k]
+        return [self.documents[i] for i in top]
+
+    def search(self, query: str, k: int = 5) -> Tuple[List[Document], bool]:
+        """(documents, exact): named fields and messages first, filled up with BM25 results.
+
+        exact is True when the query names a field that exists, which is
+        strong enough to answer without a vector search."""
+        fields, messages = self.exact(query)
+        docs = [self.documents[i] for i in dict.fromkeys(fields + messages)][:k]
+        seen = {id(doc) for doc in docs}
+        for doc in self.bm25(query, k):
+            if len(docs) >= k:
+                break
+            if id(doc) not in seen:
+                docs.append(doc)
+        return docs, bool(fields)
+
+
+def fuse(rankings: Sequence[Sequence[Document]], k: int) -> List[Document]:
+    """Reciprocal rank fusion of several rankings, identifying documents by content"""
+    scores: Dict[str, float] = defaultdict(float)
+    first: Dict[str, Document] = {}
+    for ranking in rankings:
+        for rank, doc in enumerate(ranking):
+            scores[doc.page_content] += 1.0 / (RRF_K + rank + 1)
+            first.setdefault(doc.page_content, doc)
+    ranked = sorted(scores, key=scores.get, reverse=True)[:k]
+    return [first[content] for content in ranked]
@@ -0,0 +1,138 @@
+import hashlib
+import json
+import os
+import shutil
+import time
+from pathlib import Path
+from typing import Dict, Optional, Any, Tuple
+import numpy as np
+from decoder import read_columns, seek_index_path
+
+CHUNK_SIZE = 1024 * 1024
+STALE_TMP_SECONDS = 3600
+
+
+def file_digest(file_path) -> str:
+    """SHA-256 of a file, read in fixed-size chunks"""
+    digest = hashlib.sha256()
+    with open(file_path, "rb") as f:
+        for chunk in iter(lambda: f.read(CHUNK_SIZE), b""):
+            digest.update(chunk)
+    return digest.hexdigest()
+
+
+class LogCache:
+    """Decoded log columns stored on disk, keyed by the log's content hash.
+
+    Each entry is a directory with one .npy file per column and a meta.json
+    manifest. Entries are written to a temporary directory and renamed into
+    place, so any worker can read them with mmap while another is writing.
+    The entry's mtime doubles as its LRU timestamp."""
+
+    def __init__(self, cache_dir, max_bytes: int):
+        self.cache_dir = Path(cache_dir)
+        self.max_bytes = max_bytes
+        self.cache_dir.mkdir(parents=True, exist_ok=True)
+
+    def _entry(self, digest: str) -> Path:
+        return self.cache_dir / digest
+
+    def contains(self, digest: str) -> bool:
+        return (self._entry(digest) / "meta.json").exists()
+
+    def load(self, digest: str) -> Optional[Tuple[Dict[str, Dict[str, np.ndarray]], Dict[str, Any]]]:
+        """Memory-map a cached entry, or return None on a miss"""
+        entry = self._entry(digest)
+        try:
+            with open(entry / "meta.json", encoding="utf-8") as f:
+                meta = json.load(f)
+            columns = {}
+            for msg_type, fields in meta["columns"].items():
+                columns[msg_type] = {}
+                for field, filename in fields.items():
+                    path = entry / filename
+                    try:
+                        columns[msg_type][field] = np.load(path, mmap_mode="r")
+                    except ValueError:
+                        # Object columns (tlog arrays of mixed length) cannot be mapped
+                        columns[msg_type][field] = np.load(path, allow_pickle=True)
+            os.utime(entry)
+            return columns, meta["stats"]
+        except (OSError, KeyError, ValueError):
+            return None
+
+    def store(self, digest: str, columns: Dict[str, Dict[str, np.ndarray]], stats: Dict[str, Any]):
+        """Write columns for digest and evict old entries beyond max_bytes"""
+        entry = self._entry(digest)
+        if self.contains(digest):
+            os.utime(entry)
+            return
+
+        tmp = self.cache_dir / f".{digest}.{os.getpid()}.tmp"
+        shutil.rmtree(tmp, ignore_errors=True)
+        tmp.mkdir()
+        manifest = {}
+        for msg_type, fields in columns.items():
+            manifest[msg_type] = {}
+            for i, (field, values) in enumerate(fields.items()):
+                filename = f"{msg_type}.{i}.npy"
+                np.save(tmp / filename, np.asarray(values), allow_pickle=True)
+                manifest[msg_type][field] = filename
+        with open(tmp / "meta.json", "w", encoding="utf-8") as f:
+            json.dump({"digest": digest, "stats": stats, "columns": manifest}, f)
+
+        try:
+            os.rename(tmp, entry)
+        except OSError:
+            # Another worker stored the same log first
+            shutil.rmtree(tmp, ignore_errors=True)
+        self.evict()
+
+    def _entry_size(self, entry: Path) -> int:
+        return sum(f.stat().st_size for f in entry.iterdir() if f.is_file())
+
+    def evict(self):
+        """Remove least recently used entries until the cache fits max_bytes"""
+        entries = []
+        for entry in self.cache_dir.iterdir():
+            if not entry.is_dir():
+                continue
+            try:
+                if entry.name.startswith("."):
+                    # Leftover from a worker that died mid-write
+                    if time.time() - entry.stat().st_mtime > STALE_TMP_SECONDS:
+                        shutil.rmtree(entry, ignore_errors=True)
+                    continue
+                entries.append((entry.stat().st_mtime, self._entry_size(entry), entry))
+            except OSError:
+                continue
+
+        total = sum(size for _, size, _ in entries)
+        for _, size, entry in sorted(entries):
+            if total <= self.max_bytes:
+                break
+            shutil.rmtree(entry, ignore_errors=True)
+            total -= size
+
+    def read_columns(self, file_path, digest: Optional[str] = None, progress=None) -> Tuple[Dict[str, Dict[str, np.ndarray]], Dict[str, Any]]:
+        """Columns for file_path from the cache, decoding and storing them on a miss (see decoder.read_columns for progress)"""
+        digest = digest or file_digest(file_path)
+        started = time.perf_counter()
+        cached = self.load(digest)
+        if cached is not None:
+            columns, stats = cached
+            return columns, {**stats, "cache_hit": True, "load_seconds": time.perf_counter() - started}
+
+        # The first decode also leaves a seek index next to the log, which serves time-bounded
+        # data and query requests once this entry is evicted
+        columns, stats = read_columns(file_path, seek_index=seek_index_path(file_path), progress=progress)
+        stats = {**stats, "digest": digest}
+        self.store(digest, columns, stats)
+        cached = self.load(digest)
+        if cached is not None:
+            columns = cached[0]
+        return columns, {**stats, "cache_hit": False}
+
+
+log_cache = LogCache(os.getenv("LOG_CACHE_DIR", "files/cache"),
+                     int(os.getenv("LOG_CACHE_MAX_BYTES", str(2 * 1024 ** 3))))
@@ -2,28 +2,84 @@ from uuid import uuid4
 from pathlib import Path
 from models import *
 from process import *
+from decoder import COMPRESSED_SUFFIXES, zstandard
 from fastapi.middleware.cors import CORSMiddleware
-from fastapi import FastAPI, UploadFile, File, HTTPException, BackgroundTasks
+from fastapi.responses import StreamingResponse
+from fastapi import FastAPI, UploadFile, File, HTTPException, Request, Response
 from fastapi import Header
 from dotenv import load_dotenv
 from chainlit.utils import mount_chainlit
 from typing import Dict
 import asyncio
+import hashlib
+import json
 import os 
+import time
 from langchain.docstore.document import Document
 from langchain.embeddings import OpenAIEmbeddings
+from vectorcache import VectorstoreCache, SQLiteByteStore, QueryCache, cached_embeddings, index_version
+from jobs import JobQueue, IngestScheduler, QueueFull, Cancelled
+from analytics import query_flight, QueryError
+from schema import schema_from_tables, schema_documents
+from schemaindex import load_schema_index
+from lexical import LexicalIndex, fuse
+from metrics import registry, CONTENT_TYPE
+from payload import negotiate, choose_encoding, formats, FORMAT_NAMES, MAX_ROWS, payload_cache
 
 app = FastAPI(title = "Drone Log API", description = "API for processing drone flight logs", version = "1.0.0")
 
-executor = ThreadPoolExecutor(max_workers=4)
-embedding_model = OpenAIEmbeddings()
-cache = {}
+embedding_store = SQLiteByteStore(os.getenv("EMBEDDING_CACHE_PATH", "files/embedding_cache.db"))
+embedding_model = cached_embeddings(OpenAIEmbeddings(), embedding_store,
+                                    batch_size = int(os.getenv("EMBEDDING_BATCH_SIZE", "256")))
+vectorstore_cache = VectorstoreCache(embedding_model, max_indexes = int(os.getenv("VECTORSTORE_CACHE_SIZE", "4")))
+query_cache = QueryCache(max_entries = int(os.getenv("QUERY_CACHE_SIZE", "1024")),
+                         ttl = float(os.getenv("QUERY_CACHE_TTL", "3600")))
 
 load_dotenv()
 
 upload_dir = Path("files")
 upload_dir.mkdir(exist_ok=True)
-flight_data_store: Dict[str, Dict[str, dict]] = {}
+# Applies to the upload as sent, so compressed logs are limited by their compressed size
+max_upload_bytes = 100 * 1024 * 1024
+log_suffixes = ('.bin', '.log', '.tlog')
+# Decompressed as a stream while decoding; text logs need the raw file
+compressed_suffixes = tuple(f"{log}{compression}" for log in ('.bin', '.tlog') for compression in COMPRESSED_SUFFIXES)
+upload_chunk_size = 1024 * 1024
+# Decoding publishes a partial summary at most this often
+partial_summary_seconds = float(os.getenv("PARTIAL_SUMMARY_SECONDS", "2"))
+event_poll_seconds = 0.5
+event_keepalive_seconds = 15
+flight_store = create_flight_store()
+# Log-message schema answered locally from the first request on. Built by `python schemaindex.py`
+# at deploy time; a missing or stale index is rebuilt here by one worker while the others wait
+schema_index = load_schema_index(os.getenv("SCHEMA_INDEX_PATH", "output/schema_index"),
+                                 os.getenv("SCHEMA_EMBEDDINGS", "hashing"))
+# index_path -> (FAISS index version, lexical index over the schema and FAISS documents)
+lexical_indexes = {}
+query_stats = {"exact": 0, "hybrid": 0}
+# One worker: updates to the same index must not interleave
+vectorstore_jobs = JobQueue(flight_store, max_workers = 1)
+ingest_scheduler = IngestScheduler(workers = int(os.getenv("INGEST_WORKERS", "2")),
+                                   max_queued = int(os.getenv("INGEST_QUEUE_SIZE", "64")),
+                                   max_per_user = int(os.getenv("INGEST_PER_USER", "1")),
+                                   aging_seconds = float(os.getenv("INGEST_AGING_SECONDS", "30")))
+
+# Routes are labelled by their template, so file ids do not create new series
+request_seconds = registry.histogram("api_request_seconds", "Latency of API requests until the response starts", ("method", "route", "status"))
+stage_seconds = registry.histogram("api_stage_seconds", "Time spent in the stages of API requests and background jobs", ("stage",))
+search_seconds = registry.histogram("vectorstore_search_seconds", "Time of one search in each retrieval index", ("index",))
+registry.gauge("ingest_jobs", "Files queued for and being decoded by the ingest scheduler", ("state",),
+               callback = lambda: {(state,): ingest_scheduler.stats()[state] for state in ("queued", "running")})
+registry.gauge("vectorstore_jobs", "Vectorstore updates queued and running", ("state",),
+               callback = lambda: {("queued",): vectorstore_jobs.queued, ("running",): vectorstore_jobs.running})
+registry.gauge("api_executor_queued", "Blocking API calls waiting for a thread of the shared executor",
+               callback = lambda: executor.waiting)
+registry.gauge("vectorstore_cache_hit_ratio", "Share of index lookups served by the resident cache",
+               callback = lambda: vectorstore_cache.stats()["hit_rate"])
+registry.gauge("payload_cache_bytes", "Encoded flight data bodies kept by this worker",
+               callback = lambda: payload_cache.bytes)
+registry.gauge("query_cache_hit_ratio", "Share of retrieval queries served by the query cache",
+               callback = lambda: query_cache.stats()["hit_rate"])
 
 app.add_middleware(CORSMiddleware,
                    allow_origins = ["http://localhost:3000", "http://localhost:8080", "*"], 
@@ -31,129 +87,362 @@ app.add_middleware(CORSMiddleware,
                    allow_methods = ["GET", "POST", "DELETE"],
                    allow_headers = ["*"])
 
-async def process_file_background(file_id: str, file_path: str, user_id: str):
+@app.middleware("http")
+async def record_latency(request: Request, call_next):
+    started = time.perf_counter()
+    status = 500
     try:
-        loop = asyncio.get_event_loop()
-        content = await loop.run_in_executor(executor, read_data, str(file_path), ["GPS"])
-        if user_id in flight_data_store and file_id in flight_data_store[user_id]:
-            flight_data_store[user_id][file_id]["content"] = content
+        response = await call_next(request)
+        status = response.status_code
+        return response
+    finally:
+        route = request.scope.get("route")
+        request_seconds.observe(time.perf_counter() - started, request.method,
+                                route.path if route is not None else "unmatched", str(status))
+
+def ingest_progress(user_id: str, file_id: str, cancelled = None):
+    """Progress callback for read_flight_data that records bytes and messages
+    decoded and, every partial_summary_seconds, a summary of the flight so far.
+    It raises Cancelled once the file's ingest job is cancelled, or once the
+    file is gone from the store (deleted through another worker)."""
+    last_summary = [0.0]
+
+    def progress(done: int, total: int, messages: int, partial):
+        if cancelled is not None and cancelled.is_set():
+            raise Cancelled(file_id)
+        fields = {"progress": {"bytes": done, "total": total, "messages": messages,
+                               "fraction": round(done / total, 4) if total else 1.0}}
+        if done < total and time.monotonic() - last_summary[0] >= partial_summary_seconds:
+            last_summary[0] = time.monotonic()
+            fields["summary"] = {**summarize_flight(partial(), {"messages": messages}), "partial": True}
+        if not flight_store.update_file(user_id, file_id, **fields):
+            raise Cancelled(file_id)
+    return progress
+
+def process_file(file_id: str, file_path: str, user_id: str, digest: str = None, cancelled = None):
+    if flight_store.get_file(user_id, file_id) is None:
+        # Deleted while it was queued
+        return
+    try:
+        with stage_seconds.time("ingest"):
+            columns, stats, summary = read_flight_data(str(file_path), digest, ingest_progress(user_id, file_id, cancelled))
+        flight_store.update_file(user_id, file_id,
+                                 status = "ready" if stats else "failed",
+                                 decode_stats = stats,
+                                 summary = summary)
         
+    except Cancelled:
+        raise
     except Exception as e:
+        flight_store.update_file(user_id, file_id, status = "failed")
         print(f"Error processing file {file_id}: {str(e)}")
 
+async def save_upload(file: UploadFile, file_path: Path) -> str:
+    """Stream an upload to disk in fixed-size chunks and return its SHA-256"""
+    digest = hashlib.sha256()
+    size = 0
+    with open(file_path, "wb") as buffer:
+        while chunk := await file.read(upload_chunk_size):
+            size += len(chunk)
+            if size > max_upload_bytes:
+                raise HTTPException(status_code=400, detail= "File too large. Max size is 100MB")
+            digest.update(chunk)
+            buffer.write(chunk)
+    return digest.hexdigest()
+
 @app.post("/api/files/{file_id}", response_model = FileReceiveResponse, status_code = 201, description = "Upload and process a drone flight log file")
-async def receive_file(file_id: str, file: UploadFile = File(...), user_id: str = Header(...), background_tasks: BackgroundTasks = None):
-    if not file.filename.endswith(('.bin', '.log')):
-        raise HTTPException(status_code=400, detail="Only .bin and .log files are supported")
+async def receive_file(file_id: str, file: UploadFile = File(...), user_id: str = Header(...)):
+    if not file.filename.endswith(log_suffixes + compressed_suffixes):
+        raise HTTPException(status_code=400, detail=f"Supported files are {', '.join(log_suffixes + compressed_suffixes)}")
+    if file.filename.endswith(".zst") and zstandard is None:
+        raise HTTPException(status_code=400, detail="Zstandard-compressed logs are not supported on this server")
     
-    if file.size and file.size > 100 * 1024 * 1024:
+    if file.size and file.size > max_upload_bytes:
         raise HTTPException(status_code=400, detail= "File too large. Max size is 100MB")
     
     file_path = upload_dir / f"{file_id}_{file.filename}"
     
     try:
-        with open(file_path, "wb") as buffer:
-            content = await file.read()
-            buffer.write(content)    
+        digest = await save_upload(file, file_path)
         
-        if user_id not in flight_data_store:
-            flight_data_store[user_id] = {}
-            
         file_data = {"file_id": file_id,
                      "file_path": str(file_path),
                      "filename": file.filename,
-                     "content": ""}                 
+                     "digest": digest,
+                     "status": "processing"}                 
         
-        flight_data_store[user_id][file_id] = file_data
-        if background_tasks:
-            background_tasks.add_task(process_file_background, file_id, file_path, user_id)
+        flight_store.add_file(user_id, file_data)
+        if log_cache.contains(digest):
+            # Identical log already ingested: reuse the cached columns instead of queueing a decode
+            loop = asyncio.get_event_loop()
+            await loop.run_in_executor(executor, process_file, file_id, file_path, user_id, digest)
         else:
-            asyncio.create_task(process_file_background(file_id, file_path, user_id))
+            try:
+                ingest_scheduler.submit((user_id, file_id), user_id, file_path.stat().st_size,
+                                        process_file, file_id, file_path, user_id, digest)
+            except QueueFull as e:
+                flight_store.delete_file(user_id, file_id)
+                raise HTTPException(status_code = 503, detail = f"Too many files are waiting to be processed: {str(e)}",
+                                    headers = {"Retry-After": "30"})
         
         return FileReceiveResponse(**file_data)
         
+    except HTTPException:
+        if file_path.exists():
+            file_path.unlink()
+        raise
     except Exception as e:
         if file_path.exists():
             file_path.unlink()
         raise HTTPException(status_code = 500, detail = f"Failed to upload file: {str(e)}")
 
-@app.get("/api/files/{file_id}/status", description = "Get the status and summary of an uploaded file")
-async def get_file_status(file_id: str, user_id: str = Header(...)):
-    if user_id not in flight_data_store or file_id not in flight_data_store[user_id]:
+@app.get("/api/files/{file_id}/status", description = "Get the status and summary of an uploaded file; the GPS records only with include_content")
+async def get_file_status(file_id: str, user_id: str = Header(...), include_content: bool = False):
+    file_data = flight_store.get_file(user_id, file_id)
+    if file_data is None:
         raise HTTPException(status_code = 404, detail="File not found")
     
-    file_data = flight_data_store[user_id][file_id]
+    # Polls get the status only; the data endpoint serves the columns compactly and in pages
+    content = ""
+    if file_data["status"] == "ready" and include_content:
+        loop = asyncio.get_event_loop()
+        with stage_seconds.time("status_content"):
+            content = await loop.run_in_executor(executor, read_flight_content, file_data["digest"])
     
     status_summary = {"user_id": user_id,
                       "has_file": True,
                       "file_id": file_id,
                       "filename": file_data["filename"],
-                      "content": file_data["content"]}    
+                      "status": file_data["status"],
+                      "progress": file_data.get("progress") or {},
+                      "summary": file_data["summary"],
+                      "content": content,
+                      "content_url": f"/api/files/{file_id}/data?messages=GPS"}    
     
     return status_summary
 
-@app.get("/api/files/", description = "Get a list of all uploaded files")
+def sse_event(event: str, data) -> str:
+    return f"event: {event}\ndata: {json.dumps(data, default=str)}\n\n"
+
+@app.get("/api/files/{file_id}/events", description = "Server-sent events with the decode progress and partial summaries of a file")
+async def file_events(file_id: str, user_id: str = Header(...)):
+    if flight_store.get_file(user_id, file_id) is None:
+        raise HTTPException(status_code = 404, detail="File not found")
+
+    async def events():
+        # Polls the shared store, so the stream can be served by any worker, not only the one decoding
+        sent = {}
+        quiet = 0.0
+        while True:
+            file_data = flight_store.get_file(user_id, file_id)
+            if file_data is None:
+                yield sse_event("failed", {"detail": "File deleted"})
+                return
+            for event in ("progress", "summary"):
+                if file_data[event] and file_data[event] != sent.get(event):
+                    sent[event] = file_data[event]
+                    quiet = 0.0
+                    yield sse_event(event, file_data[event])
+            if file_data["status"] != "processing":
+                yield sse_event(file_data["status"], {"status": file_data["status"], "decode_stats": file_data["decode_stats"]})
+                return
+            if quiet >= event_keepalive_seconds:
+                quiet = 0.0
+                yield ": keep-alive\n\n"
+            await asyncio.sleep(event_poll_seconds)
+            quiet += event_poll_seconds
+
+    return StreamingResponse(events(), media_type = "text/event-stream", headers = {"Cache-Control": "no-cache"})
+
+@app.get("/api/files/{file_id}/data", description = "Columns of a decoded file as JSON, msgpack or Arrow (by Accept or format), "
+                                                "compressed per Accept-Encoding and paged by time window (start, end) and rows (offset, limit)")
+async def get_file_data(file_id: str, request: Request, user_id: str = Header(...), messages: str = "GPS",
+                        fields: str = None, start: float = None, end: float = None, offset: int = 0,
+                        limit: int = MAX_ROWS, format: str = None):
+    file_data = flight_store.get_file(user_id, file_id)
+    if file_data is None:
+        raise HTTPException(status_code = 404, detail="File not found")
+    if file_data["status"] != "ready":
+        raise HTTPException(status_code = 409, detail=f"File is {file_data['status']}")
+
+    media_type = negotiate(format or request.headers.get("accept"))
+    if media_type is None:
+        raise HTTPException(status_code = 406, detail = f"Available formats are {', '.join(formats())} "
+                                                        f"(format={', '.join(name for name, value in FORMAT_NAMES.items() if value in formats())})")
+    encoding = choose_encoding(request.headers.get("accept-encoding"))
+    key = (file_data["digest"], tuple(messages.split(",")), tuple(fields.split(",")) if fields else None,
+           start, end, offset, limit, media_type, encoding)
+    # A decoded log never changes, so the key identifies the body
+    etag = '"%s"' % hashlib.sha1(json.dumps(key).encode("utf-8")).hexdigest()
+    headers = {"ETag": etag, "Vary": "Accept, Accept-Encoding"}
+    if request.headers.get("if-none-match") == etag:
+        return Response(status_code = 304, headers = headers)
+
+    try:
+        loop = asyncio.get_event_loop()
+        with stage_seconds.time("flight_data"):
+            body, content_encoding = await loop.run_in_executor(executor, read_flight_payload, *key, file_data["file_path"])
+    except QueryError as e:
+        raise HTTPException(status_code = 400, detail = str(e))
+    if content_encoding:
+        headers["Content-Encoding"] = content_encoding
+    return Response(body, media_type = media_type, headers = headers)
+
+@app.post("/api/files/{file_id}/query", description = "Filter, aggregate, window or find threshold crossings in the decoded flight data")
+async def query_file(file_id: str, request: FlightQueryRequest, user_id: str = Header(...)):
+    file_data = flight_store.get_file(user_id, file_id)
+    if file_data is None:
+        raise HTTPException(status_code = 404, detail="File not found")
+    if file_data["status"] != "ready":
+        raise HTTPException(status_code = 409, detail=f"File is {file_data['status']}")
+
+    try:
+        loop = asyncio.get_event_loop()
+        with stage_seconds.time("flight_query"):
+            return await loop.run_in_executor(executor, query_flight, file_data["digest"], request.model_dump(exclude_none = True),
+                                              file_data["file_path"])
+    except QueryError as e:
+        raise HTTPException(status_code = 400, detail = str(e))
+
+@app.get("/api/files/", description = "Get a list of all uploaded files, oldest first")
 async def list_files():
     files = []
-    for user_id in flight_data_store.keys(): 
-        user_data = flight_data_store[user_id]
-        for file_id in user_data.keys():
-            data = user_data[file_id]
-            file_summary = {"file_id": file_id, 
-                            "filename": data["filename"]}
-            files.append(file_summary)
+    for data in flight_store.list_files(): 
+        file_summary = {"file_id": data["file_id"], 
+                        "filename": data["filename"],
+                        "created_at": data["created_at"]}
+        files.append(file_summary)
     return files
 
 @app.delete("/api/files/{file_id}", description = "Delete an uploaded file and its data")
 async def delete_file(file_id: str, user_id: str = Header(...)):
-    if user_id not in flight_data_store:
+    if not flight_store.has_user(user_id):
         raise HTTPException(status_code=404, detail="User not found")
 
-    if file_id not in flight_data_store[user_id]: 
+    file_data = flight_store.get_file(user_id, file_id)
+    if file_data is None: 
         raise HTTPException(status_code=404, detail="File not found")
         
-    file_data = flight_data_store[user_id][file_id]
+    # A parse still queued or running in this worker is dropped; one running in
+    # another worker stops at its next progress update, when the row is gone
+    ingest_scheduler.cancel((user_id, file_id))
     file_path = Path(file_data['file_path'])
-    if file_path.exists():
-        file_path.unlink()
+    for path in (file_path, Path(seek_index_path(file_path))):
+        if path.exists():
+            path.unlink()
         
-    del flight_data_store[user_id][file_id]
+    flight_store.delete_file(user_id, file_id)
     return {"message": f"File {file_data['filename']} deleted successfully"}
 
 
-@app.post("/api/vectorstore/update")
-async def update_vectorstore(request: VectorstoreUpdateRequest):
-    url = find_url(request.content)
-    if not url or url in cache:
-        return {"status": "skipped", "message": "No new URL found. Vectorstore not updated."}
-
-    if url not in cache:
-        cache[url] = True
-        parser = DynamicTableParser(url)
+def ingest_url(url: str, index_path: str, progress):
+    """Scrape the tables at url and add them to the FAISS index at index_path"""
+    progress(0.1, f"Fetching {url}")
+    parser = DynamicTableParser(url)
+    with stage_seconds.time("scrape"):
         extracted_data = parser.extract_all_data()
+    if not extracted_data:
+        flight_store.release_url(url)
+        raise RuntimeError(f"No tables extracted from {url}")
 
-        docs = [Document(page_content=json.dumps(extracted_data[key])) for key in extracted_data]
+    messages, other_tables = schema_from_tables(extracted_data, source=url)
+    docs = schema_documents(messages, other_tables)
+    progress(0.4, f"Embedding {len(docs)} chunks from {len(extracted_data)} tables")
 
-        if os.path.exists(request.index_path):
-            vectorstore = FAISS.load_local(request.index_path, embedding_model, allow_dangerous_deserialization=True)
+    # A private copy: the cached index is being searched by requests, and FAISS
+    # does not allow adding to an index while it is searched
+    vectorstore = None
+    if index_version(index_path) is not None:
+        vectorstore = FAISS.load_local(index_path, embedding_model, allow_dangerous_deserialization = True)
+    with stage_seconds.time("embed"):
+        if vectorstore is not None:
             vectorstore.add_documents(docs)
         else:
             vectorstore = FAISS.from_documents(docs, embedding_model)
 
-        vectorstore.save_local(request.index_path)
+    progress(0.9, "Saving index")
+    with stage_seconds.time("save_index"):
+        vectorstore.save_local(index_path)
+    # Swapped in whole; searches already running keep the old object
+    vectorstore_cache.put(index_path, vectorstore)
+    # Other workers see the new index version and stop using their entries
+    query_cache.invalidate(index_path)
+    return {"url": url, "documents": len(docs)}
 
-    return {"status": "updated", "message": f"Vectorstore updated with data from {url}"}
+@app.post("/api/vectorstore/update", status_code = 202, description = "Queue ingestion of the first URL found in the content")
+async def update_vectorstore(request: VectorstoreUpdateRequest):
+    url = find_url(request.content)
+    if not url or not flight_store.claim_url(url):
+        return {"status": "skipped", "message": "No new URL found. Vectorstore not updated."}
+
+    job_id = vectorstore_jobs.submit("vectorstore_update", ingest_url, url, request.index_path)
+    return {"status": "queued", "job_id": job_id, "message": f"Vectorstore update from {url} queued"}
+
+@app.get("/api/vectorstore/jobs/{job_id}", description = "Get the progress of a vectorstore update job")
+async def get_vectorstore_job(job_id: str):
+    job = vectorstore_jobs.get(job_id)
+    if job is None:
+        raise HTTPException(status_code = 404, detail="Job not found")
+    return job
+
+def get_lexical_index(index_path: str, vectorstore) -> LexicalIndex:
+    """Lexical index over the same documents the vector searches see, rebuilt when the FAISS index changes"""
+    version = index_version(index_path) if vectorstore is not None else None
+    entry = lexical_indexes.get(index_path)
+    if entry is None or entry[0] != version:
+        docs = list(schema_index.documents) if schema_index else []
+        if vectorstore is not None:
+            docs += list(vectorstore.docstore._dict.values())
+        entry = lexical_indexes[index_path] = (version, LexicalIndex(docs))
+    return entry[1]
+
+def search_vectorstore(index_path: str, content: str) -> str:
+    """Retrieved context for a question; loads indexes, embeds and searches, so it runs on the executor"""
+    with stage_seconds.time("vectorstore_get"):
+        vectorstore = vectorstore_cache.get(index_path)
+        lexical_index = get_lexical_index(index_path, vectorstore)
+    with search_seconds.time("lexical"):
+        relevant_docs, exact = lexical_index.search(content, k=5)
+    if exact:
+        # The question names a known field: answer without embedding it
+        query_stats["exact"] += 1
+    else:
+        query_stats["hybrid"] += 1
+        rankings = [relevant_docs]
+        if schema_index:
+            with search_seconds.time("schema"):
+                rankings.append(schema_index.similarity_search(content, k=5))
+        if vectorstore is not None:
+            # Includes embedding the question
+            with search_seconds.time("faiss"):
+                rankings.append(vectorstore.similarity_search(content, k=5))
+        relevant_docs = fuse(rankings, k=5)
+    return "\n\n".join([doc.page_content for doc in relevant_docs])
 
 @app.post("/api/vectorstore/query")
 async def query_vectorstore(request: VectorstoreQueryRequest):
-    if not os.path.exists(request.index_path):
-        return {"context": ""}
+    version = (index_version(request.index_path), schema_index.meta["built_at"] if schema_index else None)
+    cached = query_cache.get(request.index_path, request.content, version)
+    if cached is not None:
+        return {"context": cached}
 
-    vectorstore = FAISS.load_local(request.index_path, embedding_model, allow_dangerous_deserialization=True)
-    relevant_docs = vectorstore.similarity_search(request.content, k=5)
-    retrieved_context = "\n\n".join([doc.page_content for doc in relevant_docs])
+    loop = asyncio.get_event_loop()
+    retrieved_context = await loop.run_in_executor(executor, search_vectorstore, request.index_path, request.content)
+    query_cache.put(request.index_path, request.content, version, retrieved_context)
     return {"context": retrieved_context}
 
+@app.get("/api/vectorstore/stats", description = "Hit rate and load times of the resident index cache")
+async def vectorstore_stats():
+    return {**vectorstore_cache.stats(), "embeddings": embedding_store.stats(), "pages": page_cache.stats(), "queries": query_stats, "query_cache": query_cache.stats()}
+
+@app.get("/api/ingest/stats", description = "Queue depth, wait and run times of the file ingest scheduler")
+async def ingest_stats():
+    return ingest_scheduler.stats()
+
+@app.get("/metrics", include_in_schema = False)
+async def prometheus_metrics():
+    return Response(registry.render(), media_type = CONTENT_TYPE)
+
 @app.get("/health")
 async def health_check():
     return {"status": "healthy"}
@@ -49,3 +49,20 @@ class VectorstoreUpdateRequest(BaseModel):
 class VectorstoreQueryRequest(BaseModel):
     content: str
     index_path: str
+
+class FlightCondition(BaseModel):
+    field: str
+    op: str = Field(..., description="One of >, >=, <, <=, ==, !=")
+    value: float
+
+class FlightQueryRequest(BaseModel):
+    operation: str = Field("aggregate", description="describe, rows, aggregate, window or crossings")
+    message: Optional[str] = Field(None, description="Message type, e.g. GPS or ATT")
+    fields: Optional[List[str]] = None
+    start: Optional[float] = Field(None, description="Seconds from the start of the log")
+    end: Optional[float] = Field(None, description="Seconds from the start of the log")
+    filters: Optional[List[FlightCondition]] = None
+    aggregations: Optional[List[str]] = None
+    window_s: Optional[float] = None
+    threshold: Optional[FlightCondition] = None
+    limit: int = Field(100, ge=1, le=1000)
@@ -0,0 +1,125 @@
+import hashlib
+import json
+import os
+import threading
+import time
+from pathlib import Path
+from typing import Dict, Optional, Any
+import requests
+from requests.adapters import HTTPAdapter
+
+USER_AGENT = 'Mozilla/5.0 (Windows NT 10.0; Win64; x64) AppleWebKit/537.36'
+
+
+def _write_atomic(path: Path, data: bytes):
+    tmp = path.with_name(f".{path.name}.{os.getpid()}.{threading.get_ident()}.tmp")
+    with open(tmp, "wb") as f:
+        f.write(data)
+    os.replace(tmp, path)
+
+
+class PageCache:
+    """Fetched web pages on disk with their validators, keyed by URL.
+
+    Each entry is a directory named by the URL's hash holding the body,
+    a meta.json with the ETag/Last-Modified the server sent, and the tables
+    parsed from that body. Later fetches are conditional requests on a
+    pooled session; when the server answers 304 the stored body is reused,
+    and so are the parsed tables, which are keyed by the body's digest."""
+
+    def __init__(self, cache_dir, pool_size: int = 10, timeout: float = 30):
+        self.cache_dir = Path(cache_dir)
+        self.cache_dir.mkdir(parents=True, exist_ok=True)
+        self.timeout = timeout
+        self.session = requests.Session()
+        self.session.headers["User-Agent"] = USER_AGENT
+        adapter = HTTPAdapter(pool_connections=pool_size, pool_maxsize=pool_size)
+        self.session.mount("http://", adapter)
+        self.session.mount("https://", adapter)
+        self.fetched = 0
+        self.not_modified = 0
+        self.stale = 0
+        self.bytes_downloaded = 0
+
+    def _entry(self, url: str) -> Path:
+        return self.cache_dir / hashlib.sha256(url.encode("utf-8")).hexdigest()
+
+    def _load_meta(self, entry: Path) -> Optional[Dict[str, Any]]:
+        try:
+            with open(entry / "meta.json", encoding="utf-8") as f:
+                return json.load(f)
+        except (OSError, ValueError):
+            return None
+
+    def fetch(self, url: str) -> Dict[str, Any]:
+        """Body of url, revalidating a cached copy when there is one.
+
+        When the server cannot be reached or answers with a 5xx error, the
+        cached copy is returned with "stale": True. Without one this raises
+        requests.RequestException like requests.get would."""
+        entry = self._entry(url)
+        meta = self._load_meta(entry)
+        headers = {}
+        if meta is not None and (entry / "page").exists():
+            if meta.get("etag"):
+                headers["If-None-Match"] = meta["etag"]
+            if meta.get("last_modified"):
+                headers["If-Modified-Since"] = meta["last_modified"]
+
+        try:
+            response = self.session.get(url, headers=headers, timeout=self.timeout)
+            if response.status_code >= 500:
+                response.raise_for_status()
+        except requests.RequestException as e:
+            if not headers:
+                raise
+            print(f"Error revalidating {url}, using the cached copy: {e}")
+            self.stale += 1
+            return {**meta, "content": (entry / "page").read_bytes(), "not_modified": True, "stale": True}
+
+        if response.status_code == 304 and headers:
+            self.not_modified += 1
+            content = (entry / "page").read_bytes()
+            meta.update({"etag": response.headers.get("ETag", meta.get("etag")),
+                         "last_modified": response.headers.get("Last-Modified", meta.get("last_modified")),
+                         "validated_at": time.time()})
+            _write_atomic(entry / "meta.json", json.dumps(meta).encode("utf-8"))
+            return {**meta, "content": content, "not_modified": True}
+
+        response.raise_for_status()
+        self.fetched += 1
+        content = response.content
+        self.bytes_downloaded += len(content)
+        meta = {"url": url,
+                "digest": hashlib.sha256(content).hexdigest(),
+                "etag": response.headers.get("ETag"),
+                "last_modified": response.headers.get("Last-Modified"),
+                "validated_at": time.time()}
+        entry.mkdir(exist_ok=True)
+        # Body first: a meta.json is only ever paired with the body it describes
+        _write_atomic(entry / "page", content)
+        _write_atomic(entry / "meta.json", json.dumps(meta).encode("utf-8"))
+        return {**meta, "content": content, "not_modified": False}
+
+    def load_extracted(self, url: str, digest: str) -> Optional[Dict[str, Any]]:
+        """Tables parsed from the body with this digest, or None"""
+        try:
+            with open(self._entry(url) / "extracted.json", encoding="utf-8") as f:
+                extracted = json.load(f)
+        except (OSError, ValueError):
+            return None
+        return extracted["data"] if extracted.get("digest") == digest else None
+
+    def store_extracted(self, url: str, digest: str, data: Dict[str, Any]):
+        entry = self._entry(url)
+        entry.mkdir(exist_ok=True)
+        _write_atomic(entry / "extracted.json", json.dumps({"digest": digest, "data": data}, default=str).encode("utf-8"))
+
+    def stats(self) -> Dict[str, Any]:
+        return {"fetched": self.fetched,
+                "not_modified": self.not_modified,
+                "stale": self.stale,
+                "bytes_downloaded": self.bytes_downloaded}
+
+
+page_cache = PageCache(os.getenv("PAGE_CACHE_DIR", "files/pages"))
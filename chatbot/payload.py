@@ -0,0 +1,272 @@
+import gzip
+import io
+import json
+import os
+import threading
+from collections import OrderedDict
+from typing import Dict, List, Optional, Any, Tuple
+import numpy as np
+try:
+    import msgpack
+except ImportError:
+    msgpack = None
+try:
+    import pyarrow
+    import pyarrow.ipc
+except ImportError:
+    pyarrow = None
+from decoder import zstandard, _decode_text
+from analytics import QueryError, TIME_FIELDS, _log_start
+from summary import _seconds
+
+JSON = "application/json"
+MSGPACK = "application/msgpack"
+ARROW = "application/vnd.apache.arrow.stream"
+# Short names for the format query parameter, and other spellings clients send in Accept
+FORMAT_NAMES = {"json": JSON, "msgpack": MSGPACK, "arrow": ARROW}
+ALIASES = {"application/x-msgpack": MSGPACK, "application/vnd.apache.arrow.file": ARROW}
+# Rows per message type in one response; more are fetched with offset
+MAX_ROWS = int(os.getenv("CONTENT_MAX_ROWS", "100000"))
+# Smaller bodies are sent as they are
+MIN_COMPRESS_BYTES = 1024
+# Encoded bodies kept per worker; repeat requests from clients with the ETag get a 304 instead
+PAYLOAD_CACHE_BYTES = int(os.getenv("PAYLOAD_CACHE_BYTES", str(64 * 1024 * 1024)))
+GZIP_LEVEL = 6
+ZSTD_LEVEL = 3
+
+
+def formats() -> List[str]:
+    """Media types this server can encode, in order of preference for "*/*" """
+    return [JSON] + ([MSGPACK] if msgpack else []) + ([ARROW] if pyarrow else [])
+
+
+def _preferences(header: Optional[str]) -> List[Tuple[str, float]]:
+    """Values of an Accept or Accept-Encoding header with their q, best first"""
+    preferences = []
+    for i, part in enumerate((header or "").split(",")):
+        value, *params = [item.strip() for item in part.split(";")]
+        if not value:
+            continue
+        q = 1.0
+        for param in params:
+            if param.startswith("q="):
+                try:
+                    q = float(param[2:])
+                except ValueError:
+                    q = 0.0
+        preferences.append((-q, i, value.lower()))
+    return [(value, -q) for q, _, value in sorted(preferences)]
+
+
+def negotiate(accept: Optional[str]) -> Optional[str]:
+    """Media type for an Accept header (or a FORMAT_NAMES key); JSON when there is none, None if nothing fits"""
+    if not accept:
+        return JSON
+    if accept.lower() in FORMAT_NAMES:
+        media_type = FORMAT_NAMES[accept.lower()]
+        return media_type if media_type in formats() else None
+    for value, q in _preferences(accept):
+        if q <= 0:
+            continue
+        value = ALIASES.get(value, value)
+        if value in ("*/*", "application/*"):
+            return JSON
+        if value in formats():
+            return value
+    return None
+
+
+def choose_encoding(accept_encoding: Optional[str]) -> Optional[str]:
+    """"zstd" or "gzip" when the client accepts it (zstd first), else None for an uncompressed body"""
+    accepted = {value: q for value, q in _preferences(accept_encoding)}
+    for encoding in ("zstd", "gzip"):
+        if encoding == "zstd" and zstandard is None:
+            continue
+        if accepted.get(encoding, accepted.get("*", 0.0)) > 0:
+            return encoding
+    return None
+
+
+def select_columns(columns: Dict[str, Dict[str, np.ndarray]], messages: List[str], fields: Optional[List[str]] = None,
+                   start: Optional[float] = None, end: Optional[float] = None, offset: int = 0,
+                   limit: int = MAX_ROWS, t0: Optional[float] = None) -> Tuple[Dict[str, Dict[str, np.ndarray]], Dict[str, Any]]:
+    """One page of rows of each message type, as views of the cached columns.
+
+    Rows are first restricted to [start, end] in seconds from the start of
+    the log, then rows offset to offset + limit of what is left are taken.
+    Each message type gets a "t" column (seconds from the start of the log)
+    in place of its raw time fields. The returned meta has, per message
+    type, the rows in the window ("total") and the offset of the next page
+    ("next_offset", None on the last one). t0 is the start of the log when
+    columns hold only a window of it."""
+    t0 = _log_start(columns) if t0 is None else t0
+    limit = max(0, min(limit, MAX_ROWS))
+    offset = max(0, offset)
+    selected, meta = {}, {}
+    for message in messages:
+        if message not in columns:
+            raise QueryError(f"No {message} messages in this log; available: {', '.join(sorted(columns))}")
+        message_fields = columns[message]
+        names = fields or [name for name in message_fields if name not in TIME_FIELDS]
+        missing = [name for name in names if name not in message_fields]
+        if fields and len(missing) == len(names):
+            raise QueryError(f"{message} has none of the fields {', '.join(fields)}; fields are {', '.join(message_fields)}")
+        names = [name for name in names if name not in missing]
+        times = _seconds(message_fields)
+        count = len(next(iter(message_fields.values()))) if message_fields else 0
+
+        lo, hi = 0, count
+        if times is not None:
+            times = times - t0
+            if start is not None:
+                lo = int(np.searchsorted(times, start, side="left"))
+            if end is not None:
+                hi = int(np.searchsorted(times, end, side="right"))
+        total = max(0, hi - lo)
+        first, last = lo + min(offset, total), lo + min(offset + limit, total)
+        page = {"t": times[first:last]} if times is not None else {}
+        page.update({name: message_fields[name][first:last] for name in names})
+        selected[message] = page
+        meta[message] = {"total": total, "offset": offset, "rows": last - first,
+                         "next_offset": offset + (last - first) if last - lo < total else None}
+    return selected, {"log_start": t0, "messages": meta}
+
+
+def _text_column(values: np.ndarray) -> List[str]:
+    return [_decode_text(v) for v in values.tolist()]
+
+
+def _plain(value):
+    """JSON/msgpack fallback for the arrays inside tlog object columns"""
+    if isinstance(value, np.ndarray):
+        return value.tolist()
+    if isinstance(value, np.generic):
+        return value.item()
+    if isinstance(value, bytes):
+        return _decode_text(value)
+    return str(value)
+
+
+def _json_column(values: np.ndarray) -> List[Any]:
+    if values.dtype.kind == "S":
+        return _text_column(values)
+    if values.dtype.kind == "f" and not np.isfinite(values).all():
+        # NaN and infinities are not JSON
+        return [v if np.isfinite(v) else None for v in values.tolist()]
+    return values.tolist()
+
+
+def _msgpack_column(values: np.ndarray) -> Any:
+    """Numeric columns as their raw little-endian bytes, which clients view as typed arrays"""
+    if values.dtype.kind == "S":
+        return _text_column(values)
+    if values.dtype.kind in "biuf":
+        values = np.ascontiguousarray(values, dtype=values.dtype.newbyteorder("<"))
+        column = {"dtype": values.dtype.str, "length": len(values), "data": values.tobytes()}
+        if values.ndim > 1:
+            # Rows of fixed-size arrays, row-major
+            column["shape"] = list(values.shape)
+        return column
+    return values.tolist()
+
+
+def _arrow_array(name: str, values: np.ndarray):
+    """Arrow array of a column; 2-D columns (DataFlash "a" arrays) become fixed-size lists"""
+    if values.dtype.kind == "S":
+        return pyarrow.array(_text_column(values))
+    if values.ndim == 2:
+        flat = pyarrow.array(np.ascontiguousarray(values).reshape(-1))
+        return pyarrow.FixedSizeListArray.from_arrays(flat, values.shape[1])
+    if values.ndim > 2:
+        raise QueryError(f"{name} has {values.ndim} dimensions; request it as JSON or msgpack")
+    try:
+        return pyarrow.array([_plain(v) for v in values] if values.dtype.kind == "O" else values)
+    except pyarrow.ArrowException as e:
+        raise QueryError(f"{name} cannot be encoded as Arrow ({str(e)}); request it as JSON or msgpack")
+
+
+def _arrow_stream(message: str, page: Dict[str, np.ndarray], meta: Dict[str, Any]) -> bytes:
+    arrays = [_arrow_array(name, values) for name, values in page.items()]
+    schema_meta = {"message": message, "meta": json.dumps(meta)}
+    table = pyarrow.Table.from_arrays(arrays, names=list(page), metadata=schema_meta)
+    sink = io.BytesIO()
+    with pyarrow.ipc.new_stream(sink, table.schema) as writer:
+        writer.write_table(table)
+    return sink.getvalue()
+
+
+def encode(selected: Dict[str, Dict[str, np.ndarray]], meta: Dict[str, Any], media_type: str) -> bytes:
+    """Columnar body: {"meta", "messages": {message: {field: column}}} in JSON or msgpack,
+    or an Arrow IPC stream of one message type with meta in the schema metadata"""
+    if media_type == ARROW:
+        if len(selected) != 1:
+            raise QueryError("Arrow responses hold one message type; request them one at a time")
+        message, page = next(iter(selected.items()))
+        return _arrow_stream(message, page, meta)
+    if media_type == MSGPACK:
+        return msgpack.packb({"meta": meta,
+                              "messages": {message: {name: _msgpack_column(values) for name, values in page.items()}
+                                           for message, page in selected.items()}},
+                             use_bin_type=True, default=_plain)
+    return json.dumps({"meta": meta,
+                       "messages": {message: {name: _json_column(values) for name, values in page.items()}
+                                    for message, page in selected.items()}},
+                      default=_plain).encode("utf-8")
+
+
+def compress(body: bytes, encoding: Optional[str]) -> Tuple[bytes, Optional[str]]:
+    """(body, Content-Encoding) with the body compressed when that is worth it"""
+    if encoding is None or len(body) < MIN_COMPRESS_BYTES:
+        return body, None
+    if encoding == "zstd":
+        return zstandard.ZstdCompressor(level=ZSTD_LEVEL).compress(body), encoding
+    return gzip.compress(body, compresslevel=GZIP_LEVEL, mtime=0), encoding
+
+
+class PayloadCache:
+    """Encoded response bodies by request key, evicted in LRU order beyond max_bytes.
+
+    A body larger than a quarter of max_bytes is not kept, so one large page
+    cannot flush every other entry."""
+
+    def __init__(self, max_bytes: int):
+        self.max_bytes = max_bytes
+        self.entries: "OrderedDict[Any, Tuple[bytes, Optional[str]]]" = OrderedDict()
+        self.bytes = 0
+        self.lock = threading.Lock()
+        self.hits = 0
+        self.misses = 0
+
+    def get(self, key) -> Optional[Tuple[bytes, Optional[str]]]:
+        with self.lock:
+            entry = self.entries.get(key)
+            if entry is None:
+                self.misses += 1
+                return None
+            self.entries.move_to_end(key)
+            self.hits += 1
+            return entry
+
+    def put(self, key, body: bytes, encoding: Optional[str]):
+        if len(body) > self.max_bytes // 4:
+            return
+        with self.lock:
+            if key in self.entries:
+                return
+            self.entries[key] = (body, encoding)
+            self.bytes += len(body)
+            while self.bytes > self.max_bytes:
+                _, (evicted, _) = self.entries.popitem(last=False)
+                self.bytes -= len(evicted)
+
+    def stats(self) -> Dict[str, Any]:
+        lookups = self.hits + self.misses
+        return {"entries": len(self.entries),
+                "bytes": self.bytes,
+                "max_bytes": self.max_bytes,
+                "hits": self.hits,
+                "misses": self.misses,
+                "hit_rate": self.hits / lookups if lookups else 0.0}
+
+
+payload_cache = PayloadCache(PAYLOAD_CACHE_BYTES)
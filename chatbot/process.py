@@ -3,35 +3,121 @@ from langchain_community.document_loaders import WebBaseLoader
 from langchain.text_splitter import RecursiveCharacterTextSplitter
 from langchain.vectorstores import FAISS
 from pymavlink import mavutil
-from concurrent.futures import ThreadPoolExecutor
-from bs4 import BeautifulSoup
+from bs4 import BeautifulSoup, UnicodeDammit
 import pandas as pd
 import json
-from typing import Dict, List, Optional, Any
+import os
+from typing import Dict, List, Optional, Any, Tuple
 import re
 from collections import defaultdict
+from functools import lru_cache
+from itertools import islice
 import requests
+try:
+    import lxml
+    from lxml import etree
+except ImportError:
+    lxml = None
+from decoder import read_columns, read_time_range, columns_to_records, columns_to_json, seek_index_path
+from logcache import log_cache
+from pagecache import page_cache
+from summary import summarize_flight, build_flight_context
+from store import create_flight_store
+from jobs import Cancelled, CountingExecutor
+from metrics import registry
+from analytics import QueryError, window_columns
+from payload import select_columns, encode, compress, payload_cache
 
-executor = ThreadPoolExecutor(max_workers=4)
+# Shared by the API for short blocking work (status content, flight queries); ingest has its own scheduler
+executor = CountingExecutor(max_workers=int(os.getenv("API_WORKERS", "4")))
+# source is "decode" for a full decode, "window" for a time-range read and "cache" for a log cache load
+decode_seconds = registry.histogram("decode_seconds", "Wall time of reading a log's columns", ("source",))
+decode_messages = registry.counter("decode_messages_total", "Messages read from logs", ("source",))
+decode_rate = registry.gauge("decode_messages_per_second", "Throughput of the latest read of a log", ("source",))
+
+def record_decode(stats, source):
+    seconds = stats["load_seconds"] if source == "cache" else stats["seconds"]
+    decode_seconds.observe(seconds, source)
+    decode_messages.inc(stats["messages"], source)
+    decode_rate.set(stats["messages"] / seconds if seconds > 0 else 0.0, source)
 
 def read_data(file_path, msg_types):    
+    """GPS records of a log as JSON (msg_types are the types decoded)"""
     try:
-        mlog = mavutil.mavlink_connection(file_path)
-        data_collectors = defaultdict(list)
+        columns, stats = read_columns(file_path, msg_types)
+        record_decode(stats, "decode")
+        print(f"Decoded {stats['messages']} messages in {stats['seconds']:.2f}s ({stats['msgs_per_sec']:.0f} msg/s)")
+        return columns_to_json(columns, "GPS")
         
-        while True:
-            msg = mlog.recv_match(type = msg_types)
-            if msg is None:
-                break
-                
-            msg_type = msg.get_type()
-            data_collectors[msg_type].append(msg.to_dict())
-            
-        return json.dumps(data_collectors["GPS"])
+    except Exception as e:
+        print(f"Error reading MAVLink file: {str(e)}")
+        return ""
+
+def read_window(file_path, msg_types=None, start=None, end=None):
+    """Records of msg_types (all types if None) between start and end, in seconds
+    from the start of the log, as JSON keyed by message type.
+
+    Only that window is decoded, seeking through the log's seek index when it has one."""
+    try:
+        columns, stats = read_time_range(file_path, msg_types, start, end)
+        record_decode(stats, "window")
+        print(f"Decoded {stats['messages']} messages in {stats['seconds']:.2f}s ({stats['msgs_per_sec']:.0f} msg/s)")
+        return json.dumps({msg_type: columns_to_records(fields, msg_type) for msg_type, fields in columns.items()})
+        
+    except Exception as e:
+        print(f"Error reading MAVLink file: {str(e)}")
+        return ""
+
+def read_flight_data(file_path, digest=None, progress=None):
+    """Decode every message type of a log into columns, reusing the on-disk cache"""
+    try:
+        columns, stats = log_cache.read_columns(file_path, digest, progress)
+        record_decode(stats, "cache" if stats.get("cache_hit") else "decode")
+        if stats.get("cache_hit"):
+            print(f"Loaded {stats['messages']} cached messages in {stats['load_seconds']:.2f}s")
+        else:
+            print(f"Decoded {stats['messages']} messages in {stats['seconds']:.2f}s ({stats['msgs_per_sec']:.0f} msg/s)")
+        return columns, stats, summarize_flight(columns, stats)
         
+    except Cancelled:
+        raise
     except Exception as e:
         print(f"Error reading MAVLink file: {str(e)}")
+        return {}, {}, {}
+
+@lru_cache(maxsize=8)
+def _flight_content(digest):
+    cached = log_cache.load(digest)
+    if cached is None:
+        # Raised rather than returned, so lru_cache does not remember the miss
+        raise KeyError(digest)
+    return columns_to_json(cached[0], "GPS")
+
+def read_flight_content(digest):
+    """GPS records of a cached log as JSON, built once per worker; "" while the log is not cached"""
+    try:
+        return _flight_content(digest)
+    except KeyError:
         return ""
+
+def read_flight_payload(digest, messages, fields, start, end, offset, limit, media_type, encoding, file_path=None):
+    """One page of a cached log's columns, encoded as media_type and compressed; returns (body, content encoding).
+
+    Recent bodies are kept in payload_cache, bounded by bytes. A time-bounded
+    page of a log evicted from the log cache is decoded from file_path through its seek index."""
+    key = (digest, messages, fields, start, end, offset, limit, media_type, encoding)
+    payload = payload_cache.get(key)
+    if payload is not None:
+        return payload
+    cached = log_cache.load(digest)
+    if cached is None:
+        columns, t0 = window_columns(file_path, list(messages), start, end)
+    else:
+        columns, t0 = cached[0], None
+    selected, meta = select_columns(columns, list(messages), list(fields) if fields else None, start, end, offset, limit, t0)
+    body, content_encoding = compress(encode(selected, meta, media_type), encoding)
+    payload_cache.put(key, body, content_encoding)
+    return body, content_encoding
     
 def convert_role(langchain_role):
     role_mapping = {"human": "user",
@@ -42,40 +128,182 @@ def convert_role(langchain_role):
     
     return role_mapping.get(langchain_role, "user")  
 
+HEADER_TAGS = ('h1', 'h2', 'h3', 'h4', 'h5', 'h6')
+# Strings bs4 leaves out of get_text()
+SKIPPED_TEXT_TAGS = ('script', 'style', 'template')
+
+
+class LxmlDocument:
+    """Table-extraction view of a page parsed directly with lxml.
+
+    Sibling lists include the text between elements (the parent's text and
+    each element's tail) so distances count nodes the same way bs4 does.
+    Texts, sibling lists and row contents are computed once per node.
+
+    On malformed markup the two parsers build different trees: lxml closes a
+    <p> left open before a <table>, where html.parser nests the table inside
+    it, so such a table gets its header context here but not in SoupDocument."""
+
+    def __init__(self, markup: str):
+        self.root = etree.HTML(markup)
+        self.texts = {}
+        self.children = {}
+
+    def tables(self) -> List[Any]:
+        return list(self.root.iter('table')) if self.root is not None else []
+
+    def attributes(self, table):
+        table_class = table.get('class')
+        return table.get('id'), table_class.split() if table_class is not None else None
+
+    def caption(self, table) -> Optional[str]:
+        caption = next(table.iter('caption'), None)
+        return self.text(caption) if caption is not None else None
+
+    def text(self, element) -> str:
+        """Same as bs4's get_text(strip=True)"""
+        text = self.texts.get(element)
+        if text is None:
+            parts = []
+            self._collect_text(element, parts)
+            text = self.texts[element] = ''.join(part.strip() for part in parts)
+        return text
+
+    def _collect_text(self, element, parts: List[str]):
+        if element.text and element.tag not in SKIPPED_TEXT_TAGS:
+            parts.append(element.text)
+        for child in element:
+            if isinstance(child.tag, str):
+                self._collect_text(child, parts)
+            if child.tail:
+                parts.append(child.tail)
+
+    def _siblings(self, element):
+        """(nodes of the parent as (tag or None, element), index of element)"""
+        parent = element.getparent()
+        entry = self.children.get(parent)
+        if entry is None:
+            nodes, positions = [], {}
+            if parent.text:
+                nodes.append((None, None))
+            for child in parent:
+                positions[child] = len(nodes)
+                nodes.append((child.tag if isinstance(child.tag, str) else None, child))
+                if child.tail:
+                    nodes.append((None, None))
+            entry = self.children[parent] = (nodes, positions)
+        nodes, positions = entry
+        return nodes, positions[element]
+
+    def previous_siblings(self, element):
+        nodes, index = self._siblings(element)
+        return reversed(nodes[:index])
+
+    def next_siblings(self, element):
+        nodes, index = self._siblings(element)
+        return iter(nodes[index + 1:])
+
+    def preceding_blocks(self, element):
+        """p/div/span children of the element's parent that come before it.
+
+        Compared by position. The earlier 'table in sibling.previous_siblings'
+        test used bs4's structural equality, so it also skipped blocks that only
+        follow an identical earlier table; those now count for the later one."""
+        nodes, index = self._siblings(element)
+        return [(name, node) for name, node in nodes[:index] if name in ('p', 'div', 'span')]
+
+    def rows(self, table) -> List[Tuple[List[str], bool]]:
+        """(cell texts, has a th cell) for every tr in the table, nested tables included"""
+        rows = []
+        for row in table.iter('tr'):
+            cells = list(row.iter('th', 'td'))
+            rows.append(([self.text(cell) for cell in cells], any(cell.tag == 'th' for cell in cells)))
+        return rows
+
+
+class SoupDocument(LxmlDocument):
+    """The same view over a BeautifulSoup tree, used when lxml is not installed"""
+
+    def __init__(self, markup):
+        self.soup = BeautifulSoup(markup, 'html.parser')
+        self.texts = {}
+        self.children = {}
+
+    def tables(self) -> List[Any]:
+        return self.soup.find_all('table')
+
+    def attributes(self, table):
+        return table.get('id'), table.get('class')
+
+    def caption(self, table) -> Optional[str]:
+        caption = table.find('caption')
+        return self.text(caption) if caption else None
+
+    def text(self, element) -> str:
+        text = self.texts.get(id(element))
+        if text is None:
+            text = self.texts[id(element)] = element.get_text(strip=True)
+        return text
+
+    def _siblings(self, element):
+        parent = element.parent
+        entry = self.children.get(id(parent))
+        if entry is None:
+            nodes = [(child.name, child) for child in parent.contents]
+            positions = {id(child): i for i, child in enumerate(parent.contents)}
+            entry = self.children[id(parent)] = (nodes, positions)
+        nodes, positions = entry
+        return nodes, positions[id(element)]
+
+    def rows(self, table) -> List[Tuple[List[str], bool]]:
+        rows = []
+        for row in table.find_all('tr'):
+            cells = row.find_all(['th', 'td'])
+            rows.append(([self.text(cell) for cell in cells], any(cell.name == 'th' for cell in cells)))
+        return rows
+
+
 class DynamicTableParser:
     def __init__(self, url: str):
         self.url = url
-        self.soup = None
+        self.document = None
+        self.page = None
         self.extracted_data = {}
     
     def fetch_page(self) -> bool:
-        """Fetch the webpage content"""
+        """Fetch the webpage content, revalidating the cached copy if there is one"""
         try:
-            headers = {
-                'User-Agent': 'Mozilla/5.0 (Windows NT 10.0; Win64; x64) AppleWebKit/537.36'
-            }
-            response = requests.get(self.url, headers=headers, timeout=30)
-            response.raise_for_status()
-            self.soup = BeautifulSoup(response.content, 'html.parser')
+            self.page = page_cache.fetch(self.url)
+            self.load_html(self.page['content'])
             return True
         except requests.RequestException as e:
             print(f"Error fetching page: {e}")
             return False
+
+    def load_html(self, content: bytes):
+        """Parse page content, with lxml when it is installed"""
+        if lxml is None:
+            self.document = SoupDocument(content)
+        else:
+            # Decode the way bs4 would; lxml would assume latin-1 for pages without a charset
+            self.document = LxmlDocument(UnicodeDammit(content, is_html=True).unicode_markup)
     
     def find_all_tables(self) -> List[Dict[str, Any]]:
         """Find and catalog all tables on the page with their context"""
-        if not self.soup:
+        if not self.document:
             return []
         
         tables_info = []
-        tables = self.soup.find_all('table')
+        tables = self.document.tables()
         
         for i, table in enumerate(tables):
+            rows = self.document.rows(table)
             table_info = {
                 'index': i,
                 'table_element': table,
+                'rows': rows,
                 'context': self._get_table_context(table),
-                'structure': self._analyze_table_structure(table),
+                'structure': self._analyze_table_structure(rows),
                 'data': None
             }
             tables_info.append(table_info)
@@ -84,6 +312,7 @@ class DynamicTableParser:
     
     def _get_table_context(self, table) -> Dict[str, Any]:
         """Extract context around the table (headers, captions, nearby text)"""
+        document = self.document
         context = {
             'preceding_headers': [],
             'following_descriptions': [],
@@ -96,85 +325,63 @@ class DynamicTableParser:
         }
         
         # Get table attributes
-        context['table_id'] = table.get('id')
-        context['table_class'] = table.get('class')
+        context['table_id'], context['table_class'] = document.attributes(table)
         
         # Get caption
-        caption = table.find('caption')
-        if caption:
-            context['caption'] = caption.get_text(strip=True)
-        
-        # Look for preceding headers (h1-h6) and context
-        current = table.previous_sibling
-        header_distance = 0
-        while current and header_distance < 5:
-            if hasattr(current, 'name'):
-                if current.name in ['h1', 'h2', 'h3', 'h4', 'h5', 'h6']:
-                    header_text = current.get_text(strip=True)
-                    if header_text:
-                        context['preceding_headers'].append({
-                            'level': current.name,
-                            'text': header_text,
-                            'distance': header_distance
-                        })
-                        if header_distance <= 2 and not context['section_title']:
-                            context['section_title'] = header_text
-                elif current.name in ['p', 'div', 'span']:
-                    text = current.get_text(strip=True)
-                    if text and len(text) < 200:
-                        context['nearby_text'].append(text)
-            current = current.previous_sibling
-            header_distance += 1
+        context['caption'] = document.caption(table)
+        
+        # Look for preceding headers (h1-h6) and context; text nodes count towards the distance
+        for header_distance, (name, current) in enumerate(islice(document.previous_siblings(table), 5)):
+            if name in HEADER_TAGS:
+                header_text = document.text(current)
+                if header_text:
+                    context['preceding_headers'].append({
+                        'level': name,
+                        'text': header_text,
+                        'distance': header_distance
+                    })
+                    if header_distance <= 2 and not context['section_title']:
+                        context['section_title'] = header_text
+            elif name in ['p', 'div', 'span']:
+                text = document.text(current)
+                if text and len(text) < 200:
+                    context['nearby_text'].append(text)
         
         # Look for following descriptions/explanations
-        current = table.next_sibling
-        desc_distance = 0
-        while current and desc_distance < 5:
-            if hasattr(current, 'name'):
-                if current.name in ['p', 'div', 'span', 'small', 'em', 'i']:
-                    text = current.get_text(strip=True)
-                    if text and len(text) > 10:  # Meaningful description
-                        context['following_descriptions'].append({
-                            'text': text,
-                            'distance': desc_distance,
-                            'tag': current.name
-                        })
-                        # Use the first substantial description as the main description
-                        if not context['table_description'] and len(text) > 20:
-                            context['table_description'] = text
-                elif current.name in ['h1', 'h2', 'h3', 'h4', 'h5', 'h6', 'table']:
-                    # Stop if we hit another major element
-                    break
-            current = current.next_sibling
-            desc_distance += 1
-        
-        # Also check for descriptions in parent/sibling containers
-        parent = table.parent
-        if parent:
-            # Look for description in same container after the table
-            for sibling in parent.find_all(['p', 'div', 'span'], recursive=False):
-                if sibling.get_text(strip=True) and len(sibling.get_text(strip=True)) > 20:
-                    # Check if this comes after the table
-                    try:
-                        if table in sibling.previous_siblings or table.parent in sibling.previous_siblings:
-                            continue
-                        text = sibling.get_text(strip=True)
-                        if text not in [desc['text'] for desc in context['following_descriptions']]:
-                            context['following_descriptions'].append({
-                                'text': text,
-                                'distance': 999,  # Mark as container-level
-                                'tag': sibling.name
-                            })
-                            if not context['table_description']:
-                                context['table_description'] = text
-                    except:
-                        pass
+        for desc_distance, (name, current) in enumerate(islice(document.next_siblings(table), 5)):
+            if name in ['p', 'div', 'span', 'small', 'em', 'i']:
+                text = document.text(current)
+                if text and len(text) > 10:  # Meaningful description
+                    context['following_descriptions'].append({
+                        'text': text,
+                        'distance': desc_distance,
+                        'tag': name
+                    })
+                    # Use the first substantial description as the main description
+                    if not context['table_description'] and len(text) > 20:
+                        context['table_description'] = text
+            elif name in HEADER_TAGS or name == 'table':
+                # Stop if we hit another major element
+                break
+        
+        # Also check for descriptions in the same container, before the table
+        seen = {desc['text'] for desc in context['following_descriptions']}
+        for name, sibling in document.preceding_blocks(table):
+            text = document.text(sibling)
+            if len(text) > 20 and text not in seen:
+                seen.add(text)
+                context['following_descriptions'].append({
+                    'text': text,
+                    'distance': 999,  # Mark as container-level
+                    'tag': name
+                })
+                if not context['table_description']:
+                    context['table_description'] = text
         
         return context
     
-    def _analyze_table_structure(self, table) -> Dict[str, Any]:
-        """Analyze the structure of the table"""
-        rows = table.find_all('tr')
+    def _analyze_table_structure(self, rows: List[Tuple[List[str], bool]]) -> Dict[str, Any]:
+        """Analyze the structure of the table from its (cell texts, has th) rows"""
         if not rows:
             return {'valid': False, 'reason': 'No rows found'}
         
@@ -190,23 +397,21 @@ class DynamicTableParser:
         }
         
         # Analyze potential header row
-        for i, row in enumerate(rows[:3]):  # Check first 3 rows for headers
-            cells = row.find_all(['th', 'td'])
-            if not cells:
+        for i, (cell_texts, has_th) in enumerate(rows[:3]):  # Check first 3 rows for headers
+            if not cell_texts:
                 continue
                 
             # Check if this row looks like a header
-            is_header = self._is_likely_header_row(row, cells)
-            if is_header and not structure['has_header']:
+            if self._is_likely_header_row(cell_texts, has_th):
                 structure['has_header'] = True
                 structure['header_row_index'] = i
-                structure['columns'] = [cell.get_text(strip=True) for cell in cells]
-                structure['column_count'] = len(cells)
+                structure['columns'] = list(cell_texts)
+                structure['column_count'] = len(cell_texts)
                 break
         
         # If no clear header found, use first row
-        if not structure['has_header'] and rows:
-            first_row_cells = rows[0].find_all(['th', 'td'])
+        if not structure['has_header']:
+            first_row_cells = rows[0][0]
             if first_row_cells:
                 structure['columns'] = [f"column_{j+1}" for j in range(len(first_row_cells))]
                 structure['column_count'] = len(first_row_cells)
@@ -218,15 +423,12 @@ class DynamicTableParser:
         
         return structure
     
-    def _is_likely_header_row(self, row, cells) -> bool:
+    def _is_likely_header_row(self, cell_texts: List[str], has_th: bool) -> bool:
         """Determine if a row is likely a header row"""
         # Check for th tags
-        if row.find_all('th'):
+        if has_th:
             return True
         
-        # Check if text looks like headers (short, descriptive)
-        cell_texts = [cell.get_text(strip=True) for cell in cells]
-        
         # Headers usually don't contain only numbers
         numeric_cells = sum(1 for text in cell_texts if self._is_numeric(text))
         if numeric_cells == len(cell_texts) and len(cell_texts) > 1:
@@ -248,11 +450,9 @@ class DynamicTableParser:
     def _extract_sample_data(self, data_rows: List, column_count: int, sample_size: int = 5) -> List[List[str]]:
         """Extract sample data rows for analysis"""
         samples = []
-        for row in data_rows[:sample_size]:
-            cells = row.find_all(['td', 'th'])
-            if len(cells) == column_count:
-                row_data = [cell.get_text(strip=True) for cell in cells]
-                samples.append(row_data)
+        for cell_texts, _ in data_rows[:sample_size]:
+            if len(cell_texts) == column_count:
+                samples.append(list(cell_texts))
         return samples
     
     def _infer_column_types(self, sample_data: List[List[str]], columns: List[str]) -> Dict[str, str]:
@@ -321,23 +521,22 @@ class DynamicTableParser:
     
     def parse_table(self, table_info: Dict[str, Any]) -> List[Dict[str, Any]]:
         """Parse a single table into structured data"""
-        table = table_info['table_element']
         structure = table_info['structure']
         
         if not structure['valid']:
             return []
         
-        rows = table.find_all('tr')
+        rows = table_info.get('rows')
+        if rows is None:
+            rows = self.document.rows(table_info['table_element'])
         data_start = (structure['header_row_index'] + 1) if structure['has_header'] else 0
         
         parsed_data = []
-        for row in rows[data_start:]:
-            cells = row.find_all(['td', 'th'])
-            if len(cells) == structure['column_count']:
+        for cell_texts, _ in rows[data_start:]:
+            if len(cell_texts) == structure['column_count']:
                 row_dict = {}
-                for i, cell in enumerate(cells):
+                for i, cell_value in enumerate(cell_texts):
                     column_name = structure['columns'][i] if i < len(structure['columns']) else f"column_{i+1}"
-                    cell_value = cell.get_text(strip=True)
                     
                     # Convert based on inferred type
                     if column_name in structure['data_types']:
@@ -367,10 +566,17 @@ class DynamicTableParser:
     
     def extract_all_data(self) -> Dict[str, Any]:
         """Extract all table data from the webpage"""
-        if not self.soup:
+        if not self.document:
             if not self.fetch_page():
                 return {}
         
+        if self.page:
+            # Unchanged page (304 or identical body): reuse the tables parsed last time
+            cached = page_cache.load_extracted(self.url, self.page['digest'])
+            if cached is not None:
+                self.extracted_data = cached
+                return cached
+        
         tables_info = self.find_all_tables()
         extracted_data = {}
         
@@ -393,6 +599,8 @@ class DynamicTableParser:
                 }
         
         self.extracted_data = extracted_data
+        if self.page:
+            page_cache.store_extracted(self.url, self.page['digest'], extracted_data)
         return extracted_data
     
     def _generate_table_name(self, table_info: Dict[str, Any]) -> str:
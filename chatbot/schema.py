@@ -0,0 +1,136 @@
+import re
+from typing import Dict, List, Optional, Any, Tuple
+from langchain.docstore.document import Document
+from langchain.text_splitter import RecursiveCharacterTextSplitter
+
+# Documents longer than this (mostly fields with long enum lists) are split
+CHUNK_SIZE = 1000
+MESSAGE_NAME = re.compile(r"[A-Z][A-Z0-9_]{0,15}$")
+FIELD_NAME = re.compile(r"[A-Za-z_][A-Za-z0-9_]*$")
+# First cell of a real header row in a field table
+HEADER_NAMES = {"name", "field", "fieldname", "field name"}
+
+splitter = RecursiveCharacterTextSplitter(chunk_size=CHUNK_SIZE, chunk_overlap=0)
+
+
+def _cell(value) -> str:
+    return "" if value is None else str(value).strip()
+
+
+def _first_line(text: Optional[str]) -> str:
+    return (text or "").strip().split("\n")[0].strip()
+
+
+def _table_rows(table: Dict[str, Any]) -> Tuple[List[str], List[List[str]], Dict[str, Any]]:
+    """(columns, rows as cell strings, context) for a table from extract_all_data or save_to_json"""
+    metadata = table["metadata"]
+    context = metadata.get("context") or metadata.get("full_context") or {}
+    columns = metadata.get("columns") or metadata.get("structure", {}).get("columns", [])
+    rows = [[_cell(row.get(column)) for column in columns] for row in table["data"]]
+    return columns, rows, context
+
+
+def _with_header_row(columns: List[str], rows: List[List[str]]) -> List[List[str]]:
+    # The log-message tables have no <th>, so their first field row was taken as the header
+    if not columns or columns[0].startswith("column_"):
+        return rows
+    return [[_cell(column) for column in columns]] + rows
+
+
+def schema_from_tables(extracted: Dict[str, Any], source: Optional[str] = None) -> Tuple[Dict[str, Dict[str, Any]], Dict[str, Dict[str, Any]]]:
+    """Split extracted tables into log-message schemas and any other tables.
+
+    A message is a three-column (field, units, description) table named like
+    a log message. The enum tables nested in its rows come out as unnamed
+    tables right after it; their values are attached to the field whose
+    description they repeat, and their rows are removed from the message's
+    fields. Returns ({message: schema}, {table name: {"columns", "rows"}})."""
+    messages: Dict[str, Dict[str, Any]] = {}
+    other_tables: Dict[str, Dict[str, Any]] = {}
+    enums: Dict[str, List[Dict[str, Any]]] = {}
+    current = None
+    for table_name, table in extracted.items():
+        columns, rows, context = _table_rows(table)
+        description = _first_line(context.get("table_description"))
+        if len(columns) == 3 and current is not None and not context.get("preceding_headers"):
+            values = [row for row in _with_header_row(columns, rows) if row[0]]
+            enums[current].append({"description": description, "values": values, "table": table_name})
+            continue
+        if len(columns) == 3 and MESSAGE_NAME.match(table_name):
+            current = table_name
+            enums[current] = []
+            messages[table_name] = {"description": description,
+                                    "table": table_name,
+                                    "source": source,
+                                    "rows": _with_header_row(columns, rows)}
+        else:
+            current = None
+            other_tables[table_name] = {"description": description, "source": source, "columns": columns, "rows": rows}
+
+    for name, message in messages.items():
+        enum_rows = {(row[0], row[1]) for enum in enums[name] for row in enum["values"]}
+        fields = {}
+        for field, units, description in message.pop("rows"):
+            if not FIELD_NAME.match(field) or field.lower() in HEADER_NAMES or (field, units) in enum_rows:
+                continue
+            if units.lstrip("-").isdigit():
+                # An enum row whose own table lost it; units are never bare integers
+                continue
+            fields.setdefault(field, {"units": units, "description": description, "values": []})
+        unattached = []
+        for enum in enums[name]:
+            owner = next((f for f in fields.values() if f["description"] and f["description"] == enum["description"]), None)
+            if owner is not None:
+                owner["values"].extend(enum["values"])
+            else:
+                unattached.append(enum)
+        message["fields"] = fields
+        message["values"] = unattached
+    return messages, other_tables
+
+
+def _format_values(values: List[List[str]]) -> str:
+    return "; ".join(f"{name}={value}" + (f" ({description})" if description else "") for name, value, description in values)
+
+
+def _documents(text: str, metadata: Dict[str, Any]) -> List[Document]:
+    if len(text) <= CHUNK_SIZE:
+        return [Document(page_content=text, metadata=metadata)]
+    return [Document(page_content=chunk, metadata={**metadata, "chunk": i})
+            for i, chunk in enumerate(splitter.split_text(text))]
+
+
+def field_text(message: str, field: str, schema: Dict[str, Any], message_description: str = "") -> str:
+    """Text of a field document, e.g. "GPS.Spd (m/s): ground speed" plus its message and enum values"""
+    units = f" ({schema['units']})" if schema.get("units") else ""
+    text = f"{message}.{field}{units}: {schema.get('description', '')}"
+    if message_description:
+        text += f"\n{message}: {message_description}"
+    if schema.get("values"):
+        text += f"\nValues: {_format_values(schema['values'])}"
+    return text
+
+
+def schema_documents(messages: Dict[str, Dict[str, Any]], other_tables: Optional[Dict[str, Dict[str, Any]]] = None) -> List[Document]:
+    """Compact documents: one per message, one per message field, one per row of other tables.
+
+    Metadata ("kind", "table", "source", and "message"/"field"/"units" or
+    "row") lets a retrieved chunk be traced back to the table it came from."""
+    docs = []
+    for name, message in messages.items():
+        base = {"table": message.get("table", name), "source": message.get("source"), "message": name}
+        docs += _documents(f"{name}: {message['description']}\nFields: {', '.join(message['fields'])}",
+                           {**base, "kind": "message"})
+        for field, schema in message["fields"].items():
+            docs += _documents(field_text(name, field, schema, message["description"]),
+                               {**base, "kind": "field", "field": field, "units": schema.get("units", "")})
+        for enum in message.get("values", []):
+            docs += _documents(f"{name} values, {enum['description']}: {_format_values(enum['values'])}",
+                               {**base, "kind": "values", "table": enum["table"]})
+
+    for name, table in (other_tables or {}).items():
+        for i, row in enumerate(table["rows"]):
+            cells = "; ".join(f"{column}={value}" for column, value in zip(table["columns"], row) if value)
+            if cells:
+                docs += _documents(f"{name}: {cells}", {"table": name, "source": table.get("source"), "kind": "row", "row": i})
+    return docs
@@ -0,0 +1,252 @@
+"""Prebuilt index of the log-message schema, searchable without network access.
+
+    python schemaindex.py [--embeddings hashing] [--out output/schema_index]
+
+Compiles output/extracted_data.json and src/assets/logmetadata/*.xml into
+field-level documents (see schema.py) and stores them with their vectors.
+Run it as a build step before starting the API; workers only rebuild an
+index that is missing or stale, one at a time under a file lock.
+"""
+import argparse
+import fcntl
+import hashlib
+import json
+import os
+import re
+import shutil
+import time
+import zlib
+import xml.etree.ElementTree as ET
+from pathlib import Path
+from typing import Dict, List, Optional, Any
+import numpy as np
+from langchain.docstore.document import Document
+from langchain_core.embeddings import Embeddings
+from schema import schema_from_tables, schema_documents
+
+CHATBOT_DIR = Path(__file__).resolve().parent
+EXTRACTED_PATH = CHATBOT_DIR / "output" / "extracted_data.json"
+XML_DIR = CHATBOT_DIR.parent / "src" / "assets" / "logmetadata"
+INDEX_DIR = CHATBOT_DIR / "output" / "schema_index"
+
+HASHING_DIM = 512
+WORD = re.compile(r"\w+")
+# "NSats" -> "N", "Sats"; "HDop" -> "H", "Dop"
+WORD_PART = re.compile(r"[A-Z]+(?![a-z])|[A-Z]?[a-z]+|\d+")
+# Question words that would otherwise outweigh the one field name in a query
+STOPWORDS = {"a", "an", "and", "are", "at", "does", "do", "for", "how", "i", "in", "is", "it", "mean", "means",
+             "me", "my", "of", "on", "the", "this", "to", "was", "what", "when", "which", "why", "with"}
+
+
+class HashingEmbeddings(Embeddings):
+    """Embeddings that need no model or network: signed feature hashing of
+    words, their camelCase parts and character trigrams, L2-normalised"""
+
+    def __init__(self, dim: int = HASHING_DIM):
+        self.dim = dim
+
+    def _add(self, vector: np.ndarray, feature: str, weight: float):
+        h = zlib.crc32(feature.encode("utf-8"))
+        vector[h % self.dim] += weight if h & 0x80000000 else -weight
+
+    def _vector(self, text: str) -> np.ndarray:
+        vector = np.zeros(self.dim, dtype=np.float32)
+        for word in WORD.findall(text):
+            lower = word.lower()
+            if lower in STOPWORDS:
+                continue
+            self._add(vector, "w:" + lower, 1.0)
+            parts = WORD_PART.findall(word)
+            if len(parts) > 1:
+                for part in parts:
+                    self._add(vector, "w:" + part.lower(), 0.5)
+            padded = f"<{lower}>"
+            for i in range(len(padded) - 2):
+                self._add(vector, "c:" + padded[i:i + 3], 0.25)
+        norm = np.linalg.norm(vector)
+        return vector / norm if norm else vector
+
+    def embed_documents(self, texts: List[str]) -> List[List[float]]:
+        return [self._vector(text).tolist() for text in texts]
+
+    def embed_query(self, text: str) -> List[float]:
+        return self._vector(text).tolist()
+
+
+def local_embeddings(spec: str = "hashing") -> Embeddings:
+    """Embedding backend named by spec: "hashing[:dim]" or "huggingface:<model>".
+
+    The huggingface backend needs sentence-transformers and the model in the
+    local cache; the spec is stored with the index so queries use the same one."""
+    backend, _, option = spec.partition(":")
+    if backend == "hashing":
+        return HashingEmbeddings(int(option) if option else HASHING_DIM)
+    if backend == "huggingface":
+        from langchain_community.embeddings import HuggingFaceEmbeddings
+        return HuggingFaceEmbeddings(model_name=option or "sentence-transformers/all-MiniLM-L6-v2")
+    raise ValueError(f"Unknown embedding backend: {spec}")
+
+
+def schema_from_xml(xml_path) -> Dict[str, Dict[str, Any]]:
+    """Message schemas from a logmetadata XML file, shaped like schema_from_tables()"""
+    messages = {}
+    source = f"logmetadata/{Path(xml_path).name}"
+    for logformat in ET.parse(xml_path).getroot().iter("logformat"):
+        fields = {}
+        for field in logformat.iter("field"):
+            fields[field.get("name")] = {"units": field.get("units", ""),
+                                         "description": (field.findtext("description") or "").strip(),
+                                         "values": []}
+        messages[logformat.get("name")] = {"description": (logformat.findtext("description") or "").strip(),
+                                           "table": logformat.get("name"),
+                                           "source": source,
+                                           "fields": fields,
+                                           "values": []}
+    return messages
+
+
+def merge_schemas(messages: Dict[str, Dict[str, Any]], extra: Dict[str, Dict[str, Any]]):
+    """Add messages and fields from extra that messages lacks and fill empty descriptions"""
+    for name, message in extra.items():
+        if name not in messages:
+            messages[name] = message
+            continue
+        existing = messages[name]
+        existing["description"] = existing["description"] or message["description"]
+        for field, schema in message["fields"].items():
+            if field not in existing["fields"]:
+                existing["fields"][field] = schema
+            elif not existing["fields"][field]["description"]:
+                existing["fields"][field]["description"] = schema["description"]
+
+
+def _sources(extracted_path, xml_paths) -> Dict[str, str]:
+    paths = [Path(extracted_path)] + [Path(p) for p in xml_paths]
+    return {p.name: hashlib.sha256(p.read_bytes()).hexdigest() for p in paths if p.exists()}
+
+
+class SchemaIndex:
+    """Schema documents and their vectors; vectors.npy is memory-mapped, so
+    every worker on the host shares one copy through the page cache"""
+
+    def __init__(self, vectors: np.ndarray, documents: List[Document], meta: Dict[str, Any]):
+        self.vectors = vectors
+        self.documents = documents
+        self.meta = meta
+        self.embeddings = local_embeddings(meta["embeddings"])
+
+    @classmethod
+    def load(cls, index_dir) -> Optional["SchemaIndex"]:
+        index_dir = Path(index_dir)
+        try:
+            with open(index_dir / "meta.json", encoding="utf-8") as f:
+                meta = json.load(f)
+            with open(index_dir / "documents.json", encoding="utf-8") as f:
+                documents = [Document(page_content=d["page_content"], metadata=d["metadata"]) for d in json.load(f)]
+            vectors = np.load(index_dir / "vectors.npy", mmap_mode="r")
+        except (OSError, ValueError, KeyError):
+            return None
+        return cls(vectors, documents, meta)
+
+    def similarity_search(self, query: str, k: int = 4) -> List[Document]:
+        """Top k documents by cosine similarity (vectors are normalised)"""
+        if not self.documents:
+            return []
+        query_vector = np.asarray(self.embeddings.embed_query(query), dtype=np.float32)
+        scores = self.vectors @ query_vector
+        k = min(k, len(scores))
+        top = np.argpartition(-scores, k - 1)[:k]
+        return [self.documents[i] for i in top[np.argsort(-scores[top])]]
+
+
+def _lock(index_dir: Path):
+    """Exclusive lock on a file next to index_dir, held until the returned file is closed"""
+    index_dir.parent.mkdir(parents=True, exist_ok=True)
+    lock = open(index_dir.with_name(f".{index_dir.name}.lock"), "w")
+    fcntl.flock(lock, fcntl.LOCK_EX)
+    return lock
+
+
+def _publish(index_dir: Path, version_dir: Path):
+    """Point index_dir (a symlink) at version_dir in one rename, then drop older versions"""
+    link = index_dir.with_name(f".{index_dir.name}.{os.getpid()}.link")
+    if link.is_symlink():
+        link.unlink()
+    os.symlink(version_dir.name, link)
+    if index_dir.is_dir() and not index_dir.is_symlink():
+        # Index written before versioned directories
+        shutil.rmtree(index_dir)
+    os.replace(link, index_dir)
+    for old in index_dir.parent.glob(f"{index_dir.name}.v*"):
+        if old != version_dir:
+            # Workers that mapped the old vectors keep them until they reload
+            shutil.rmtree(old, ignore_errors=True)
+
+
+def build_schema_index(index_dir=INDEX_DIR, embeddings: str = "hashing",
+                       extracted_path=EXTRACTED_PATH, xml_paths=None) -> SchemaIndex:
+    """Compile the schema sources into index_dir.
+
+    Each build is written to its own directory next to index_dir, and
+    index_dir is a symlink that is swapped to it atomically, so a worker
+    never sees a partly written or missing index."""
+    xml_paths = sorted(XML_DIR.glob("*.xml")) if xml_paths is None else xml_paths
+    started = time.perf_counter()
+    with open(extracted_path, encoding="utf-8") as f:
+        messages, other_tables = schema_from_tables(json.load(f), source=Path(extracted_path).name)
+    for xml_path in xml_paths:
+        merge_schemas(messages, schema_from_xml(xml_path))
+    documents = schema_documents(messages, other_tables)
+
+    vectors = np.asarray(local_embeddings(embeddings).embed_documents([d.page_content for d in documents]), dtype=np.float32)
+    vectors /= np.maximum(np.linalg.norm(vectors, axis=1, keepdims=True), 1e-12)
+    meta = {"embeddings": embeddings,
+            "dim": int(vectors.shape[1]),
+            "count": len(documents),
+            "sources": _sources(extracted_path, xml_paths),
+            "built_at": time.time()}
+
+    index_dir = Path(index_dir)
+    version_dir = index_dir.with_name(f"{index_dir.name}.v{int(meta['built_at'] * 1000)}.{os.getpid()}")
+    version_dir.mkdir(parents=True)
+    np.save(version_dir / "vectors.npy", vectors)
+    with open(version_dir / "documents.json", "w", encoding="utf-8") as f:
+        json.dump([{"page_content": d.page_content, "metadata": d.metadata} for d in documents], f, ensure_ascii=False)
+    with open(version_dir / "meta.json", "w", encoding="utf-8") as f:
+        json.dump(meta, f)
+    with _lock(index_dir):
+        _publish(index_dir, version_dir)
+    print(f"Built schema index with {len(documents)} documents in {time.perf_counter() - started:.2f}s")
+    return SchemaIndex.load(index_dir)
+
+
+def _current(index: Optional[SchemaIndex]) -> bool:
+    return index is not None and index.meta["sources"] == _sources(EXTRACTED_PATH, sorted(XML_DIR.glob("*.xml")))
+
+
+def load_schema_index(index_dir=INDEX_DIR, embeddings: str = "hashing") -> Optional[SchemaIndex]:
+    """The prebuilt index, rebuilt first if it is missing or its sources changed.
+
+    Workers starting together wait for one another, and the ones after the
+    first find the index already rebuilt."""
+    index_dir = Path(index_dir)
+    index = SchemaIndex.load(index_dir)
+    if _current(index):
+        return index
+    try:
+        with _lock(Path(str(index_dir) + ".build")):
+            index = SchemaIndex.load(index_dir)
+            if _current(index):
+                return index
+            return build_schema_index(index_dir, index.meta["embeddings"] if index else embeddings)
+    except Exception as e:
+        print(f"Error building schema index: {str(e)}")
+        return SchemaIndex.load(index_dir)
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Build the offline schema index")
+    parser.add_argument("--embeddings", default=os.getenv("SCHEMA_EMBEDDINGS", "hashing"))
+    parser.add_argument("--out", default=os.getenv("SCHEMA_INDEX_PATH", str(INDEX_DIR)))
+    args = parser.parse_args()
+    build_schema_index(args.out, args.embeddings)
@@ -0,0 +1,215 @@
+import json
+import os
+import sqlite3
+import threading
+import time
+from typing import Dict, List, Optional, Any
+
+# Fields kept as JSON text in the SQLite backend
+JSON_FIELDS = ("summary", "decode_stats", "progress")
+FILE_FIELDS = ("file_id", "user_id", "file_path", "filename", "digest", "status", "created_at") + JSON_FIELDS
+JOB_FIELDS = ("job_id", "kind", "status", "progress", "message", "result", "created_at", "started_at", "finished_at")
+
+
+class MemoryFlightStore:
+    """Per-process store; only correct when the API runs as a single worker"""
+
+    def __init__(self):
+        self.files: Dict[str, Dict[str, dict]] = {}
+        self.urls = set()
+        self.jobs: Dict[str, dict] = {}
+        self.lock = threading.Lock()
+
+    def add_file(self, user_id: str, file_data: Dict[str, Any]):
+        with self.lock:
+            defaults = {field: {} for field in JSON_FIELDS}
+            self.files.setdefault(user_id, {})[file_data["file_id"]] = {**defaults, **file_data, "user_id": user_id,
+                                                                         "created_at": time.time()}
+
+    def get_file(self, user_id: str, file_id: str) -> Optional[Dict[str, Any]]:
+        file_data = self.files.get(user_id, {}).get(file_id)
+        return dict(file_data) if file_data else None
+
+    def update_file(self, user_id: str, file_id: str, **fields) -> bool:
+        with self.lock:
+            file_data = self.files.get(user_id, {}).get(file_id)
+            if file_data is None:
+                return False
+            file_data.update(fields)
+            return True
+
+    def has_user(self, user_id: str) -> bool:
+        return user_id in self.files
+
+    def list_files(self) -> List[Dict[str, Any]]:
+        files = [dict(file_data) for user_files in self.files.values() for file_data in user_files.values()]
+        return sorted(files, key=lambda file_data: file_data["created_at"])
+
+    def delete_file(self, user_id: str, file_id: str) -> bool:
+        with self.lock:
+            return self.files.get(user_id, {}).pop(file_id, None) is not None
+
+    def claim_url(self, url: str) -> bool:
+        """Record url as ingested; False if it already was"""
+        with self.lock:
+            if url in self.urls:
+                return False
+            self.urls.add(url)
+            return True
+
+    def release_url(self, url: str):
+        with self.lock:
+            self.urls.discard(url)
+
+    def add_job(self, job: Dict[str, Any]):
+        with self.lock:
+            self.jobs[job["job_id"]] = {field: job.get(field) for field in JOB_FIELDS}
+
+    def update_job(self, job_id: str, **fields) -> bool:
+        with self.lock:
+            job = self.jobs.get(job_id)
+            if job is None:
+                return False
+            job.update({field: value for field, value in fields.items() if field in JOB_FIELDS})
+            return True
+
+    def get_job(self, job_id: str) -> Optional[Dict[str, Any]]:
+        job = self.jobs.get(job_id)
+        return dict(job) if job else None
+
+
+class SQLiteFlightStore:
+    """Store shared by every API worker on the host.
+
+    Only ingest state and small results (summary, decode stats) live in the
+    database; decoded columns stay in the log cache and are memory-mapped by
+    digest, so nothing large is copied between processes. WAL mode lets
+    readers in other workers proceed while one worker writes."""
+
+    def __init__(self, db_path):
+        self.db_path = str(db_path)
+        self.local = threading.local()
+        os.makedirs(os.path.dirname(self.db_path) or ".", exist_ok=True)
+        with self._connect() as conn:
+            conn.execute("""CREATE TABLE IF NOT EXISTS files (
+                                user_id TEXT NOT NULL,
+                                file_id TEXT NOT NULL,
+                                file_path TEXT,
+                                filename TEXT,
+                                digest TEXT,
+                                status TEXT,
+                                summary TEXT,
+                                decode_stats TEXT,
+                                progress TEXT,
+                                created_at REAL,
+                                PRIMARY KEY (user_id, file_id))""")
+            columns = {row[1] for row in conn.execute("PRAGMA table_info(files)")}
+            if "progress" not in columns:
+                # Databases created before decode progress was recorded
+                conn.execute("ALTER TABLE files ADD COLUMN progress TEXT")
+            conn.execute("CREATE TABLE IF NOT EXISTS urls (url TEXT PRIMARY KEY, added_at REAL)")
+            conn.execute("""CREATE TABLE IF NOT EXISTS jobs (
+                                job_id TEXT PRIMARY KEY,
+                                kind TEXT,
+                                status TEXT,
+                                progress REAL,
+                                message TEXT,
+                                result TEXT,
+                                created_at REAL,
+                                started_at REAL,
+                                finished_at REAL)""")
+
+    def _connect(self) -> sqlite3.Connection:
+        conn = getattr(self.local, "conn", None)
+        if conn is None:
+            conn = sqlite3.connect(self.db_path, timeout=30, isolation_level=None, check_same_thread=False)
+            conn.row_factory = sqlite3.Row
+            conn.execute("PRAGMA journal_mode=WAL")
+            conn.execute("PRAGMA synchronous=NORMAL")
+            self.local.conn = conn
+        return conn
+
+    def _row_to_file(self, row: sqlite3.Row) -> Dict[str, Any]:
+        file_data = {field: row[field] for field in FILE_FIELDS}
+        for field in JSON_FIELDS:
+            file_data[field] = json.loads(file_data[field]) if file_data[field] else {}
+        return file_data
+
+    def add_file(self, user_id: str, file_data: Dict[str, Any]):
+        values = {field: file_data.get(field) for field in FILE_FIELDS}
+        values["user_id"] = user_id
+        for field in JSON_FIELDS:
+            values[field] = json.dumps(values[field] or {}, default=str)
+        self._connect().execute(
+            "INSERT OR REPLACE INTO files (user_id, file_id, file_path, filename, digest, status, summary, decode_stats, progress, created_at) "
+            "VALUES (:user_id, :file_id, :file_path, :filename, :digest, :status, :summary, :decode_stats, :progress, :created_at)",
+            {**values, "created_at": time.time()})
+
+    def get_file(self, user_id: str, file_id: str) -> Optional[Dict[str, Any]]:
+        row = self._connect().execute("SELECT * FROM files WHERE user_id = ? AND file_id = ?", (user_id, file_id)).fetchone()
+        return self._row_to_file(row) if row else None
+
+    def update_file(self, user_id: str, file_id: str, **fields) -> bool:
+        fields = {field: value for field, value in fields.items() if field in FILE_FIELDS}
+        if not fields:
+            return self.get_file(user_id, file_id) is not None
+        for field in JSON_FIELDS:
+            if field in fields:
+                fields[field] = json.dumps(fields[field] or {}, default=str)
+        assignments = ", ".join(f"{field} = :{field}" for field in fields)
+        cursor = self._connect().execute(f"UPDATE files SET {assignments} WHERE user_id = :_user_id AND file_id = :_file_id",
+                                         {**fields, "_user_id": user_id, "_file_id": file_id})
+        return cursor.rowcount > 0
+
+    def has_user(self, user_id: str) -> bool:
+        return self._connect().execute("SELECT 1 FROM files WHERE user_id = ? LIMIT 1", (user_id,)).fetchone() is not None
+
+    def list_files(self) -> List[Dict[str, Any]]:
+        rows = self._connect().execute("SELECT * FROM files ORDER BY created_at").fetchall()
+        return [self._row_to_file(row) for row in rows]
+
+    def delete_file(self, user_id: str, file_id: str) -> bool:
+        cursor = self._connect().execute("DELETE FROM files WHERE user_id = ? AND file_id = ?", (user_id, file_id))
+        return cursor.rowcount > 0
+
+    def claim_url(self, url: str) -> bool:
+        """Record url as ingested; False if it already was (in any worker)"""
+        cursor = self._connect().execute("INSERT OR IGNORE INTO urls (url, added_at) VALUES (?, ?)", (url, time.time()))
+        return cursor.rowcount > 0
+
+    def release_url(self, url: str):
+        self._connect().execute("DELETE FROM urls WHERE url = ?", (url,))
+
+    def add_job(self, job: Dict[str, Any]):
+        values = {field: job.get(field) for field in JOB_FIELDS}
+        values["result"] = json.dumps(values["result"], default=str)
+        self._connect().execute(f"INSERT OR REPLACE INTO jobs ({', '.join(JOB_FIELDS)}) "
+                                f"VALUES ({', '.join(':' + field for field in JOB_FIELDS)})", values)
+
+    def update_job(self, job_id: str, **fields) -> bool:
+        fields = {field: value for field, value in fields.items() if field in JOB_FIELDS and field != "job_id"}
+        if not fields:
+            return self.get_job(job_id) is not None
+        if "result" in fields:
+            fields["result"] = json.dumps(fields["result"], default=str)
+        assignments = ", ".join(f"{field} = :{field}" for field in fields)
+        cursor = self._connect().execute(f"UPDATE jobs SET {assignments} WHERE job_id = :_job_id", {**fields, "_job_id": job_id})
+        return cursor.rowcount > 0
+
+    def get_job(self, job_id: str) -> Optional[Dict[str, Any]]:
+        row = self._connect().execute("SELECT * FROM jobs WHERE job_id = ?", (job_id,)).fetchone()
+        if row is None:
+            return None
+        job = {field: row[field] for field in JOB_FIELDS}
+        job["result"] = json.loads(job["result"]) if job["result"] else None
+        return job
+
+
+def create_flight_store():
+    """Backend chosen by FLIGHT_STORE: "sqlite" (default) or "memory" """
+    backend = os.getenv("FLIGHT_STORE", "sqlite")
+    if backend == "memory":
+        return MemoryFlightStore()
+    if backend == "sqlite":
+        return SQLiteFlightStore(os.getenv("FLIGHT_STORE_PATH", "files/flight_store.db"))
+    raise ValueError(f"Unknown FLIGHT_STORE backend: {backend}")
@@ -0,0 +1,248 @@
+import json
+from typing import Dict, List, Optional, Any, Tuple
+import numpy as np
+from pymavlink import mavutil
+
+# Signals summarised per flight phase, for DataFlash and tlog message names
+KEY_SIGNALS = {"GPS": ["Alt", "Spd", "NSats", "HDop"],
+               "BARO": ["Alt"],
+               "ATT": ["Roll", "Pitch"],
+               "CTUN": ["Alt", "ThO"],
+               "BAT": ["Volt", "Curr"],
+               "VIBE": ["VibeX", "VibeY", "VibeZ"],
+               "GPS_RAW_INT": ["alt", "vel", "satellites_visible", "eph"],
+               "VFR_HUD": ["alt", "groundspeed", "airspeed", "throttle"],
+               "ATTITUDE": ["roll", "pitch"],
+               "SYS_STATUS": ["voltage_battery", "current_battery"],
+               "VIBRATION": ["vibration_x", "vibration_y", "vibration_z"]}
+
+# (message, lat, lng, alt, lat/lng scale, alt scale)
+TRACK_SOURCES = [("GPS", "Lat", "Lng", "Alt", 1.0, 1.0),
+                 ("GLOBAL_POSITION_INT", "lat", "lon", "relative_alt", 1e-7, 1e-3),
+                 ("GPS_RAW_INT", "lat", "lon", "alt", 1e-7, 1e-3)]
+
+FIRMWARE_MODES = {"ArduCopter": mavutil.mode_mapping_acm,
+                  "ArduPlane": mavutil.mode_mapping_apm,
+                  "ArduRover": mavutil.mode_mapping_rover,
+                  "Rover": mavutil.mode_mapping_rover,
+                  "ArduSub": mavutil.mode_mapping_sub}
+
+TRACK_POINTS = 60
+MAX_EVENTS = 40
+# Data logged before the first mode change shorter than this is folded into it
+MIN_PRE_PHASE_S = 1.0
+
+
+def _seconds(fields: Dict[str, np.ndarray]) -> Optional[np.ndarray]:
+    """Time column of a message type in seconds"""
+    if "TimeUS" in fields:
+        return np.asarray(fields["TimeUS"], dtype=np.float64) * 1e-6
+    if "TimeMS" in fields:
+        return np.asarray(fields["TimeMS"], dtype=np.float64) * 1e-3
+    if "timestamp" in fields:
+        return np.asarray(fields["timestamp"], dtype=np.float64)
+    return None
+
+
+def _round(value: float) -> float:
+    return float(f"{float(value):.4g}")
+
+
+def _text(value) -> str:
+    return value.decode("utf-8", errors="ignore") if isinstance(value, bytes) else str(value)
+
+
+def _firmware_modes(columns) -> Dict[int, str]:
+    for text in columns.get("MSG", {}).get("Message", []):
+        text = _text(text)
+        for firmware, modes in FIRMWARE_MODES.items():
+            if text.startswith(firmware):
+                return modes
+    return {}
+
+
+def _mode_changes(columns, t0: float) -> List[Dict[str, Any]]:
+    """Mode changes as [{"t", "mode"}] from MODE (DataFlash) or HEARTBEAT (tlog)"""
+    changes = []
+    if "MODE" in columns:
+        fields = columns["MODE"]
+        times = _seconds(fields)
+        numbers = np.asarray(fields.get("ModeNum", fields.get("Mode")))
+        names = _firmware_modes(columns)
+        for t, number in zip(times.tolist(), numbers.tolist()):
+            changes.append({"t": _round(t - t0), "mode": names.get(int(number), f"MODE{int(number)}")})
+    elif "HEARTBEAT" in columns:
+        fields = columns["HEARTBEAT"]
+        times = _seconds(fields)
+        modes = np.asarray(fields["custom_mode"])
+        # Only the autopilot's heartbeats carry a flight mode
+        autopilot = np.asarray(fields["autopilot"]) != mavutil.mavlink.MAV_AUTOPILOT_INVALID
+        times, modes = times[autopilot], modes[autopilot]
+        if len(modes):
+            vehicle_types = np.asarray(fields["type"])[autopilot]
+            names = mavutil.mode_mapping_bynumber(int(vehicle_types[0])) or {}
+            change = np.flatnonzero(np.r_[True, modes[1:] != modes[:-1]])
+            for i in change.tolist():
+                changes.append({"t": _round(times[i] - t0), "mode": names.get(int(modes[i]), f"MODE{int(modes[i])}")})
+    return changes
+
+
+def _phases(changes: List[Dict[str, Any]], duration: float) -> List[Tuple[str, float, float]]:
+    if not changes:
+        return [("FLIGHT", 0.0, duration)]
+    phases = []
+    bounds = [c["t"] for c in changes] + [duration]
+    if bounds[0] > MIN_PRE_PHASE_S:
+        phases.append(("PRE", 0.0, bounds[0]))
+    else:
+        # Fold the short lead-in into the first mode
+        bounds[0] = 0.0
+    for change, start, end in zip(changes, bounds[:-1], bounds[1:]):
+        if end > start:
+            phases.append((change["mode"], start, end))
+    return phases
+
+
+def _phase_stats(columns, phases, t0: float) -> List[Dict[str, Any]]:
+    """min/max/mean of KEY_SIGNALS within each phase, using searchsorted on the time column"""
+    stats = []
+    for mode, start, end in phases:
+        signals = {}
+        for msg_type, names in KEY_SIGNALS.items():
+            fields = columns.get(msg_type)
+            if not fields:
+                continue
+            times = _seconds(fields)
+            if times is None:
+                continue
+            lo, hi = np.searchsorted(times - t0, [start, end])
+            if hi <= lo:
+                continue
+            for name in names:
+                if name not in fields or fields[name].dtype.kind not in "iuf":
+                    continue
+                values = np.asarray(fields[name][lo:hi], dtype=np.float64)
+                signals[f"{msg_type}.{name}"] = [_round(values.min()), _round(values.max()), _round(values.mean())]
+        stats.append({"mode": mode, "start": _round(start), "end": _round(end), "signals": signals})
+    return stats
+
+
+def _events(columns, t0: float) -> List[Dict[str, Any]]:
+    events = []
+    for msg_type, key in (("MSG", "Message"), ("STATUSTEXT", "text")):
+        fields = columns.get(msg_type)
+        if fields and key in fields:
+            for t, text in zip(_seconds(fields).tolist(), fields[key].tolist()):
+                events.append({"t": _round(t - t0), "event": _text(text).strip()})
+    if "ERR" in columns:
+        fields = columns["ERR"]
+        for t, subsys, code in zip(_seconds(fields).tolist(), fields["Subsys"].tolist(), fields["ECode"].tolist()):
+            events.append({"t": _round(t - t0), "event": f"ERR subsystem {subsys} code {code}"})
+    if "EV" in columns:
+        fields = columns["EV"]
+        for t, event_id in zip(_seconds(fields).tolist(), fields["Id"].tolist()):
+            events.append({"t": _round(t - t0), "event": f"EV {event_id}"})
+    if "GPS" in columns and "Status" in columns["GPS"]:
+        # GPS fix gained (>= 3D) or lost
+        fields = columns["GPS"]
+        has_fix = np.asarray(fields["Status"]) >= 3
+        flips = np.flatnonzero(has_fix[1:] != has_fix[:-1]) + 1
+        times = _seconds(fields)
+        for i in flips.tolist():
+            events.append({"t": _round(times[i] - t0), "event": "GPS 3D fix acquired" if has_fix[i] else "GPS 3D fix lost"})
+    events.sort(key=lambda e: e["t"])
+    return events[:MAX_EVENTS]
+
+
+def _track(columns, t0: float, points: int) -> Dict[str, Any]:
+    for msg_type, lat, lng, alt, pos_scale, alt_scale in TRACK_SOURCES:
+        fields = columns.get(msg_type)
+        if not fields or lat not in fields:
+            continue
+        lats = np.asarray(fields[lat], dtype=np.float64) * pos_scale
+        valid = np.flatnonzero(lats != 0)
+        if len(valid) == 0:
+            continue
+        pick = valid[np.unique(np.linspace(0, len(valid) - 1, min(points, len(valid))).astype(np.int64))]
+        times = _seconds(fields)
+        return {"source": msg_type,
+                "columns": ["t", "lat", "lng", "alt"],
+                "rows": [[_round(times[i] - t0), round(float(lats[i]), 6),
+                          round(float(fields[lng][i]) * pos_scale, 6), _round(float(fields[alt][i]) * alt_scale)]
+                         for i in pick.tolist()]}
+    return {}
+
+
+def summarize_flight(columns: Dict[str, Dict[str, np.ndarray]], stats: Optional[Dict[str, Any]] = None) -> Dict[str, Any]:
+    """Compact statistics of a decoded log, computed once at ingest"""
+    starts, ends = [], []
+    for fields in columns.values():
+        times = _seconds(fields)
+        if times is not None and len(times):
+            starts.append(times[0])
+            ends.append(times[-1])
+    if not starts:
+        return {}
+    t0 = float(min(starts))
+    duration = float(max(ends)) - t0
+
+    changes = _mode_changes(columns, t0)
+    return {"duration_s": _round(duration),
+            "messages": (stats or {}).get("messages"),
+            "message_types": {name: len(next(iter(fields.values()))) for name, fields in columns.items() if fields},
+            "mode_changes": changes,
+            "phases": _phase_stats(columns, _phases(changes, duration), t0),
+            "events": _events(columns, t0),
+            "track": _track(columns, t0, TRACK_POINTS)}
+
+
+def estimate_tokens(text: str) -> int:
+    """Rough token count (about four characters per token for this kind of text)"""
+    return len(text) // 4 + 1
+
+
+def _format_sections(summary: Dict[str, Any], track_points: int, max_events: int) -> List[str]:
+    sections = [f"Flight duration: {summary['duration_s']} s, {summary.get('messages')} messages"]
+    if summary.get("mode_changes"):
+        sections.append("Mode changes (t s: mode): " + ", ".join(f"{c['t']}: {c['mode']}" for c in summary["mode_changes"]))
+    for phase in summary.get("phases", []):
+        signals = "; ".join(f"{name} {v[0]}/{v[1]}/{v[2]}" for name, v in phase["signals"].items())
+        sections.append(f"Phase {phase['mode']} {phase['start']}-{phase['end']} s (min/max/mean): {signals}")
+    events = summary.get("events", [])[:max_events]
+    if events:
+        sections.append("Events (t s): " + "; ".join(f"{e['t']}: {e['event']}" for e in events))
+    track = summary.get("track") or {}
+    rows = track.get("rows", [])
+    if rows and track_points:
+        step = max(1, -(-len(rows) // track_points))
+        sections.append(f"Track from {track['source']} (t,lat,lng,alt): " + " ".join(",".join(str(v) for v in row) for row in rows[::step]))
+    return sections
+
+
+def build_flight_context(summary: Dict[str, Any], token_budget: int) -> str:
+    """Render a flight summary as prompt text that fits in token_budget.
+
+    Sections are kept in priority order (overview, modes, phases, events,
+    track); the track and event list are thinned first, then trailing
+    sections are dropped until the text fits."""
+    if not summary:
+        return ""
+    if isinstance(summary, str):
+        summary = json.loads(summary)
+
+    track_points = len((summary.get("track") or {}).get("rows", []))
+    max_events = len(summary.get("events", []))
+    while True:
+        sections = _format_sections(summary, track_points, max_events)
+        text = "\n".join(sections)
+        if estimate_tokens(text) <= token_budget or (track_points == 0 and max_events == 0):
+            break
+        if track_points > 0:
+            track_points //= 2
+        else:
+            max_events //= 2
+
+    while len(sections) > 1 and estimate_tokens(text) > token_budget:
+        sections.pop()
+        text = "\n".join(sections)
+    return text
@@ -0,0 +1,12 @@
+import os
+import sys
+import tempfile
+from pathlib import Path
+
+CHATBOT_DIR = Path(__file__).resolve().parent.parent
+sys.path[:0] = [str(CHATBOT_DIR), str(CHATBOT_DIR / "benchmarks")]
+
+# The module-level caches create their directories on import; keep them out of the tree
+_cache_root = tempfile.mkdtemp(prefix="log-talk-tests-")
+os.environ.setdefault("PAGE_CACHE_DIR", os.path.join(_cache_root, "pages"))
+os.environ.setdefault("LOG_CACHE_DIR", os.path.join(_cache_root, "cache"))
@@ -0,0 +1,111 @@
+import numpy as np
+import pytest
+from analytics import QueryError, run_query
+
+
+@pytest.fixture
+def columns():
+    # GPS at 1 Hz from t = 10 s, BARO at 2 Hz from t = 10.5 s; the log starts with the first GPS record
+    gps_times = np.arange(10, 20) * 1_000_000
+    baro_times = np.arange(21, 41) * 500_000
+    return {"GPS": {"TimeUS": gps_times.astype(np.uint64),
+                    "Alt": np.arange(10, dtype=np.float32) * 2,
+                    "Spd": np.array([0, 1, 2, 3, 4, 5, 4, 3, 2, 1], dtype=np.float32),
+                    "NSats": np.full(10, 12, dtype=np.uint8)},
+            "BARO": {"TimeUS": baro_times.astype(np.uint64),
+                     "Alt": np.array([0, 2, 6, 12, 14, 11, 8, 4, 12, 15, 9, 3, 1, 0, 0, 0, 0, 0, 0, 0], dtype=np.float32)},
+            "MSG": {"TimeUS": np.array([10_000_000], dtype=np.uint64), "Message": np.array([b"ArduCopter"])}}
+
+
+def test_describe_lists_messages_relative_to_log_start(columns):
+    result = run_query(columns, {"operation": "describe"})
+    assert result["messages"]["GPS"] == {"count": 10, "fields": ["Alt", "Spd", "NSats"], "start": 0.0, "end": 9.0}
+    assert result["messages"]["BARO"]["start"] == 0.5
+    assert result["messages"]["MSG"]["fields"] == ["Message"]
+
+
+def test_rows_in_time_range_with_filter(columns):
+    result = run_query(columns, {"operation": "rows", "message": "GPS", "fields": ["Spd"], "start": 2, "end": 7,
+                                 "filters": [{"field": "Spd", "op": ">=", "value": 4}]})
+    assert result["matched"] == 3
+    assert result["columns"] == ["t", "Spd"]
+    assert result["rows"] == [[4.0, 4.0], [5.0, 5.0], [6.0, 4.0]]
+    assert not result["sampled"]
+
+
+def test_rows_are_sampled_beyond_limit(columns):
+    result = run_query(columns, {"operation": "rows", "message": "BARO", "limit": 5})
+    assert result["matched"] == 20
+    assert len(result["rows"]) == 5
+    assert result["sampled"]
+    assert result["rows"][0][0] == 0.5 and result["rows"][-1][0] == 10.0
+
+
+def test_aggregate(columns):
+    result = run_query(columns, {"operation": "aggregate", "message": "GPS", "fields": ["Alt", "Spd"],
+                                 "aggregations": ["min", "max", "mean", "count", "p50"]})
+    assert result["fields"]["Spd"]["max"] == {"value": 5.0, "t": 5.0}
+    assert result["fields"]["Alt"]["min"] == {"value": 0.0, "t": 0.0}
+    assert result["fields"]["Alt"]["mean"] == 9.0
+    assert result["fields"]["Spd"]["count"] == 10
+    assert result["fields"]["Spd"]["p50"] == 2.5
+
+
+def test_aggregate_defaults_to_numeric_fields(columns):
+    result = run_query(columns, {"message": "GPS"})
+    assert set(result["fields"]) == {"Alt", "Spd", "NSats"}
+    assert result["fields"]["NSats"]["mean"] == 12.0
+
+
+def test_window(columns):
+    result = run_query(columns, {"operation": "window", "message": "GPS", "fields": ["Spd"], "window_s": 4,
+                                 "aggregations": ["max"]})
+    assert result["columns"] == ["t", "Spd"]
+    assert result["rows"] == [[0.0, 3.0], [4.0, 5.0], [8.0, 2.0]]
+    assert not result["truncated"]
+
+    counted = run_query(columns, {"operation": "window", "message": "GPS", "fields": ["Spd"], "window_s": 4,
+                                  "aggregations": ["count"], "limit": 2})
+    assert counted["rows"] == [[0.0, 4], [4.0, 4]]
+    assert counted["truncated"]
+
+
+def test_crossings(columns):
+    result = run_query(columns, {"operation": "crossings", "message": "BARO",
+                                 "threshold": {"field": "Alt", "op": ">", "value": 10}})
+    assert result["initially"] is False
+    assert result["crossings"] == 4
+    assert [event["event"] for event in result["events"]] == ["enter", "exit", "enter", "exit"]
+    assert result["events"][0] == {"t": 2.0, "event": "enter", "value": 12.0}
+    # Above 10 from 2.0 to 3.5 s and from 4.5 to 5.5 s
+    assert result["time_true_s"] == 2.5
+
+
+@pytest.mark.parametrize("query", [
+    {"operation": "join"},
+    {"message": "RCOU"},
+    {"message": "GPS", "fields": ["Yaw"]},
+    {"message": "GPS", "filters": [{"field": "Spd", "op": "~", "value": 1}]},
+    {"message": "MSG", "fields": ["Message"], "aggregations": ["mean"]},
+    {"message": "GPS", "aggregations": ["median-ish"]},
+    {"operation": "window", "message": "GPS", "window_s": 0},
+    {"operation": "window", "message": "GPS", "window_s": 1, "aggregations": ["std"]},
+    {"operation": "crossings", "message": "GPS"},
+])
+def test_invalid_queries_raise_query_error(columns, query):
+    with pytest.raises(QueryError):
+        run_query(columns, query)
+
+
+def test_query_on_evicted_log_decodes_only_the_window(tmp_path):
+    from decoder import read_columns, seek_index_path
+    from fixtures import synthetic_dataflash
+    from analytics import query_flight
+    log = synthetic_dataflash(tmp_path / "synthetic.bin", 256 * 1024)
+    columns, _ = read_columns(str(log), seek_index=seek_index_path(log))
+    query = {"operation": "aggregate", "message": "ATT", "fields": ["Roll"], "start": 1.2, "end": 2.5,
+             "aggregations": ["min", "max", "mean", "count"]}
+    # No log cache entry under this digest: the window is read through the seek index
+    assert query_flight("evicted", query, str(log)) == run_query(columns, query)
+    with pytest.raises(QueryError):
+        query_flight("evicted", {"message": "ATT"}, str(log))
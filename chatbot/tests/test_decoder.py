@@ -0,0 +1,111 @@
+import gzip
+import lzma
+import numpy as np
+import pytest
+import decoder
+from decoder import read_columns, read_time_range, zstandard
+from fixtures import SYNTHETIC_MESSAGES, _fmt_record, _record, synthetic_dataflash
+from logcache import LogCache, file_digest
+
+LOG_BYTES = 512 * 1024
+
+
+@pytest.fixture(scope="module")
+def log(tmp_path_factory):
+    return synthetic_dataflash(tmp_path_factory.mktemp("logs") / "synthetic.bin", LOG_BYTES)
+
+
+@pytest.fixture(scope="module")
+def serial(log):
+    return read_columns(str(log), workers=1)[0]
+
+
+def assert_same_columns(actual, expected):
+    assert sorted(actual) == sorted(expected)
+    for name, fields in expected.items():
+        assert list(actual[name]) == list(fields), name
+        for field, values in fields.items():
+            np.testing.assert_array_equal(actual[name][field], values, err_msg=f"{name}.{field}")
+
+
+def test_decodes_every_synthetic_message(serial):
+    assert sorted(serial) == sorted(name for name, *_ in SYNTHETIC_MESSAGES)
+    assert len(serial["IMU"]["TimeUS"]) == 4 * len(serial["ATT"]["TimeUS"])
+    assert np.all(np.diff(serial["IMU"]["TimeUS"].astype(np.int64)) > 0)
+
+
+def test_parallel_matches_serial(log, serial, monkeypatch):
+    monkeypatch.setattr(decoder, "PARALLEL_MIN_BYTES", 0)
+    columns, stats = read_columns(str(log), workers=2)
+    assert stats["workers"] == 2
+    assert_same_columns(columns, serial)
+
+
+def test_ranged_ingest_matches_serial(log, serial, monkeypatch):
+    # Progress reporting decodes in INGEST_CHUNK_BYTES ranges in this process
+    monkeypatch.setattr(decoder, "INGEST_CHUNK_BYTES", 64 * 1024)
+    calls = []
+    columns, _ = read_columns(str(log), workers=1, progress=lambda done, total, count, partial: calls.append(done))
+    assert len(calls) > 1 and calls[-1] == log.stat().st_size
+    assert_same_columns(columns, serial)
+
+
+@pytest.mark.parametrize("suffix, compress", [
+    (".gz", gzip.compress),
+    (".xz", lzma.compress),
+    pytest.param(".zst", lambda data: zstandard.ZstdCompressor().compress(data),
+                 marks=pytest.mark.skipif(zstandard is None, reason="zstandard is not installed")),
+])
+def test_compressed_matches_raw(log, serial, tmp_path, monkeypatch, suffix, compress):
+    # Small chunks so records straddle chunk boundaries
+    monkeypatch.setattr(decoder, "STREAM_CHUNK_BYTES", 10_000)
+    path = tmp_path / f"synthetic.bin{suffix}"
+    path.write_bytes(compress(log.read_bytes()))
+    columns, stats = read_columns(str(path))
+    assert stats["compressed"]
+    assert_same_columns(columns, serial)
+
+
+def test_time_range_matches_full_decode(log, serial, tmp_path):
+    t0 = min(fields["TimeUS"].min() for fields in serial.values()) / 1e6
+    start, end = 2.3, 4.7
+    seek_index = str(tmp_path / "synthetic.seek.npz")
+    # The first read decodes everything and writes the seek index, the second only reads the range
+    for seek in (False, True):
+        columns, stats = read_time_range(str(log), ["ATT", "GPS"], start, end, seek_index=seek_index)
+        assert stats["seek"] is seek
+        expected = {}
+        for name in ("ATT", "GPS"):
+            times = serial[name]["TimeUS"] / 1e6 - t0
+            keep = (times >= start) & (times <= end)
+            expected[name] = {field: values[keep] for field, values in serial[name].items()}
+        assert_same_columns(columns, expected)
+    assert stats["bytes_scanned"] < LOG_BYTES / 2
+
+
+def test_serial_decode_orders_records_by_time(tmp_path):
+    name, msg_type, fmt, names, _ = next(message for message in SYNTHETIC_MESSAGES if message[0] == "MODE")
+    path = tmp_path / "unordered.bin"
+    times = [3_000_000, 1_000_000, 2_000_000]
+    path.write_bytes(_fmt_record(name, msg_type, fmt, names) +
+                     b"".join(_record(msg_type, fmt, (t, i, i, 1)) for i, t in enumerate(times)))
+    columns, _ = read_columns(str(path), workers=1)
+    assert columns["MODE"]["TimeUS"].tolist() == sorted(times)
+    assert columns["MODE"]["Mode"].tolist() == [1, 2, 0]
+
+
+def test_log_cache_round_trip(log, serial, tmp_path):
+    cache = LogCache(tmp_path / "cache", max_bytes=1 << 30)
+    digest = file_digest(log)
+    assert cache.load(digest) is None
+    cache.store(digest, serial, {"messages": 1})
+    columns, stats = cache.load(digest)
+    assert stats == {"messages": 1}
+    assert_same_columns(columns, serial)
+
+    # read_columns through the cache decodes once and then serves the stored columns
+    other = LogCache(tmp_path / "other", max_bytes=1 << 30)
+    for hit in (False, True):
+        cached, stats = other.read_columns(str(log))
+        assert stats["cache_hit"] is hit
+        assert_same_columns(cached, serial)
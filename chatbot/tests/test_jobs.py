@@ -0,0 +1,147 @@
+import threading
+import time
+import pytest
+from jobs import Cancelled, IngestScheduler, QueueFull
+
+TIMEOUT = 5
+
+
+@pytest.fixture
+def make_scheduler():
+    schedulers = []
+
+    def make(**kwargs):
+        scheduler = IngestScheduler(**kwargs)
+        schedulers.append(scheduler)
+        return scheduler
+
+    yield make
+    for scheduler in schedulers:
+        scheduler.shutdown()
+
+
+def wait_for(predicate):
+    deadline = time.monotonic() + TIMEOUT
+    while not predicate():
+        assert time.monotonic() < deadline, "timed out"
+        time.sleep(0.005)
+
+
+def blocker(release: threading.Event, started: threading.Event):
+    """Job that occupies a worker until release is set"""
+    def job(cancelled):
+        started.set()
+        release.wait(TIMEOUT)
+    return job
+
+
+def recorder(order, name):
+    def job(cancelled):
+        order.append(name)
+    return job
+
+
+def test_smaller_file_runs_first(make_scheduler):
+    scheduler = make_scheduler(workers=1)
+    release, started, order = threading.Event(), threading.Event(), []
+    scheduler.submit("busy", "u0", 1, blocker(release, started))
+    started.wait(TIMEOUT)
+    scheduler.submit("large", "u1", 1000, recorder(order, "large"))
+    scheduler.submit("medium", "u2", 100, recorder(order, "medium"))
+    scheduler.submit("small", "u3", 10, recorder(order, "small"))
+    release.set()
+    wait_for(lambda: len(order) == 3)
+    assert order == ["small", "medium", "large"]
+
+
+def test_waiting_raises_priority(make_scheduler):
+    scheduler = make_scheduler(workers=1, aging_seconds=0.01)
+    release, started, order = threading.Event(), threading.Event(), []
+    scheduler.submit("busy", "u0", 1, blocker(release, started))
+    started.wait(TIMEOUT)
+    scheduler.submit("large", "u1", 1000, recorder(order, "large"))
+    time.sleep(0.3)
+    scheduler.submit("smaller", "u2", 900, recorder(order, "smaller"))
+    release.set()
+    wait_for(lambda: len(order) == 2)
+    assert order == ["large", "smaller"]
+
+
+def test_user_at_limit_waits_while_others_run(make_scheduler):
+    scheduler = make_scheduler(workers=2, max_per_user=1)
+    release, started, order = threading.Event(), threading.Event(), []
+    scheduler.submit("a1", "alice", 1, blocker(release, started))
+    started.wait(TIMEOUT)
+    scheduler.submit("a2", "alice", 1, recorder(order, "a2"))
+    scheduler.submit("b1", "bob", 1000, recorder(order, "b1"))
+    wait_for(lambda: order == ["b1"])
+    assert scheduler.stats()["queued"] == 1
+    release.set()
+    wait_for(lambda: len(order) == 2)
+    assert order == ["b1", "a2"]
+
+
+def test_cancel_queued_job(make_scheduler):
+    scheduler = make_scheduler(workers=1)
+    release, started, order = threading.Event(), threading.Event(), []
+    scheduler.submit("busy", "u0", 1, blocker(release, started))
+    started.wait(TIMEOUT)
+    scheduler.submit("queued", "u1", 1, recorder(order, "queued"))
+    assert scheduler.cancel("queued")
+    assert not scheduler.cancel("queued")
+    release.set()
+    wait_for(lambda: scheduler.stats()["completed"] == 1)
+    assert order == []
+    assert scheduler.stats()["cancelled"] == 1
+
+
+def test_cancel_running_job_sets_its_event(make_scheduler):
+    scheduler = make_scheduler(workers=1)
+    started = threading.Event()
+
+    def job(cancelled):
+        started.set()
+        # Stands in for an ingest that checks for cancellation between chunks
+        while not cancelled.wait(0.01):
+            pass
+        raise Cancelled("running")
+
+    scheduler.submit("running", "u1", 1, job)
+    started.wait(TIMEOUT)
+    assert scheduler.cancel("running")
+    wait_for(lambda: scheduler.stats()["cancelled"] == 1)
+    assert scheduler.stats()["running"] == 0
+
+
+def test_resubmitting_a_key_cancels_the_queued_job(make_scheduler):
+    scheduler = make_scheduler(workers=1)
+    release, started, order = threading.Event(), threading.Event(), []
+    scheduler.submit("busy", "u0", 1, blocker(release, started))
+    started.wait(TIMEOUT)
+    scheduler.submit("file", "u1", 1, recorder(order, "first"))
+    scheduler.submit("file", "u1", 1, recorder(order, "second"))
+    release.set()
+    wait_for(lambda: scheduler.stats()["completed"] == 2)
+    assert order == ["second"]
+
+
+def test_full_queue_rejects(make_scheduler):
+    scheduler = make_scheduler(workers=1, max_queued=1)
+    release, started = threading.Event(), threading.Event()
+    scheduler.submit("busy", "u0", 1, blocker(release, started))
+    started.wait(TIMEOUT)
+    scheduler.submit("queued", "u1", 1, recorder([], "queued"))
+    with pytest.raises(QueueFull):
+        scheduler.submit("rejected", "u2", 1, recorder([], "rejected"))
+    assert scheduler.stats()["rejected"] == 1
+    release.set()
+
+
+def test_failing_job_is_counted(make_scheduler):
+    scheduler = make_scheduler(workers=1)
+
+    def job(cancelled):
+        raise ValueError("corrupt log")
+
+    scheduler.submit("bad", "u1", 1, job)
+    wait_for(lambda: scheduler.stats()["failed"] == 1)
@@ -0,0 +1,80 @@
+import pytest
+import requests
+from pagecache import PageCache
+from fixtures import serve_pages
+
+PAGE = b"<html><body><table><tr><td>GPS</td></tr></table></body></html>"
+
+
+@pytest.fixture
+def cache(tmp_path):
+    return PageCache(tmp_path / "pages", timeout=5)
+
+
+@pytest.fixture
+def server():
+    with serve_pages({"/page.html": PAGE}) as server:
+        server.page_url = server.url + "/page.html"
+        yield server
+
+
+def test_first_fetch_downloads_and_stores_validators(cache, server):
+    page = cache.fetch(server.page_url)
+    assert page["content"] == PAGE
+    assert not page["not_modified"]
+    assert page["etag"] and page["last_modified"]
+    assert cache.stats()["fetched"] == 1
+
+
+def test_revalidation_answered_with_304_reuses_body(cache, server):
+    first = cache.fetch(server.page_url)
+    second = cache.fetch(server.page_url)
+    assert second["not_modified"]
+    assert second["content"] == PAGE
+    assert second["digest"] == first["digest"]
+    assert server.not_modified == 1
+    assert cache.stats() == {"fetched": 1, "not_modified": 1, "stale": 0, "bytes_downloaded": len(PAGE)}
+
+
+def test_changed_etag_downloads_again(cache, server):
+    first = cache.fetch(server.page_url)
+    server.pages["/page.html"] = PAGE.replace(b"GPS", b"ATT")
+    second = cache.fetch(server.page_url)
+    assert not second["not_modified"]
+    assert second["etag"] != first["etag"]
+    assert b"ATT" in second["content"]
+    assert cache.fetch(server.page_url)["not_modified"]
+
+
+def test_last_modified_only_server(cache, server):
+    server.etags = False
+    first = cache.fetch(server.page_url)
+    assert first["etag"] is None and first["last_modified"]
+    assert cache.fetch(server.page_url)["not_modified"]
+
+    server.pages["/page.html"] = PAGE.replace(b"GPS", b"ATT")
+    server.modified += 60
+    changed = cache.fetch(server.page_url)
+    assert not changed["not_modified"]
+    assert b"ATT" in changed["content"]
+
+
+def test_server_error_falls_back_to_cached_page(cache, server):
+    cache.fetch(server.page_url)
+    server.error = 503
+    page = cache.fetch(server.page_url)
+    assert page["stale"] and page["content"] == PAGE
+    assert cache.stats()["stale"] == 1
+
+
+def test_server_error_without_cached_page_raises(cache, server):
+    server.error = 503
+    with pytest.raises(requests.HTTPError):
+        cache.fetch(server.page_url)
+
+
+def test_extracted_tables_keyed_by_body_digest(cache, server):
+    page = cache.fetch(server.page_url)
+    cache.store_extracted(server.page_url, page["digest"], {"table_1": {"data": []}})
+    assert cache.load_extracted(server.page_url, page["digest"]) == {"table_1": {"data": []}}
+    assert cache.load_extracted(server.page_url, "other digest") is None
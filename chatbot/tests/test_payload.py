@@ -0,0 +1,41 @@
+import json
+import numpy as np
+import pytest
+from payload import ARROW, JSON, PayloadCache, encode, select_columns
+
+
+def test_payload_cache_is_bounded_by_bytes():
+    cache = PayloadCache(max_bytes=100)
+    for key in "abcdef":
+        cache.put(key, b"x" * 20, "gzip")
+    assert cache.bytes == 100
+    assert list(cache.entries) == ["b", "c", "d", "e", "f"]
+    assert cache.get("a") is None
+    assert cache.get("f") == (b"x" * 20, "gzip")
+
+
+def test_payload_cache_skips_large_bodies_and_keeps_lru_order():
+    cache = PayloadCache(max_bytes=120)
+    cache.put("large", b"x" * 31, None)
+    assert cache.get("large") is None
+    for key in "abcd":
+        cache.put(key, b"x" * 30, None)
+    cache.get("a")
+    cache.put("e", b"x" * 30, None)
+    assert list(cache.entries) == ["c", "d", "a", "e"]
+    assert cache.stats()["hits"] == 1
+
+
+def test_two_dimensional_columns():
+    # DataFlash "a" fields decode to one fixed-size array per record
+    columns = {"ISBD": {"TimeUS": np.array([1_000_000, 2_000_000], dtype=np.uint64),
+                        "N": np.array([0, 1], dtype=np.uint8),
+                        "x": np.arange(64, dtype=np.int16).reshape(2, 32)}}
+    selected, meta = select_columns(columns, ["ISBD"])
+    body = json.loads(encode(selected, meta, JSON))
+    assert body["messages"]["ISBD"]["x"][1][:2] == [32, 33]
+
+    pyarrow = pytest.importorskip("pyarrow")
+    table = pyarrow.ipc.open_stream(encode(selected, meta, ARROW)).read_all()
+    assert table.column("x").type == pyarrow.list_(pyarrow.int16(), 32)
+    assert table.column("x").to_pylist()[1] == list(range(32, 64))
@@ -0,0 +1,88 @@
+import json
+import pytest
+from fixtures import logmessages_html
+
+process = pytest.importorskip("process")
+
+ENGINES = ["lxml", "html.parser"]
+
+# Two identical tables with a description between them
+TWIN_TABLES = b"""<html><body><div>
+<h2>Twin tables</h2>
+<table><tr><th>Name</th><th>Units</th></tr><tr><td>Alt</td><td>m</td></tr></table>
+<p>Sits between the two tables and is long enough to describe one.</p>
+<table><tr><th>Name</th><th>Units</th></tr><tr><td>Alt</td><td>m</td></tr></table>
+</div></body></html>"""
+# A paragraph left open before the table
+UNCLOSED_P = b"""<html><body><div>
+<h2>Unclosed paragraph</h2>
+<p>An introduction paragraph that is never closed before the table
+<table><tr><th>Field</th><th>Meaning</th></tr><tr><td>HDop</td><td>dilution</td></tr></table>
+</div></body></html>"""
+BETWEEN = "Sits between the two tables and is long enough to describe one."
+INTRO = "An introduction paragraph that is never closed before the table"
+
+
+@pytest.fixture(params=ENGINES)
+def engine(request, monkeypatch):
+    if request.param == "lxml":
+        if process.lxml is None:
+            pytest.skip("lxml is not installed")
+    else:
+        monkeypatch.setattr(process, "lxml", None)
+    return request.param
+
+
+def parse(content: bytes):
+    parser = process.DynamicTableParser("test")
+    parser.load_html(content)
+    return parser
+
+
+@pytest.fixture(scope="module")
+def page():
+    return logmessages_html().encode("utf-8")
+
+
+def test_fixture_page(engine, page):
+    data = parse(page).extract_all_data()
+    assert len(data) == 331
+    table = data["AIS5"]
+    assert table["metadata"]["row_count"] == 15
+    assert table["metadata"]["structure"]["columns"] == ["US", "μs", "Time since system startup"]
+    assert table["data"][:2] == [{"US": "rep", "μs": None, "Time since system startup": "Repeat Indicator"},
+                                 {"US": "mmsi", "μs": None, "Time since system startup": "MMSI"}]
+    context = table["metadata"]["context"]
+    assert context["preceding_headers"] == [{"level": "h2", "text": "AIS5¶", "distance": 3}]
+    assert context["table_class"] == ["docutils", "align-default"]
+    assert context["table_description"].startswith("Contents of ‘static and voyage related data’ AIS message")
+    assert [desc["distance"] for desc in context["following_descriptions"]] == [999]
+
+
+def test_engines_agree_on_fixture_page(page, monkeypatch):
+    if process.lxml is None:
+        pytest.skip("lxml is not installed")
+    with_lxml = json.dumps(parse(page).extract_all_data(), sort_keys=True, default=str)
+    monkeypatch.setattr(process, "lxml", None)
+    assert json.dumps(parse(page).extract_all_data(), sort_keys=True, default=str) == with_lxml
+
+
+def test_block_between_identical_tables_describes_the_second(engine):
+    first, second = [table["context"] for table in parse(TWIN_TABLES).find_all_tables()]
+    assert first["following_descriptions"] == [{"text": BETWEEN, "distance": 1, "tag": "p"}]
+    # bs4's structural equality used to skip it: the first table counted as "before" it
+    assert second["following_descriptions"] == [{"text": BETWEEN, "distance": 999, "tag": "p"}]
+    assert second["table_description"] == BETWEEN
+
+
+def test_unclosed_paragraph_before_table(engine):
+    data = parse(UNCLOSED_P).extract_all_data()
+    if engine == "lxml":
+        # lxml closes the <p>, so the table is a sibling of the header and the paragraph
+        context = data["Unclosed_paragraph"]["metadata"]["context"]
+        assert context["section_title"] == "Unclosed paragraph"
+        assert context["table_description"] == INTRO
+    else:
+        # html.parser nests the table in the <p>, away from its context, as before
+        context = data["table_1"]["metadata"]["context"]
+        assert context["preceding_headers"] == [] and context["table_description"] is None
@@ -0,0 +1,237 @@
+import os
+import re
+import sqlite3
+import threading
+import time
+from collections import OrderedDict
+from typing import Dict, List, Iterator, Optional, Any, Sequence, Tuple
+from langchain.vectorstores import FAISS
+from langchain.embeddings import CacheBackedEmbeddings
+from langchain_core.stores import ByteStore
+from metrics import registry
+
+INDEX_FILES = ("index.faiss", "index.pkl")
+load_seconds = registry.histogram("vectorstore_load_seconds", "Time to load a FAISS index from disk into the resident cache")
+
+
+def index_version(index_path: str) -> Optional[Tuple[int, int]]:
+    """(newest mtime_ns, total size) of the files save_local writes, or None if absent"""
+    try:
+        stats = [os.stat(os.path.join(index_path, name)) for name in INDEX_FILES]
+    except OSError:
+        return None
+    return max(s.st_mtime_ns for s in stats), sum(s.st_size for s in stats)
+
+
+class VectorstoreCache:
+    """Loaded FAISS indexes kept resident per worker, in LRU order by index_path.
+
+    An entry is reused as long as the files on disk still have the version
+    it was loaded (or saved) at; when another worker saves the index, the
+    next get() reloads it. Loads run outside the cache lock, so searches of
+    resident indexes do not wait for them; a per-path lock keeps concurrent
+    misses on one index to a single load."""
+
+    def __init__(self, embedding_model, max_indexes: int = 4):
+        self.embedding_model = embedding_model
+        self.max_indexes = max_indexes
+        self.entries: "OrderedDict[str, Tuple[Tuple[int, int], FAISS]]" = OrderedDict()
+        self.lock = threading.Lock()
+        self.load_locks: Dict[str, threading.Lock] = {}
+        self.hits = 0
+        self.misses = 0
+        self.reloads = 0
+        self.loads = 0
+        self.load_seconds = 0.0
+
+    def _resident(self, index_path: str, version) -> Optional[FAISS]:
+        entry = self.entries.get(index_path)
+        if entry is not None and entry[0] == version:
+            self.entries.move_to_end(index_path)
+            return entry[1]
+        return None
+
+    def get(self, index_path: str) -> Optional[FAISS]:
+        version = index_version(index_path)
+        if version is None:
+            return None
+        with self.lock:
+            vectorstore = self._resident(index_path, version)
+            if vectorstore is not None:
+                self.hits += 1
+                return vectorstore
+            self.misses += 1
+            if index_path in self.entries:
+                self.reloads += 1
+            load_lock = self.load_locks.setdefault(index_path, threading.Lock())
+
+        with load_lock:
+            with self.lock:
+                # Loaded by the thread this one waited for
+                vectorstore = self._resident(index_path, version)
+            if vectorstore is not None:
+                return vectorstore
+            started = time.perf_counter()
+            vectorstore = FAISS.load_local(index_path, self.embedding_model, allow_dangerous_deserialization=True)
+            elapsed = time.perf_counter() - started
+            load_seconds.observe(elapsed)
+            with self.lock:
+                self.loads += 1
+                self.load_seconds += elapsed
+                entry = self.entries.get(index_path)
+                # A put() of a newer save while this one loaded wins
+                if entry is None or entry[0] < version:
+                    self._put(index_path, version, vectorstore)
+            return vectorstore
+
+    def put(self, index_path: str, vectorstore: FAISS):
+        """Record a vectorstore that was just written with save_local"""
+        version = index_version(index_path)
+        if version is None:
+            return
+        with self.lock:
+            self._put(index_path, version, vectorstore)
+
+    def _put(self, index_path: str, version, vectorstore: FAISS):
+        self.entries[index_path] = (version, vectorstore)
+        self.entries.move_to_end(index_path)
+        while len(self.entries) > self.max_indexes:
+            self.entries.popitem(last=False)
+
+    def stats(self) -> Dict[str, Any]:
+        lookups = self.hits + self.misses
+        return {"resident": list(self.entries.keys()),
+                "hits": self.hits,
+                "misses": self.misses,
+                "reloads": self.reloads,
+                "hit_rate": self.hits / lookups if lookups else 0.0,
+                "loads": self.loads,
+                "load_seconds_total": self.load_seconds,
+                "load_seconds_avg": self.load_seconds / self.loads if self.loads else 0.0}
+
+
+def normalize_query(text: str) -> str:
+    """Lowercase, collapse whitespace and drop surrounding punctuation, so near-identical questions share an entry"""
+    return re.sub(r"\s+", " ", text.lower()).strip(" \t\n?!.,;:'\"")
+
+
+class QueryCache:
+    """Retrieved contexts by (index_path, normalised query), valid for one index version.
+
+    A result is only returned while the index it was computed from still has
+    the same version, so an update saved by any worker invalidates it; entries
+    also expire after ttl seconds and are evicted in LRU order."""
+
+    def __init__(self, max_entries: int = 1024, ttl: float = 3600):
+        self.max_entries = max_entries
+        self.ttl = ttl
+        self.entries: "OrderedDict[Tuple[str, str], Tuple[Any, float, Any]]" = OrderedDict()
+        self.lock = threading.Lock()
+        self.hits = 0
+        self.misses = 0
+        self.stale = 0
+
+    def get(self, index_path: str, query: str, version) -> Optional[Any]:
+        key = (index_path, normalize_query(query))
+        with self.lock:
+            entry = self.entries.get(key)
+            if entry is not None:
+                entry_version, stored_at, value = entry
+                if entry_version == version and time.monotonic() - stored_at < self.ttl:
+                    self.entries.move_to_end(key)
+                    self.hits += 1
+                    return value
+                del self.entries[key]
+                self.stale += 1
+            self.misses += 1
+            return None
+
+    def put(self, index_path: str, query: str, version, value: Any):
+        key = (index_path, normalize_query(query))
+        with self.lock:
+            self.entries[key] = (version, time.monotonic(), value)
+            self.entries.move_to_end(key)
+            while len(self.entries) > self.max_entries:
+                self.entries.popitem(last=False)
+
+    def invalidate(self, index_path: str):
+        with self.lock:
+            for key in [key for key in self.entries if key[0] == index_path]:
+                del self.entries[key]
+
+    def stats(self) -> Dict[str, Any]:
+        lookups = self.hits + self.misses
+        return {"entries": len(self.entries),
+                "max_entries": self.max_entries,
+                "ttl": self.ttl,
+                "hits": self.hits,
+                "misses": self.misses,
+                "stale": self.stale,
+                "hit_rate": self.hits / lookups if lookups else 0.0}
+
+
+class SQLiteByteStore(ByteStore):
+    """Key/value bytes in SQLite (WAL), safe to share between API workers"""
+
+    def __init__(self, db_path):
+        self.db_path = str(db_path)
+        self.local = threading.local()
+        self.hits = 0
+        self.misses = 0
+        os.makedirs(os.path.dirname(self.db_path) or ".", exist_ok=True)
+        self._connect().execute("CREATE TABLE IF NOT EXISTS kv (key TEXT PRIMARY KEY, value BLOB)")
+
+    def _connect(self) -> sqlite3.Connection:
+        conn = getattr(self.local, "conn", None)
+        if conn is None:
+            conn = sqlite3.connect(self.db_path, timeout=30, isolation_level=None, check_same_thread=False)
+            conn.execute("PRAGMA journal_mode=WAL")
+            conn.execute("PRAGMA synchronous=NORMAL")
+            self.local.conn = conn
+        return conn
+
+    def mget(self, keys: Sequence[str]) -> List[Optional[bytes]]:
+        found = {}
+        conn = self._connect()
+        # Stay below SQLite's bound-parameter limit
+        for i in range(0, len(keys), 500):
+            batch = list(keys[i:i + 500])
+            placeholders = ",".join("?" * len(batch))
+            found.update(conn.execute(f"SELECT key, value FROM kv WHERE key IN ({placeholders})", batch).fetchall())
+        values = [found.get(key) for key in keys]
+        hits = sum(value is not None for value in values)
+        self.hits += hits
+        self.misses += len(values) - hits
+        return values
+
+    def mset(self, key_value_pairs: Sequence[Tuple[str, bytes]]) -> None:
+        conn = self._connect()
+        with conn:
+            conn.execute("BEGIN")
+            conn.executemany("INSERT OR REPLACE INTO kv (key, value) VALUES (?, ?)", list(key_value_pairs))
+
+    def mdelete(self, keys: Sequence[str]) -> None:
+        conn = self._connect()
+        with conn:
+            conn.execute("BEGIN")
+            conn.executemany("DELETE FROM kv WHERE key = ?", [(key,) for key in keys])
+
+    def yield_keys(self, prefix: Optional[str] = None) -> Iterator[str]:
+        query, params = "SELECT key FROM kv", ()
+        if prefix:
+            query, params = "SELECT key FROM kv WHERE key >= ? AND key < ?", (prefix, prefix + "\uffff")
+        for (key,) in self._connect().execute(query, params):
+            yield key
+
+    def stats(self) -> Dict[str, Any]:
+        lookups = self.hits + self.misses
+        return {"hits": self.hits, "misses": self.misses, "hit_rate": self.hits / lookups if lookups else 0.0}
+
+
+def cached_embeddings(underlying, store: ByteStore, batch_size: int = 256) -> CacheBackedEmbeddings:
+    """Embeddings whose document vectors are cached by content hash.
+
+    Texts seen before (from any URL, worker or earlier run) are read from the
+    store; only misses reach the provider, in batches of batch_size."""
+    namespace = getattr(underlying, "model", type(underlying).__name__)
+    return CacheBackedEmbeddings.from_bytes_store(underlying, store, namespace=namespace, batch_size=batch_size)